@@ -1,27 +1,72 @@
 """Точка входа в приложение."""
 from __future__ import annotations
 
+# первым: от импорта startup отсчитывается время запуска
+import startup
+
+import sqlite3
 import sys
 import tkinter as tk
 from tkinter import messagebox, ttk
 from typing import Callable, Dict, Optional
 
+import instrumentation
 import models
-from db import apply_migrations, close_pool
+import offline_store
+from db import apply_migrations, close_pool, init_pool
+from review_journal import close_journal, get_journal
+from views.background import LoadingIndicator, get_runner, shutdown_runner
+from views.debug_window import runtime_stats
 from views.main_window import MainWindow
 
+startup.mark("imports")
+
+
+def prepare_backend() -> Optional[Exception]:
+    """Открывает пул и применяет миграции; выполняется в фоне при показанном окне входа.
+
+    Без сервера в автономном режиме возвращает ошибку вместо исключения:
+    сессии повторения работают по локальным копиям.
+    """
+    error: Optional[Exception] = None
+    try:
+        init_pool()
+        startup.mark("pool_ready")
+        apply_migrations()
+        models.ensure_review_partitions()
+        models.prune_sync_deletions()
+        startup.mark("migrations")
+    except Exception as exc:
+        if not offline_store.OFFLINE_MODE:
+            raise
+        error = exc
+    # отправляет оценки, оставшиеся в журнале после прошлого запуска
+    get_journal()
+    return error
+
 
 class LoginFrame(ttk.Frame):
-    def __init__(self, master: tk.Misc, on_login: Callable[[Dict[str, str]], None]):
+    def __init__(self, master: tk.Misc, on_login: Callable[[Dict[str, str]], None], ready: bool = True):
         super().__init__(master)
         self.on_login = on_login
         self.email_var = tk.StringVar()
+        self.loading_var = tk.StringVar(value="")
         self.users_list: list[Dict[str, str]] = []
 
         self.configure(style="App.TFrame", padding=30)
         self.columnconfigure(0, weight=1)
 
         self._build_ui()
+        self.loading = LoadingIndicator(self, self.loading_var)
+        self.connecting = LoadingIndicator(self, self.loading_var, "Подключение к БД...")
+        if ready:
+            self.refresh_users()
+        else:
+            # вход и список пользователей доступны после проверки миграций
+            self.login_button.state(["disabled"])
+
+    def on_backend_ready(self) -> None:
+        self.login_button.state(["!disabled"])
         self.refresh_users()
 
     def _build_ui(self) -> None:
@@ -59,30 +104,63 @@ class LoginFrame(ttk.Frame):
             command=self.refresh_users,
             style="Secondary.TButton",
         ).pack(side=tk.LEFT, padx=5)
-        ttk.Button(buttons, text="Войти", command=self.login, style="Accent.TButton").pack(
-            side=tk.RIGHT, padx=5
-        )
+        self.login_button = ttk.Button(buttons, text="Войти", command=self.login, style="Accent.TButton")
+        self.login_button.pack(side=tk.RIGHT, padx=5)
+        ttk.Label(buttons, textvariable=self.loading_var, style="Subtitle.TLabel").pack(side=tk.RIGHT, padx=10)
 
     def refresh_users(self) -> None:
-        try:
-            self.users_list = models.list_users()
-        except Exception as exc:
-            messagebox.showerror("Ошибка", f"Не удалось загрузить пользователей: {exc}")
-            self.users_list = []
+        get_runner().submit(
+            self,
+            models.list_users,
+            on_done=self._on_users_loaded,
+            on_error=self._on_users_error,
+            key="users",
+            indicator=self.loading,
+        )
+
+    def _on_users_loaded(self, users: list[Dict[str, str]]) -> None:
+        startup.mark("first_query")
+        self._show_users(users)
+
+    def _on_users_error(self, exc: Exception) -> None:
+        if offline_store.OFFLINE_MODE:
+            # сервер недоступен: вход по локальным копиям
+            self._show_users(offline_store.local_users())
+            return
+        messagebox.showerror("Ошибка", f"Не удалось загрузить пользователей: {exc}")
+        self._show_users([])
+
+    def _show_users(self, users: list[Dict[str, str]]) -> None:
+        self.users_list = users
         self.user_combo["values"] = [user["email"] for user in self.users_list]
+        startup.finish()
 
     def _on_user_selected(self, _event: tk.Event) -> None:
         selection = self.user_combo.get()
         self.email_var.set(selection)
 
     def login(self) -> None:
+        if self.login_button.instate(["disabled"]):
+            return
         email = self.email_var.get().strip()
         if not email:
             messagebox.showerror("Ошибка", "Введите email")
             return
-        try:
-            user = models.get_or_create_user(email)
-        except Exception as exc:
+        self.login_button.state(["disabled"])
+        get_runner().submit(
+            self,
+            models.get_or_create_user,
+            email,
+            on_done=self.on_login,
+            on_error=lambda exc: self._on_login_error(email, exc),
+            key="login",
+            indicator=self.loading,
+        )
+
+    def _on_login_error(self, email: str, exc: Exception) -> None:
+        user = offline_store.find_local_user(email) if offline_store.OFFLINE_MODE else None
+        if user is None:
+            self.login_button.state(["!disabled"])
             messagebox.showerror("Ошибка", f"Не удалось войти: {exc}")
             return
         self.on_login(user)
@@ -101,8 +179,30 @@ class Application(tk.Tk):
 
         self.login_frame: Optional[LoginFrame] = None
         self.main_window: Optional[MainWindow] = None
+        self.backend_ready = False
+        self.exit_code = 0
 
         self.show_login()
+        startup.mark("window")
+        self.after_idle(lambda: startup.mark("first_paint"))
+        get_runner().submit(
+            self,
+            prepare_backend,
+            on_done=self._on_backend_ready,
+            on_error=self._on_backend_error,
+            key="backend",
+            indicator=self.login_frame.connecting if self.login_frame else None,
+        )
+
+    def _on_backend_ready(self, _error: Optional[Exception]) -> None:
+        self.backend_ready = True
+        if self.login_frame:
+            self.login_frame.on_backend_ready()
+
+    def _on_backend_error(self, exc: Exception) -> None:
+        messagebox.showerror("Ошибка", f"Не удалось применить миграции: {exc}")
+        self.exit_code = 1
+        self.destroy()
 
     def _configure_style(self) -> None:
         style = ttk.Style(self)
@@ -250,35 +350,43 @@ class Application(tk.Tk):
         if self.main_window:
             self.main_window.destroy()
             self.main_window = None
-        self.login_frame = LoginFrame(self, self.on_login_success)
+        self.login_frame = LoginFrame(self, self.on_login_success, ready=self.backend_ready)
         self.login_frame.pack(fill="both", expand=True)
 
     def on_login_success(self, user: Dict[str, str]) -> None:
         if self.login_frame:
             self.login_frame.destroy()
             self.login_frame = None
+        try:
+            offline_store.open_store(user)
+        except (OSError, sqlite3.Error) as exc:
+            messagebox.showwarning("Автономный режим", f"Не удалось открыть локальную копию: {exc}")
         self.main_window = MainWindow(self, user)
         self.main_window.pack(fill="both", expand=True)
 
     def on_close(self) -> None:
         if messagebox.askokcancel("Выход", "Закрыть приложение?"):
+            shutdown_runner()
+            offline_store.close_store()
+            close_journal()
             close_pool()
             self.destroy()
 
 
 def main() -> None:
-    try:
-        apply_migrations()
-    except Exception as exc:
-        root = tk.Tk()
-        root.withdraw()
-        messagebox.showerror("Ошибка", f"Не удалось применить миграции: {exc}")
-        root.destroy()
-        sys.exit(1)
+    instrumentation.configure_slow_log()
+    # kill -USR1 <pid> сохраняет сводку по запросам в DB_STATS_DUMP
+    instrumentation.install_signal_handler(runtime_stats)
 
+    # пул и миграции готовятся в фоне, пока показано окно входа
     app = Application()
     app.mainloop()
+    shutdown_runner()
+    offline_store.close_store()
+    close_journal()
     close_pool()
+    if app.exit_code:
+        sys.exit(app.exit_code)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,91 @@
+"""Асинхронный пул соединений PostgreSQL (asyncpg) для фоновых задач и сервисов."""
+from __future__ import annotations
+
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict
+
+import asyncpg
+
+from db import DB_HOST, DB_NAME, DB_PASSWORD, DB_PORT, DB_POOL_TIMEOUT, DB_USER, PoolTimeoutError
+from prepared import PREPARED_STATEMENTS
+
+DB_ASYNC_POOL_MIN = int(os.getenv("DB_ASYNC_POOL_MIN", "2"))
+DB_ASYNC_POOL_MAX = int(os.getenv("DB_ASYNC_POOL_MAX", "20"))
+
+_pool: asyncpg.Pool | None = None
+_pool_loop: asyncio.AbstractEventLoop | None = None
+_pool_lock: asyncio.Lock | None = None
+
+
+async def _init_connection(conn: asyncpg.Connection) -> None:
+    # uuid как строки, как в psycopg2: результаты совпадают с models
+    await conn.set_type_codec("uuid", encoder=str, decoder=str, schema="pg_catalog", format="text")
+
+
+async def init_pool(min_size: int | None = None, max_size: int | None = None) -> asyncpg.Pool:
+    """Создаёт пул при первом обращении в текущем цикле событий.
+
+    asyncpg сам готовит запросы на сервере и кэширует их по соединению;
+    DB_PREPARED_STATEMENTS=0 отключает этот кэш, как и реестр prepared.
+    """
+    global _pool, _pool_loop, _pool_lock
+    loop = asyncio.get_running_loop()
+    if _pool_loop is not loop:
+        # пул привязан к циклу событий; старый цикл уже завершён
+        _pool, _pool_loop, _pool_lock = None, loop, asyncio.Lock()
+    async with _pool_lock:
+        if _pool is None:
+            _pool = await asyncpg.create_pool(
+                host=DB_HOST,
+                port=DB_PORT,
+                database=DB_NAME,
+                user=DB_USER,
+                password=DB_PASSWORD,
+                min_size=DB_ASYNC_POOL_MIN if min_size is None else min_size,
+                max_size=DB_ASYNC_POOL_MAX if max_size is None else max_size,
+                statement_cache_size=100 if PREPARED_STATEMENTS else 0,
+                init=_init_connection,
+            )
+    return _pool
+
+
+@asynccontextmanager
+async def get_connection(timeout: float | None = None) -> AsyncIterator[asyncpg.Connection]:
+    """Предоставляет соединение из пула; ожидание не блокирует цикл событий."""
+    pool = await init_pool()
+    timeout = DB_POOL_TIMEOUT if timeout is None else timeout
+    try:
+        conn = await pool.acquire(timeout=timeout)
+    except asyncio.TimeoutError:
+        raise PoolTimeoutError(
+            f"Нет свободного соединения за {timeout:.1f} с (максимум {pool.get_max_size()})"
+        ) from None
+    try:
+        yield conn
+    finally:
+        await pool.release(conn)
+
+
+def pool_stats() -> Dict[str, Any]:
+    """Показатели пула (пустой словарь, если пул ещё не создан)."""
+    if _pool is None:
+        return {}
+    size = _pool.get_size()
+    idle = _pool.get_idle_size()
+    return {
+        "size": size,
+        "in_use": size - idle,
+        "idle": idle,
+        "min": _pool.get_min_size(),
+        "max": _pool.get_max_size(),
+    }
+
+
+async def close_pool() -> None:
+    """Закрывает пул; вызывается до завершения цикла событий."""
+    global _pool
+    if _pool is not None:
+        pool, _pool = _pool, None
+        await pool.close()
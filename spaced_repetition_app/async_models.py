@@ -0,0 +1,119 @@
+"""Асинхронные версии функций models для пакетных задач и сервисов (asyncpg).
+
+Запросы и результаты те же, что у models: тексты SQL берутся из models и
+реестра prepared и переводятся в форму с $1..$n. Кэш запросов models здесь
+не используется, но записи сбрасывают его для пользователя, чтобы синхронный
+код того же процесса не видел устаревших данных.
+"""
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Any, Dict, Iterable, List
+
+import models
+import prepared
+import scheduler
+from async_db import get_connection
+
+
+def _server_sql(query: str) -> str:
+    return prepared.to_server_sql(query)[0]
+
+
+def _statement(name: str) -> str:
+    return prepared.registry.get(name).server_sql
+
+
+async def _fetch(query: str, *args: Any) -> List[Dict[str, Any]]:
+    async with get_connection() as conn:
+        return [dict(row) for row in await conn.fetch(query, *args)]
+
+
+async def get_or_create_user(email: str) -> Dict[str, Any]:
+    email = email.strip().lower()
+    if not email:
+        raise ValueError("Email не может быть пустым")
+    async with get_connection() as conn:
+        row = await conn.fetchrow(
+            "INSERT INTO users(email) VALUES ($1) ON CONFLICT(email) DO UPDATE SET email = EXCLUDED.email RETURNING *",
+            email,
+        )
+    models.invalidate_users()
+    return dict(row)
+
+
+async def list_decks(user_id: str) -> List[Dict[str, Any]]:
+    return await _fetch(_statement("list_decks"), user_id)
+
+
+async def list_notes(
+    user_id: str,
+    deck_id: str | None = None,
+    tags: Iterable[str] | None = None,
+    search: str | None = None,
+    highlight: bool = False,
+) -> List[Dict[str, Any]]:
+    """Заметки по фильтрам, как models.list_notes()."""
+    query, params = models._list_notes_query(user_id, deck_id, tags, search, highlight)
+    return await _fetch(_server_sql(query), *params)
+
+
+async def get_due_queue(user_id: str, deck_id: str | None = None, limit: int = 50) -> List[Dict[str, Any]]:
+    return await _fetch(_statement("due_session"), *scheduler.session_params(user_id, deck_id, limit))
+
+
+async def record_review(user_id: str, card_id: str, quality: int) -> None:
+    async with get_connection() as conn:
+        await conn.execute(_statement("record_review"), user_id, card_id, quality)
+    models.invalidate_user(user_id)
+
+
+async def record_reviews_bulk(user_id: str, reviews: Iterable[Dict[str, Any]]) -> int:
+    """Записывает много оценок одним вызовом apply_sm2_batch(), как models.record_reviews_bulk()."""
+    items = list(reviews)
+    if not items:
+        return 0
+    async with get_connection() as conn:
+        applied = await conn.fetchval(
+            "SELECT apply_sm2_batch($1::uuid, $2::uuid[], $3::smallint[], $4::timestamptz[], $5::uuid[])",
+            user_id,
+            [review["card_id"] for review in items],
+            [review["quality"] for review in items],
+            [_timestamp(review.get("reviewed_at")) for review in items],
+            [review.get("review_id") for review in items],
+        )
+    models.invalidate_user(user_id)
+    return int(applied)
+
+
+async def suspend_card(user_id: str, card_id: str, suspended: bool = True) -> None:
+    async with get_connection() as conn:
+        await conn.execute(
+            "UPDATE card_state SET suspended = $1 WHERE card_id = $2 AND user_id = $3",
+            suspended,
+            card_id,
+            user_id,
+        )
+    models.invalidate_user(user_id)
+
+
+async def get_summary_counts(user_id: str) -> Dict[str, Any]:
+    async with get_connection() as conn:
+        summary = dict(await conn.fetchrow(_statement("summary_cards"), user_id))
+        summary.update(dict(await conn.fetchrow(_statement("summary_reviews"), user_id)))
+    return summary
+
+
+async def get_daily_stats(user_id: str, days: int = 30) -> List[Dict[str, Any]]:
+    return await _fetch(_server_sql(models._DAILY_STATS_SQL), days, user_id)
+
+
+async def get_deck_progress(user_id: str) -> List[Dict[str, Any]]:
+    return await _fetch(_server_sql(models._DECK_PROGRESS_SQL), user_id)
+
+
+def _timestamp(value: Any) -> datetime | None:
+    # asyncpg принимает только datetime; журнал хранит время строкой ISO
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return value
@@ -0,0 +1,212 @@
+"""Сравнение синхронного (models, потоки) и асинхронного (async_models) доступа под нагрузкой.
+
+Запуск из каталога spaced_repetition_app (нужна рабочая БД из .env и данные
+generate_dataset.py):
+
+    python benchmarks/generate_dataset.py --users 4 --notes 20000
+    python benchmarks/bench_async.py --users 4 --sessions 200 --ops 20 --pool 20
+
+Каждая из --sessions сессий выполняет --ops операций вперемешку (очередь
+повторения, счётчики, колоды, поиск заметок и, без --skip-writes, запись
+оценок) от имени одного из --users пользователей. Синхронный вариант
+запускает сессии в отдельных потоках поверх пула db, асинхронный — корутинами
+в одном цикле событий поверх пула async_db; размер обоих пулов — --pool.
+Последовательность операций задаётся --seed и одинакова для обоих вариантов.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# измеряется работа БД, а не попадания в кэш
+os.environ.setdefault("QUERY_CACHE", "0")
+
+import async_db  # noqa: E402
+import async_models  # noqa: E402
+import models  # noqa: E402
+from db import close_pool, get_connection, init_pool  # noqa: E402
+from generate_dataset import user_email  # noqa: E402
+
+# операция и её доля в смеси
+MIX: Tuple[Tuple[str, int], ...] = (
+    ("get_due_queue", 35),
+    ("get_summary_counts", 20),
+    ("list_decks", 15),
+    ("list_notes", 10),
+    ("record_review", 20),
+)
+
+
+@dataclass
+class UserData:
+    user_id: str
+    deck_id: str
+    card_ids: List[str]
+
+
+Op = Tuple[str, UserData, Tuple[Any, ...]]
+
+
+def _load_users(prefix: str, count: int, sample: int) -> List[UserData]:
+    users: List[UserData] = []
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            for index in range(count):
+                email = user_email(prefix, index)
+                cur.execute("SELECT id FROM users WHERE email = %s", (email,))
+                row = cur.fetchone()
+                if row is None:
+                    raise SystemExit(f"Пользователь {email} не найден; сначала запустите generate_dataset.py")
+                user_id = str(row[0])
+                cur.execute("SELECT id FROM decks WHERE user_id = %s ORDER BY created_at LIMIT 1", (user_id,))
+                deck_id = str(cur.fetchone()[0])
+                cur.execute("SELECT id FROM cards WHERE user_id = %s ORDER BY id LIMIT %s", (user_id, sample))
+                users.append(UserData(user_id, deck_id, [str(card_id) for (card_id,) in cur.fetchall()]))
+    return users
+
+
+def _plan(users: List[UserData], sessions: int, ops: int, seed: int, writes: bool) -> List[List[Op]]:
+    """Заранее выбранные операции каждой сессии, общие для обоих вариантов."""
+    rng = random.Random(seed)
+    mix = [(name, weight) for name, weight in MIX if writes or name != "record_review"]
+    names = [name for name, _ in mix]
+    weights = [weight for _, weight in mix]
+    plan: List[List[Op]] = []
+    for session in range(sessions):
+        user = users[session % len(users)]
+        session_ops: List[Op] = []
+        for name in rng.choices(names, weights, k=ops):
+            if name == "get_due_queue":
+                args: Tuple[Any, ...] = (user.user_id, None, 50)
+            elif name == "list_notes":
+                args = (user.user_id, user.deck_id, None, "кошка")
+            elif name == "record_review":
+                args = (user.user_id, rng.choice(user.card_ids), rng.randint(0, 5))
+            else:
+                args = (user.user_id,)
+            session_ops.append((name, user, args))
+        plan.append(session_ops)
+    return plan
+
+
+def run_sync(plan: List[List[Op]], pool_size: int) -> Tuple[float, Dict[str, List[float]]]:
+    init_pool(pool_size, pool_size)
+    latencies: Dict[str, List[float]] = {name: [] for name, _ in MIX}
+
+    def session(ops: List[Op]) -> None:
+        for name, _user, args in ops:
+            started = time.perf_counter()
+            getattr(models, name)(*args)
+            latencies[name].append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(plan)) as executor:
+        for future in [executor.submit(session, ops) for ops in plan]:
+            future.result()
+    return time.perf_counter() - started, latencies
+
+
+async def run_async(plan: List[List[Op]], pool_size: int) -> Tuple[float, Dict[str, List[float]]]:
+    await async_db.init_pool(min_size=pool_size, max_size=pool_size)
+    latencies: Dict[str, List[float]] = {name: [] for name, _ in MIX}
+
+    async def session(ops: List[Op]) -> None:
+        for name, _user, args in ops:
+            started = time.perf_counter()
+            await getattr(async_models, name)(*args)
+            latencies[name].append((time.perf_counter() - started) * 1000)
+
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*(session(ops) for ops in plan))
+        return time.perf_counter() - started, latencies
+    finally:
+        await async_db.close_pool()
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def _summary(elapsed: float, latencies: Dict[str, List[float]]) -> Dict[str, Any]:
+    total = sum(len(values) for values in latencies.values())
+    every = [value for values in latencies.values() for value in values]
+    return {
+        "elapsed_s": elapsed,
+        "ops": total,
+        "ops_per_s": total / elapsed if elapsed else 0.0,
+        "p50_ms": statistics.median(every),
+        "p95_ms": _percentile(every, 0.95),
+        "p99_ms": _percentile(every, 0.99),
+        "by_op": {
+            name: {
+                "count": len(values),
+                "median_ms": statistics.median(values),
+                "p95_ms": _percentile(values, 0.95),
+            }
+            for name, values in latencies.items()
+            if values
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--prefix", default="bench", help="префикс пользователей generate_dataset.py")
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--sessions", type=int, default=200, help="одновременных сессий")
+    parser.add_argument("--ops", type=int, default=20, help="операций на сессию")
+    parser.add_argument("--pool", type=int, default=20, help="размер пула соединений")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--sample", type=int, default=1000, help="карточек пользователя для записи оценок")
+    parser.add_argument("--skip-writes", action="store_true", help="не записывать оценки")
+    parser.add_argument("--out", type=Path, help="файл JSON с результатами")
+    args = parser.parse_args()
+    if min(args.users, args.sessions, args.ops, args.pool) < 1:
+        parser.error("--users, --sessions, --ops и --pool должны быть положительными")
+
+    try:
+        users = _load_users(args.prefix, args.users, args.sample)
+        # пул пересоздаётся с тем же числом соединений, что и у асинхронного варианта
+        close_pool()
+        plan = _plan(users, args.sessions, args.ops, args.seed, not args.skip_writes)
+        results = {"sync": _summary(*run_sync(plan, args.pool))}
+    finally:
+        close_pool()
+    results["async"] = _summary(*asyncio.run(run_async(plan, args.pool)))
+
+    print(f"{'вариант':<8} {'время, с':>9} {'оп/с':>8} {'p50, мс':>9} {'p95, мс':>9} {'p99, мс':>9}")
+    for name, result in results.items():
+        print(
+            f"{name:<8} {result['elapsed_s']:>9.2f} {result['ops_per_s']:>8.0f} "
+            f"{result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} {result['p99_ms']:>9.2f}"
+        )
+    print(f"\n{'операция':<20} {'sync, мс':>9} {'async, мс':>10}")
+    for name, _ in MIX:
+        sync_op = results["sync"]["by_op"].get(name)
+        async_op = results["async"]["by_op"].get(name)
+        if sync_op and async_op:
+            print(f"{name:<20} {sync_op['median_ms']:>9.2f} {async_op['median_ms']:>10.2f}")
+
+    if args.out:
+        report = {"params": {key: str(value) for key, value in vars(args).items()}, "results": results}
+        args.out.parent.mkdir(parents=True, exist_ok=True)
+        args.out.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"результаты: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Сравнение обычных запросов и подготовленных запросов реестра prepared.
+
+Запуск из каталога spaced_repetition_app (нужна рабочая БД из .env):
+
+    python benchmarks/bench_prepared.py --email user@example.com --calls 2000
+
+Для каждого читающего запроса реестра измеряется среднее время вызова с
+полным текстом SQL и через EXECUTE, а также время планирования, которое
+сервер тратит на обычный запрос (EXPLAIN (SUMMARY)).
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Sequence, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import models  # noqa: E402
+import prepared  # noqa: E402
+import scheduler  # noqa: E402
+from db import close_pool, get_connection  # noqa: E402
+
+# читающие запросы реестра и их параметры; записи (record_review) не измеряются
+_QUERIES: Tuple[Tuple[str, Callable[[str], Sequence[Any]]], ...] = (
+    ("list_decks", lambda user_id: (user_id,)),
+    ("summary_cards", lambda user_id: (user_id,)),
+    ("summary_reviews", lambda user_id: (user_id,)),
+    ("due_session", lambda user_id: scheduler.session_params(user_id)),
+)
+
+
+def _timed(calls: int, action: Callable[[], None]) -> float:
+    started = time.perf_counter()
+    for _ in range(calls):
+        action()
+    return (time.perf_counter() - started) / calls
+
+
+def _planning_ms(cur: Any, sql: str, params: Sequence[Any]) -> float:
+    cur.execute("EXPLAIN (SUMMARY, FORMAT JSON) " + sql, params)
+    plan = cur.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return float(plan[0]["Planning Time"])
+
+
+def run(email: str, calls: int) -> None:
+    user_id = models.get_or_create_user(email)["id"]
+    print(f"{'запрос':<16} {'SQL, мкс':>10} {'EXECUTE, мкс':>13} {'экономия':>9} {'план, мкс':>10}")
+    with get_connection() as conn:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            for name, make_params in _QUERIES:
+                statement = prepared.registry.get(name)
+                params = make_params(user_id)
+
+                def plain() -> None:
+                    cur.execute(statement.sql, params)
+                    cur.fetchall()
+
+                def by_name() -> None:
+                    prepared.execute(cur, name, params)
+                    cur.fetchall()
+
+                by_name()  # PREPARE на этом соединении
+                plain_time = _timed(calls, plain)
+                prepared_time = _timed(calls, by_name)
+                planning = _planning_ms(cur, statement.sql, params)
+                print(
+                    f"{name:<16} {plain_time * 1e6:>10.0f} {prepared_time * 1e6:>13.0f} "
+                    f"{(plain_time - prepared_time) * 1e6:>8.0f} {planning * 1e3:>10.0f}"
+                )
+    stats: Dict[str, Any] = prepared.registry.stats()
+    print(f"реестр: {stats}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--email", required=True, help="пользователь, чьи данные читаются")
+    parser.add_argument("--calls", type=int, default=2000)
+    args = parser.parse_args()
+    try:
+        run(args.email, args.calls)
+    finally:
+        close_pool()
+
+
+if __name__ == "__main__":
+    main()
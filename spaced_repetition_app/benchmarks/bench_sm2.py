@@ -0,0 +1,93 @@
+"""Сравнение пропускной способности sm2() и sm2_batch().
+
+Запуск из каталога spaced_repetition_app:
+
+    python benchmarks/bench_sm2.py --sizes 10000 1000000 10000000
+
+Скалярная версия на больших объёмах измеряется на выборке из --scalar-limit
+карточек, результат экстраполируется (помечен знаком «~»).
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sm2 import CardState, CardStateBatch, sm2, sm2_batch  # noqa: E402
+
+
+def _random_batch(rng: np.random.Generator, size: int) -> tuple[CardStateBatch, np.ndarray]:
+    batch = CardStateBatch(
+        ease_factor=np.round(rng.uniform(1.3, 3.0, size), 2),
+        interval_days=rng.integers(0, 365, size),
+        reps=rng.integers(0, 12, size),
+        lapses=rng.integers(0, 5, size),
+    )
+    return batch, rng.integers(0, 6, size)
+
+
+def _check_identical(batch: CardStateBatch, quality: np.ndarray, now: datetime, sample: int) -> None:
+    head = CardStateBatch(
+        ease_factor=batch.ease_factor[:sample],
+        interval_days=batch.interval_days[:sample],
+        reps=batch.reps[:sample],
+        lapses=batch.lapses[:sample],
+    )
+    vector_states = sm2_batch(head, quality[:sample], now)[0].to_states()
+    for state, q, expected in zip(head.to_states(), quality[:sample].tolist(), vector_states):
+        actual, _ = sm2(state, q, now)
+        if actual != expected:
+            raise AssertionError(f"Расхождение: {actual} != {expected}")
+
+
+def run(sizes: list[int], scalar_limit: int, seed: int) -> None:
+    rng = np.random.default_rng(seed)
+    now = datetime(2024, 1, 1, 12, 0, 0)
+    print(f"{'карточек':>12} {'scalar, карт/с':>18} {'batch, карт/с':>18} {'ускорение':>10}")
+    for size in sizes:
+        batch, quality = _random_batch(rng, size)
+        _check_identical(batch, quality, now, min(size, 10_000))
+
+        scalar_size = min(size, scalar_limit)
+        states = [
+            CardState(ease_factor=e, interval_days=i, reps=r, lapses=l)
+            for e, i, r, l in zip(
+                batch.ease_factor[:scalar_size].tolist(),
+                batch.interval_days[:scalar_size].tolist(),
+                batch.reps[:scalar_size].tolist(),
+                batch.lapses[:scalar_size].tolist(),
+            )
+        ]
+        qualities = quality[:scalar_size].tolist()
+        started = time.perf_counter()
+        for state, q in zip(states, qualities):
+            sm2(state, q, now)
+        scalar_rate = scalar_size / (time.perf_counter() - started)
+
+        started = time.perf_counter()
+        sm2_batch(batch, quality, now)
+        batch_rate = size / (time.perf_counter() - started)
+
+        mark = "~" if scalar_size < size else " "
+        print(
+            f"{size:>12,} {mark}{scalar_rate:>17,.0f} {batch_rate:>18,.0f} {batch_rate / scalar_rate:>9.1f}x"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 1_000_000, 10_000_000])
+    parser.add_argument("--scalar-limit", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    run(args.sizes, args.scalar_limit, args.seed)
+
+
+if __name__ == "__main__":
+    main()
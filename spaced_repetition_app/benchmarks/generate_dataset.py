@@ -0,0 +1,366 @@
+"""Генератор синтетических данных для бенчмарков: пользователи, колоды, карточки и история ревью.
+
+Запуск из каталога spaced_repetition_app (нужна рабочая БД из .env):
+
+    python benchmarks/generate_dataset.py --users 4 --decks 5 --notes 50000 --reviews 12
+
+Создаются пользователи bench<N>@bench.local, у каждого --decks колод по
+--notes заметок с одной карточкой. История ревью каждой карточки
+моделируется по SM-2 (sm2_batch) за последние --days дней: оценки случайные,
+следующее повторение назначается по полученному интервалу с опозданием
+пользователя, поэтому состояния карточек и сроки показа согласованы с
+историей. Данные загружаются через COPY пачками по --chunk-size карточек,
+каждая пачка в своей транзакции; счётчики колод и дневная статистика
+обновляются триггерами. При одинаковых параметрах и --seed данные совпадают.
+"""
+from __future__ import annotations
+
+import argparse
+import io
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from db import apply_migrations, close_pool, get_connection  # noqa: E402
+from sm2 import CardStateBatch, sm2_batch  # noqa: E402
+
+EMAIL_DOMAIN = "bench.local"
+
+# распределение оценок 0..5, доля приостановленных карточек и среднее опоздание (дни)
+_QUALITY_WEIGHTS = np.array([0.04, 0.05, 0.09, 0.22, 0.35, 0.25])
+_SUSPENDED_SHARE = 0.02
+_MEAN_DELAY_DAYS = 1.5
+
+_WORDS = np.array(
+    (
+        "дом кошка собака вода огонь земля небо город дорога книга окно стол время день ночь "
+        "house cat dog water fire earth sky city road book window table time day night "
+        "learn speak write read listen remember forget question answer language word phrase"
+    ).split()
+)
+
+
+def user_email(prefix: str, index: int) -> str:
+    return f"{prefix}{index}@{EMAIL_DOMAIN}"
+
+
+@dataclass
+class _History:
+    """Результат моделирования: итоговые состояния карточек и их ревью."""
+
+    created_at: np.ndarray
+    state: CardStateBatch
+    due_at: np.ndarray
+    last_reviewed_at: np.ndarray
+    review_card: np.ndarray
+    review_quality: np.ndarray
+    review_interval: np.ndarray
+    review_ease: np.ndarray
+    review_at: np.ndarray
+
+
+def simulate(rng: np.random.Generator, count: int, now: datetime, days: int, mean_reviews: float) -> _History:
+    """Моделирует историю повторений count карточек, созданных за последние days дней."""
+    now64 = np.datetime64(now.replace(tzinfo=None), "s")
+    created_at = now64 - (rng.uniform(0, days, count) * 86400).astype("timedelta64[s]")
+    planned = rng.poisson(mean_reviews, count)
+
+    state = CardStateBatch.new(count)
+    due_at = created_at.copy()
+    last_reviewed_at = np.full(count, np.datetime64("NaT"), dtype="datetime64[s]")
+    next_at = created_at + (rng.uniform(0, 1, count) * 86400).astype("timedelta64[s]")
+
+    cards: List[np.ndarray] = []
+    qualities: List[np.ndarray] = []
+    intervals: List[np.ndarray] = []
+    eases: List[np.ndarray] = []
+    reviewed: List[np.ndarray] = []
+    for step in range(int(planned.max(initial=0))):
+        idx = np.nonzero((planned > step) & (next_at <= now64))[0]
+        if not idx.size:
+            break
+        quality = rng.choice(6, size=idx.size, p=_QUALITY_WEIGHTS)
+        current = CardStateBatch(
+            ease_factor=state.ease_factor[idx],
+            interval_days=state.interval_days[idx],
+            reps=state.reps[idx],
+            lapses=state.lapses[idx],
+        )
+        updated, interval = sm2_batch(current, quality, now)
+        # в БД ease_factor хранится как numeric(4,2)
+        ease = np.round(updated.ease_factor, 2)
+        state.ease_factor[idx] = ease
+        state.interval_days[idx] = interval
+        state.reps[idx] = updated.reps
+        state.lapses[idx] = updated.lapses
+
+        at = next_at[idx]
+        cards.append(idx)
+        qualities.append(quality)
+        intervals.append(interval)
+        eases.append(ease)
+        reviewed.append(at)
+
+        last_reviewed_at[idx] = at
+        due_at[idx] = at + interval.astype("timedelta64[D]")
+        delay = (rng.exponential(_MEAN_DELAY_DAYS, idx.size) * 86400).astype("timedelta64[s]")
+        next_at[idx] = due_at[idx] + delay
+
+    def joined(parts: List[np.ndarray], dtype: Any) -> np.ndarray:
+        return np.concatenate(parts) if parts else np.empty(0, dtype=dtype)
+
+    review_at = joined(reviewed, "datetime64[s]")
+    order = np.argsort(review_at, kind="stable")
+    return _History(
+        created_at=created_at,
+        state=state,
+        due_at=due_at,
+        last_reviewed_at=last_reviewed_at,
+        review_card=joined(cards, np.int64)[order],
+        review_quality=joined(qualities, np.int64)[order],
+        review_interval=joined(intervals, np.int32)[order],
+        review_ease=joined(eases, np.float64)[order],
+        review_at=review_at[order],
+    )
+
+
+def _uuids(rng: np.random.Generator, count: int) -> List[str]:
+    """UUID версии 4 из генератора rng, чтобы данные повторялись при том же seed."""
+    raw = rng.integers(0, 256, size=(count, 16), dtype=np.uint8)
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80
+    digits = raw.tobytes().hex()
+    result = []
+    for start in range(0, count * 32, 32):
+        h = digits[start:start + 32]
+        result.append(f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}")
+    return result
+
+
+def _timestamps(values: np.ndarray) -> List[str]:
+    text = np.datetime_as_string(values, unit="s")
+    return [r"\N" if value == "NaT" else value + "+00" for value in text.tolist()]
+
+
+def _phrases(rng: np.random.Generator, count: int, words: int) -> List[str]:
+    picked = _WORDS[rng.integers(0, _WORDS.size, size=(count, words))]
+    return [" ".join(row) for row in picked.tolist()]
+
+
+def _copy(cur: Any, table: str, columns: Sequence[str], rows: List[str]) -> None:
+    if not rows:
+        return
+    data = io.BytesIO(("\n".join(rows) + "\n").encode("utf-8"))
+    cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", data)
+
+
+def _create_users(cur: Any, prefix: str, count: int, replace: bool) -> List[str]:
+    emails = [user_email(prefix, index) for index in range(count)]
+    if replace:
+        cur.execute("DELETE FROM users WHERE email = ANY(%s)", (emails,))
+    else:
+        cur.execute("SELECT email FROM users WHERE email = ANY(%s) ORDER BY email", (emails,))
+        existing = [row[0] for row in cur.fetchall()]
+        if existing:
+            raise SystemExit(f"Пользователи уже существуют ({', '.join(existing)}); используйте --replace")
+    cur.execute(
+        "INSERT INTO users(email) SELECT unnest(%s::text[]) RETURNING id, email",
+        (emails,),
+    )
+    by_email = {email: str(user_id) for user_id, email in cur.fetchall()}
+    return [by_email[email] for email in emails]
+
+
+def _create_decks(cur: Any, user_id: str, count: int) -> List[str]:
+    deck_ids = []
+    for index in range(count):
+        cur.execute(
+            "INSERT INTO decks(user_id, name, description) VALUES (%s, %s, %s) RETURNING id",
+            (user_id, f"Колода {index + 1}", "Синтетические данные для бенчмарков"),
+        )
+        deck_ids.append(str(cur.fetchone()[0]))
+    return deck_ids
+
+
+def _ensure_tags(cur: Any, prefix: str, count: int) -> List[str]:
+    names = [f"{prefix}-тег-{index}" for index in range(count)]
+    if not names:
+        return []
+    cur.execute("SELECT tag_name, tag_id FROM ensure_tags(%s)", (names,))
+    by_name = {name: str(tag_id) for name, tag_id in cur.fetchall()}
+    return [by_name[name] for name in names]
+
+
+def _load_chunk(
+    cur: Any,
+    rng: np.random.Generator,
+    user_id: str,
+    deck_id: str,
+    tag_ids: List[str],
+    count: int,
+    args: argparse.Namespace,
+    now: datetime,
+) -> Dict[str, int]:
+    history = simulate(rng, count, now, args.days, args.reviews)
+    note_ids = _uuids(rng, count)
+    card_ids = _uuids(rng, count)
+    created = _timestamps(history.created_at)
+    fronts = _phrases(rng, count, 3)
+    backs = _phrases(rng, count, 6)
+
+    _copy(
+        cur,
+        "notes",
+        ("id", "user_id", "deck_id", "front", "back", "created_at", "updated_at"),
+        [
+            f"{note_id}\t{user_id}\t{deck_id}\t{front}\t{back}\t{at}\t{at}"
+            for note_id, front, back, at in zip(note_ids, fronts, backs, created)
+        ],
+    )
+    _copy(
+        cur,
+        "cards",
+        ("id", "user_id", "deck_id", "note_id", "created_at"),
+        [
+            f"{card_id}\t{user_id}\t{deck_id}\t{note_id}\t{at}"
+            for card_id, note_id, at in zip(card_ids, note_ids, created)
+        ],
+    )
+
+    state = history.state
+    suspended = rng.random(count) < _SUSPENDED_SHARE
+    _copy(
+        cur,
+        "card_state",
+        (
+            "card_id", "user_id", "deck_id", "ease_factor", "interval_days",
+            "reps", "lapses", "due_at", "last_reviewed_at", "suspended",
+        ),
+        [
+            f"{card_id}\t{user_id}\t{deck_id}\t{ease:.2f}\t{interval}\t{reps}\t{lapses}\t{due}\t{last}\t{'t' if off else 'f'}"
+            for card_id, ease, interval, reps, lapses, due, last, off in zip(
+                card_ids,
+                state.ease_factor.tolist(),
+                state.interval_days.tolist(),
+                state.reps.tolist(),
+                state.lapses.tolist(),
+                _timestamps(history.due_at),
+                _timestamps(history.last_reviewed_at),
+                suspended.tolist(),
+            )
+        ],
+    )
+
+    note_tags: List[str] = []
+    if tag_ids:
+        per_note = rng.integers(0, min(args.tags_per_note, len(tag_ids)) + 1, count)
+        picked = rng.integers(0, len(tag_ids), size=(count, max(args.tags_per_note, 1)))
+        for note_id, amount, choice in zip(note_ids, per_note.tolist(), picked.tolist()):
+            for tag_index in set(choice[:amount]):
+                note_tags.append(f"{note_id}\t{tag_ids[tag_index]}")
+    _copy(cur, "note_tags", ("note_id", "tag_id"), note_tags)
+
+    review_ids = _uuids(rng, history.review_card.size)
+    _copy(
+        cur,
+        "reviews",
+        ("id", "card_id", "user_id", "quality", "interval_days", "ease_factor", "reviewed_at"),
+        [
+            f"{review_id}\t{card_ids[card]}\t{user_id}\t{quality}\t{interval}\t{ease:.2f}\t{at}"
+            for review_id, card, quality, interval, ease, at in zip(
+                review_ids,
+                history.review_card.tolist(),
+                history.review_quality.tolist(),
+                history.review_interval.tolist(),
+                history.review_ease.tolist(),
+                _timestamps(history.review_at),
+            )
+        ],
+    )
+    return {
+        "notes": count,
+        "cards": count,
+        "card_state": count,
+        "note_tags": len(note_tags),
+        "reviews": len(review_ids),
+    }
+
+
+def generate(args: argparse.Namespace) -> Dict[str, int]:
+    """Создаёт набор данных и возвращает число загруженных строк по таблицам."""
+    rng = np.random.default_rng(args.seed)
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    totals = {"notes": 0, "cards": 0, "card_state": 0, "note_tags": 0, "reviews": 0}
+    started = time.perf_counter()
+
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            user_ids = _create_users(cur, args.prefix, args.users, args.replace)
+            tag_ids = _ensure_tags(cur, args.prefix, args.tags)
+            decks = [(user_id, _create_decks(cur, user_id, args.decks)) for user_id in user_ids]
+            # история уходит на --days дней назад: месячные разделы reviews создаются заранее
+            cur.execute("SELECT reviews_ensure_partitions(%s, %s)", (now - timedelta(days=args.days), now))
+            conn.commit()
+
+            for user_number, (user_id, deck_ids) in enumerate(decks):
+                for deck_id in deck_ids:
+                    for offset in range(0, args.notes, args.chunk_size):
+                        count = min(args.chunk_size, args.notes - offset)
+                        loaded = _load_chunk(cur, rng, user_id, deck_id, tag_ids, count, args, now)
+                        conn.commit()
+                        for table, rows in loaded.items():
+                            totals[table] += rows
+                        elapsed = time.perf_counter() - started
+                        print(
+                            f"\r{user_email(args.prefix, user_number)}: карточек {totals['cards']}, "
+                            f"ревью {totals['reviews']}, {sum(totals.values()) / elapsed:.0f} строк/с",
+                            end="",
+                            flush=True,
+                        )
+            print()
+
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            for table in ("notes", "cards", "card_state", "note_tags", "reviews", "deck_stats", "daily_review_stats"):
+                cur.execute(f"ANALYZE {table}")
+    return totals
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=2)
+    parser.add_argument("--decks", type=int, default=5, help="колод у каждого пользователя")
+    parser.add_argument("--notes", type=int, default=20_000, help="заметок (карточек) в каждой колоде")
+    parser.add_argument("--reviews", type=float, default=10.0, help="среднее число ревью на карточку")
+    parser.add_argument("--days", type=int, default=365, help="длина истории в днях")
+    parser.add_argument("--tags", type=int, default=200, help="размер общего набора тегов")
+    parser.add_argument("--tags-per-note", type=int, default=3)
+    parser.add_argument("--chunk-size", type=int, default=50_000, help="карточек в одной транзакции COPY")
+    parser.add_argument("--prefix", default="bench", help="префикс email пользователей и имён тегов")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--replace", action="store_true", help="удалить ранее созданных пользователей")
+    args = parser.parse_args()
+    if args.chunk_size < 1:
+        parser.error("--chunk-size должен быть положительным")
+
+    started = time.perf_counter()
+    try:
+        apply_migrations()
+        totals = generate(args)
+    finally:
+        close_pool()
+    elapsed = time.perf_counter() - started
+    rows = sum(totals.values())
+    print(", ".join(f"{table}: {count}" for table, count in totals.items()))
+    print(f"{rows} строк за {elapsed:.1f} с ({rows / elapsed if elapsed else 0:.0f} строк/с)")
+
+
+if __name__ == "__main__":
+    main()
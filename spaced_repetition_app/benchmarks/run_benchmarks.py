@@ -0,0 +1,297 @@
+"""Набор бенчмарков функций models на данных generate_dataset.py с выгрузкой результатов в JSON.
+
+Запуск из каталога spaced_repetition_app (нужна рабочая БД из .env):
+
+    python benchmarks/generate_dataset.py --users 2 --notes 50000
+    python benchmarks/run_benchmarks.py --out results/$(git rev-parse --short HEAD).json
+    python benchmarks/run_benchmarks.py --compare results/abc1234.json
+
+Каждый сценарий выполняется --warmup раз без замера и --repeat раз с
+замером; в результат попадают медиана, среднее, p95, минимум и максимум,
+а также разбивка по instrumentation (ожидание пула, выполнение, чтение,
+строки). Кэш запросов отключается, чтобы измерялась работа БД.
+Сценарии записи (record_review, record_reviews_bulk) меняют данные
+пользователя; --skip-writes их пропускает. Случайный выбор карточек
+задаётся --seed, поэтому прогоны на одних данных сравнимы.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# измеряется работа БД, а не попадания в кэш
+os.environ.setdefault("QUERY_CACHE", "0")
+
+import instrumentation  # noqa: E402
+import models  # noqa: E402
+from db import close_pool, get_connection  # noqa: E402
+from generate_dataset import user_email  # noqa: E402
+
+
+@dataclass
+class Context:
+    user_id: str
+    deck_id: str
+    tag: str | None
+    word: str
+    card_ids: List[str]
+    rng: random.Random
+
+
+@dataclass
+class Case:
+    name: str
+    run: Callable[[Context], Any]
+    writes: bool = False
+
+
+CASES = (
+    Case("list_decks", lambda ctx: models.list_decks(ctx.user_id)),
+    Case("get_deck_progress", lambda ctx: models.get_deck_progress(ctx.user_id)),
+    Case("get_summary_counts", lambda ctx: models.get_summary_counts(ctx.user_id)),
+    Case("get_daily_stats_30", lambda ctx: models.get_daily_stats(ctx.user_id, 30)),
+    Case("get_daily_stats_365", lambda ctx: models.get_daily_stats(ctx.user_id, 365)),
+    Case("get_due_queue", lambda ctx: models.get_due_queue(ctx.user_id, limit=50)),
+    Case("get_due_queue_deck", lambda ctx: models.get_due_queue(ctx.user_id, ctx.deck_id, 50)),
+    Case("get_due_card_ids", lambda ctx: models.get_due_card_ids(ctx.user_id, limit=200)),
+    Case("get_cards_content_50", lambda ctx: models.get_cards_content(ctx.user_id, ctx.rng.sample(ctx.card_ids, 50))),
+    Case("list_notes_page", lambda ctx: models.list_notes_page(ctx.user_id, limit=100)),
+    Case("list_notes_page_deck", lambda ctx: models.list_notes_page(ctx.user_id, ctx.deck_id, limit=100)),
+    Case(
+        "list_notes_page_tag",
+        lambda ctx: models.list_notes_page(ctx.user_id, tags=[ctx.tag] if ctx.tag else None, limit=100),
+    ),
+    Case("list_notes_page_search", lambda ctx: models.list_notes_page(ctx.user_id, search=ctx.word, limit=100)),
+    Case(
+        "list_notes_deck_tag_search",
+        lambda ctx: models.list_notes(ctx.user_id, ctx.deck_id, [ctx.tag] if ctx.tag else None, ctx.word),
+    ),
+    Case(
+        "record_review",
+        lambda ctx: models.record_review(ctx.user_id, ctx.rng.choice(ctx.card_ids), ctx.rng.randint(0, 5)),
+        writes=True,
+    ),
+    Case(
+        "record_reviews_bulk_100",
+        lambda ctx: models.record_reviews_bulk(
+            ctx.user_id,
+            [{"card_id": card_id, "quality": ctx.rng.randint(0, 5)} for card_id in ctx.rng.sample(ctx.card_ids, 100)],
+        ),
+        writes=True,
+    ),
+)
+
+
+def _load_context(email: str, seed: int, sample: int) -> Context:
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT id FROM users WHERE email = %s", (email,))
+            row = cur.fetchone()
+            if row is None:
+                raise SystemExit(f"Пользователь {email} не найден; сначала запустите generate_dataset.py")
+            user_id = str(row[0])
+            cur.execute(
+                """
+                SELECT d.id FROM decks d JOIN deck_stats ds ON ds.deck_id = d.id
+                WHERE d.user_id = %s ORDER BY ds.total_cards DESC, d.id LIMIT 1
+                """,
+                (user_id,),
+            )
+            deck_id = str(cur.fetchone()[0])
+            cur.execute(
+                """
+                SELECT t.name FROM note_tags nt
+                JOIN notes n ON n.id = nt.note_id
+                JOIN tags t ON t.id = nt.tag_id
+                WHERE n.deck_id = %s
+                GROUP BY t.name ORDER BY count(*) DESC, t.name LIMIT 1
+                """,
+                (deck_id,),
+            )
+            tag_row = cur.fetchone()
+            cur.execute(
+                "SELECT id FROM cards WHERE user_id = %s ORDER BY id LIMIT %s",
+                (user_id, sample),
+            )
+            card_ids = [str(card_id) for (card_id,) in cur.fetchall()]
+    return Context(
+        user_id=user_id,
+        deck_id=deck_id,
+        tag=tag_row[0] if tag_row else None,
+        word="кошка",
+        card_ids=card_ids,
+        rng=random.Random(seed),
+    )
+
+
+def _dataset(user_id: str) -> Dict[str, Any]:
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SHOW server_version")
+            version = cur.fetchone()[0]
+            cur.execute(
+                """
+                SELECT (SELECT count(*) FROM decks WHERE user_id = %(u)s),
+                       (SELECT count(*) FROM cards WHERE user_id = %(u)s),
+                       (SELECT count(*) FROM reviews WHERE user_id = %(u)s),
+                       (SELECT count(*) FROM cards),
+                       (SELECT count(*) FROM reviews)
+                """,
+                {"u": user_id},
+            )
+            decks, cards, reviews, all_cards, all_reviews = cur.fetchone()
+    return {
+        "server_version": version,
+        "user": {"decks": decks, "cards": cards, "reviews": reviews},
+        "total": {"cards": all_cards, "reviews": all_reviews},
+    }
+
+
+def _git_commit() -> str | None:
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=Path(__file__).resolve().parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def run_case(case: Case, ctx: Context, warmup: int, repeat: int) -> Dict[str, Any]:
+    for _ in range(warmup):
+        case.run(ctx)
+    instrumentation.reset()
+    timings: List[float] = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        case.run(ctx)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    result: Dict[str, Any] = {
+        "runs": repeat,
+        "median_ms": statistics.median(timings),
+        "mean_ms": statistics.fmean(timings),
+        "p95_ms": _percentile(timings, 0.95),
+        "min_ms": min(timings),
+        "max_ms": max(timings),
+        "stdev_ms": statistics.stdev(timings) if repeat > 1 else 0.0,
+    }
+    db_stats = instrumentation.snapshot()
+    if db_stats:
+        # суммы по всем функциям models, вызванным в сценарии, на один прогон
+        def per_run(key: str) -> float:
+            return sum(stats[key]["avg_ms"] * stats[key]["count"] for stats in db_stats.values()) / repeat
+
+        result["db"] = {
+            "statements": sum(stats["statements"] for stats in db_stats.values()) / repeat,
+            "rows": sum(stats["rows"] for stats in db_stats.values()) / repeat,
+            "acquire_ms": per_run("acquire"),
+            "execute_ms": per_run("execute"),
+            "fetch_ms": per_run("fetch"),
+        }
+    return result
+
+
+def compare(results: Dict[str, Any], baseline_path: Path) -> None:
+    """Печатает отношение медиан к сохранённому прогону."""
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    print(f"\nсравнение с {baseline_path} ({(baseline.get('meta') or {}).get('commit') or '?'}):")
+    print(f"{'сценарий':<28} {'было, мс':>10} {'стало, мс':>10} {'изменение':>10}")
+    for name, current in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if previous is None:
+            print(f"{name:<28} {'—':>10} {current['median_ms']:>10.2f} {'новый':>10}")
+            continue
+        before, after = previous["median_ms"], current["median_ms"]
+        change = (after - before) / before * 100 if before else 0.0
+        print(f"{name:<28} {before:>10.2f} {after:>10.2f} {change:>+9.1f}%")
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    ctx = _load_context(args.email, args.seed, args.sample)
+    if len(ctx.card_ids) < 100:
+        raise SystemExit(f"У пользователя {args.email} меньше 100 карточек")
+    selected = [
+        case
+        for case in CASES
+        if (not args.only or case.name in args.only) and not (args.skip_writes and case.writes)
+    ]
+
+    results: Dict[str, Any] = {}
+    print(f"{'сценарий':<28} {'медиана, мс':>12} {'p95, мс':>9} {'запросов':>9} {'строк':>8}")
+    for case in selected:
+        result = results[case.name] = run_case(case, ctx, args.warmup, args.repeat)
+        db = result.get("db", {})
+        print(
+            f"{case.name:<28} {result['median_ms']:>12.2f} {result['p95_ms']:>9.2f} "
+            f"{db.get('statements', 0):>9.1f} {db.get('rows', 0):>8.0f}"
+        )
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "email": args.email,
+            "warmup": args.warmup,
+            "repeat": args.repeat,
+            "seed": args.seed,
+            "dataset": _dataset(ctx.user_id),
+        },
+        "results": results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--email", default=user_email("bench", 0), help="пользователь из generate_dataset.py")
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--sample", type=int, default=10_000, help="карточек для сценариев со случайным выбором")
+    parser.add_argument("--only", nargs="*", help="запустить только указанные сценарии")
+    parser.add_argument("--skip-writes", action="store_true", help="пропустить сценарии записи")
+    parser.add_argument("--out", type=Path, help="файл JSON с результатами")
+    parser.add_argument("--compare", type=Path, help="файл JSON прошлого прогона для сравнения")
+    args = parser.parse_args()
+    if args.repeat < 1:
+        parser.error("--repeat должен быть положительным")
+
+    try:
+        report = run(args)
+    finally:
+        close_pool()
+
+    if args.out:
+        args.out.parent.mkdir(parents=True, exist_ok=True)
+        args.out.write_text(json.dumps(report, ensure_ascii=False, indent=2, default=str), encoding="utf-8")
+        print(f"результаты: {args.out}")
+    if args.compare:
+        compare(report["results"], args.compare)
+
+
+if __name__ == "__main__":
+    main()
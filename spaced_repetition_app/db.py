@@ -1,14 +1,23 @@
 """Модуль управления подключением к PostgreSQL и миграциями."""
 from __future__ import annotations
 
+import hashlib
 import os
+import re
+import threading
+import time
+from collections import deque
 from contextlib import contextmanager
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Iterator
+from typing import Any, Deque, Dict, Iterator, List
 
 import psycopg2
 from dotenv import load_dotenv
-from psycopg2.pool import SimpleConnectionPool
+from psycopg2 import errors, extensions
+from psycopg2.pool import PoolError
+
+import instrumentation
 
 load_dotenv()
 
@@ -18,45 +27,403 @@ DB_NAME = os.getenv("DB_NAME", "spaced_repetition")
 DB_USER = os.getenv("DB_USER", "spaced_user")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "spaced_password")
 
-_pool: SimpleConnectionPool | None = None
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_MAX_AGE = float(os.getenv("DB_POOL_MAX_AGE", "1800"))
+DB_POOL_CHECK_IDLE = float(os.getenv("DB_POOL_CHECK_IDLE", "30"))
+
+
+class PoolTimeoutError(TimeoutError):
+    """Свободное соединение не появилось за отведённое время."""
+
+
+@dataclass
+class _ConnectionMeta:
+    created_at: float
+    last_used: float
+    # данные, привязанные к соединению (например, подготовленные запросы)
+    state: Dict[str, Any] = field(default_factory=dict)
+
+
+class ConnectionPool:
+    """Потокобезопасный пул соединений с ожиданием, проверкой и счётчиками.
+
+    getconn() блокируется до освобождения соединения (не дольше timeout).
+    Соединения старше max_age пересоздаются, а простаивавшие дольше
+    check_idle перед выдачей проверяются запросом SELECT 1.
+    """
+
+    def __init__(
+        self,
+        minconn: int,
+        maxconn: int,
+        timeout: float = DB_POOL_TIMEOUT,
+        max_age: float = DB_POOL_MAX_AGE,
+        check_idle: float = DB_POOL_CHECK_IDLE,
+        **dsn: Any,
+    ):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError("Некорректные размеры пула соединений")
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_age = max_age
+        self.check_idle = check_idle
+        self._dsn = dsn
+
+        self._cond = threading.Condition()
+        self._idle: Deque[extensions.connection] = deque()
+        self._meta: Dict[int, _ConnectionMeta] = {}
+        self._size = 0
+        self._in_use = 0
+        self._closed = False
+        self._counters = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+            "timeouts": 0,
+            "created": 0,
+            "recycled": 0,
+            "discarded": 0,
+        }
+
+        for _ in range(minconn):
+            with self._cond:
+                self._size += 1
+            self._idle.append(self._connect())
+
+    def getconn(self, timeout: float | None = None) -> extensions.connection:
+        """Выдаёт соединение, при необходимости ожидая освобождения."""
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        waited = False
+        while True:
+            with self._cond:
+                conn = None
+                while True:
+                    if self._closed:
+                        raise PoolError("Пул соединений закрыт")
+                    if self._idle:
+                        conn = self._idle.pop()
+                        break
+                    if self._size < self.maxconn:
+                        self._size += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._counters["timeouts"] += 1
+                        raise PoolTimeoutError(
+                            f"Нет свободного соединения за {timeout:.1f} с (максимум {self.maxconn})"
+                        )
+                    waited = True
+                    self._cond.wait(remaining)
+                self._in_use += 1
+
+            try:
+                if conn is None:
+                    conn = self._connect()
+                elif not self._is_healthy(conn):
+                    self._discard(conn, counter="recycled")
+                    with self._cond:
+                        self._in_use -= 1
+                    continue
+            except Exception:
+                with self._cond:
+                    self._in_use -= 1
+                    if conn is None:
+                        self._size -= 1
+                    self._cond.notify()
+                raise
+
+            wait_time = time.monotonic() - started
+            with self._cond:
+                self._counters["checkouts"] += 1
+                if waited:
+                    self._counters["waits"] += 1
+                self._counters["wait_time_total"] += wait_time
+                self._counters["wait_time_max"] = max(self._counters["wait_time_max"], wait_time)
+            return conn
 
+    def putconn(self, conn: extensions.connection, close: bool = False) -> None:
+        """Возвращает соединение в пул, откатывая незавершённую транзакцию."""
+        with self._cond:
+            self._in_use -= 1
+        meta = self._meta.get(id(conn))
+        reusable = not close and not self._closed and not conn.closed and meta is not None
+        if reusable:
+            try:
+                status = conn.info.transaction_status
+                if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                    reusable = False
+                else:
+                    if status != extensions.TRANSACTION_STATUS_IDLE:
+                        conn.rollback()
+                    if conn.autocommit:
+                        conn.autocommit = False
+            except psycopg2.Error:
+                reusable = False
+        if reusable and time.monotonic() - meta.created_at > self.max_age:
+            self._discard(conn, counter="recycled")
+            return
+        if not reusable:
+            self._discard(conn, counter="discarded")
+            return
+        meta.last_used = time.monotonic()
+        with self._cond:
+            self._idle.append(conn)
+            self._cond.notify()
 
-def init_pool(minconn: int = 1, maxconn: int = 10) -> SimpleConnectionPool:
+    def state(self, conn: extensions.connection) -> Dict[str, Any] | None:
+        """Словарь данных соединения; пропадает вместе с пересозданным соединением."""
+        meta = self._meta.get(id(conn))
+        return meta.state if meta is not None else None
+
+    def closeall(self) -> None:
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._cond.notify_all()
+        for conn in idle:
+            self._discard(conn, counter=None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Текущие показатели пула: занятые и свободные соединения, ожидания, выдачи."""
+        with self._cond:
+            checkouts = self._counters["checkouts"]
+            return {
+                "size": self._size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "min": self.minconn,
+                "max": self.maxconn,
+                **self._counters,
+                "wait_time_avg": self._counters["wait_time_total"] / checkouts if checkouts else 0.0,
+            }
+
+    def _connect(self) -> extensions.connection:
+        if instrumentation.INSTRUMENT:
+            conn = psycopg2.connect(connection_factory=instrumentation.InstrumentedConnection, **self._dsn)
+        else:
+            conn = psycopg2.connect(**self._dsn)
+        now = time.monotonic()
+        self._meta[id(conn)] = _ConnectionMeta(created_at=now, last_used=now)
+        with self._cond:
+            self._counters["created"] += 1
+        return conn
+
+    def _is_healthy(self, conn: extensions.connection) -> bool:
+        meta = self._meta[id(conn)]
+        now = time.monotonic()
+        if conn.closed or now - meta.created_at > self.max_age:
+            return False
+        if now - meta.last_used > self.check_idle:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+                conn.rollback()
+            except psycopg2.Error:
+                return False
+        return True
+
+    def _discard(self, conn: extensions.connection, counter: str | None) -> None:
+        self._meta.pop(id(conn), None)
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+        with self._cond:
+            self._size -= 1
+            if counter:
+                self._counters[counter] += 1
+            self._cond.notify()
+
+
+_pool: ConnectionPool | None = None
+_pool_lock = threading.Lock()
+
+
+def init_pool(minconn: int | None = None, maxconn: int | None = None) -> ConnectionPool:
     """Создаёт пул соединений при первом обращении."""
     global _pool
-    if _pool is None:
-        _pool = SimpleConnectionPool(
-            minconn,
-            maxconn,
-            host=DB_HOST,
-            port=DB_PORT,
-            database=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD,
-        )
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(
+                DB_POOL_MIN if minconn is None else minconn,
+                DB_POOL_MAX if maxconn is None else maxconn,
+                host=DB_HOST,
+                port=DB_PORT,
+                database=DB_NAME,
+                user=DB_USER,
+                password=DB_PASSWORD,
+            )
     return _pool
 
 
 @contextmanager
-def get_connection() -> Iterator[psycopg2.extensions.connection]:
+def get_connection(timeout: float | None = None) -> Iterator[extensions.connection]:
     """Предоставляет соединение из пула."""
     pool = init_pool()
-    conn = pool.getconn()
+    started = time.perf_counter()
+    conn = pool.getconn(timeout)
+    instrumentation.record_acquire(time.perf_counter() - started)
     try:
         yield conn
     finally:
         pool.putconn(conn)
 
 
-def apply_migrations() -> None:
-    """Применяет SQL-скрипты из каталога sql/ в алфавитном порядке."""
-    sql_dir = Path(__file__).resolve().parent / "sql"
+def pool_stats() -> Dict[str, Any]:
+    """Показатели пула соединений (пустой словарь, если пул ещё не создан)."""
+    return _pool.stats() if _pool is not None else {}
+
+
+def connection_state(conn: extensions.connection) -> Dict[str, Any] | None:
+    """Данные, привязанные к соединению пула (None для соединений не из пула)."""
+    return _pool.state(conn) if _pool is not None else None
+
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent / "sql"
+# первая строка скрипта, который выполняется вне транзакции (CREATE INDEX CONCURRENTLY)
+NO_TRANSACTION_MARKER = "-- migrate: no-transaction"
+# интервал опроса рекомендательной блокировки миграций, секунды
+MIGRATION_LOCK_POLL = float(os.getenv("MIGRATION_LOCK_POLL", "0.5"))
+MIGRATION_LOCK_KEY = "spaced_repetition.migrations"
+_DOLLAR_QUOTE = re.compile(r"\$[A-Za-z_]*\$")
+
+
+class MigrationError(RuntimeError):
+    """Миграции не могут быть применены (например, изменён уже применённый скрипт)."""
+
+
+@dataclass(frozen=True)
+class _Migration:
+    filename: str
+    sql: str
+    checksum: str
+
+    @property
+    def transactional(self) -> bool:
+        return not self.sql.lstrip().startswith(NO_TRANSACTION_MARKER)
+
+    def statements(self) -> List[str]:
+        """Отдельные команды скрипта без транзакции: каждая выполняется сама по себе.
+
+        Разделитель — `;` вне строк, идентификаторов в кавычках и комментариев.
+        Тела в $$ не поддерживаются: такой скрипт вызывает MigrationError.
+        """
+        if _DOLLAR_QUOTE.search(self.sql):
+            raise MigrationError(
+                f"Миграция {self.filename}: тела в $$ в скрипте без транзакции не поддерживаются"
+            )
+        statements = []
+        current: List[str] = []
+        quote = None
+        i = 0
+        sql = self.sql
+        while i < len(sql):
+            char = sql[i]
+            if quote is not None:
+                current.append(char)
+                if char == quote:
+                    # удвоенная кавычка внутри строки — экранирование
+                    if sql.startswith(quote, i + 1):
+                        current.append(quote)
+                        i += 1
+                    else:
+                        quote = None
+            elif char in "'\"":
+                quote = char
+                current.append(char)
+            elif sql.startswith("--", i):
+                end = sql.find("\n", i)
+                i = len(sql) if end == -1 else end
+                continue
+            elif sql.startswith("/*", i):
+                end = sql.find("*/", i + 2)
+                i = len(sql) if end == -1 else end + 2
+                continue
+            elif char == ";":
+                statements.append("".join(current))
+                current = []
+            else:
+                current.append(char)
+            i += 1
+        if quote is not None:
+            raise MigrationError(f"Миграция {self.filename}: незакрытая кавычка")
+        statements.append("".join(current))
+        return [statement.strip() for statement in statements if statement.strip()]
+
+
+def _load_migrations(sql_dir: Path) -> List[_Migration]:
+    migrations = []
+    for script in sorted(sql_dir.glob("*.sql")):
+        # read_text приводит переводы строк к \n: сумма не зависит от рабочей копии
+        sql = script.read_text(encoding="utf-8")
+        checksum = hashlib.sha256(sql.encode("utf-8")).hexdigest()
+        migrations.append(_Migration(script.name, sql, checksum))
+    return migrations
+
+
+def _pending(migrations: List[_Migration], applied: Dict[str, str | None]) -> List[_Migration]:
+    """Неприменённые скрипты; для применённых сверяет контрольные суммы."""
+    pending = []
+    for migration in migrations:
+        if migration.filename not in applied:
+            pending.append(migration)
+            continue
+        checksum = applied[migration.filename]
+        if checksum is not None and checksum != migration.checksum:
+            raise MigrationError(
+                f"Миграция {migration.filename} изменена после применения; "
+                "добавьте изменения новым скриптом"
+            )
+    return pending
+
+
+def apply_migrations(sql_dir: Path = MIGRATIONS_DIR) -> List[str]:
+    """Применяет новые SQL-скрипты из каталога sql/ в алфавитном порядке.
+
+    Если применять нечего, проверка занимает один запрос к серверу.
+    Иначе скрипты применяются под рекомендательной блокировкой, поэтому
+    два запущенных экземпляра не выполняют миграции одновременно. Для
+    каждого скрипта хранится контрольная сумма; изменение уже применённого
+    скрипта вызывает MigrationError. Скрипт, начинающийся со строки
+    NO_TRANSACTION_MARKER, выполняется по командам вне транзакции.
+    Возвращает имена применённых скриптов.
+    """
     if not sql_dir.exists():
-        return
+        return []
+    migrations = _load_migrations(sql_dir)
 
     with get_connection() as conn:
-        conn.autocommit = False
-        with conn.cursor() as cur:
+        # без транзакции: быстрая проверка не требует COMMIT или ROLLBACK
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT filename, checksum FROM schema_migrations")
+                applied = dict(cur.fetchall())
+        except (errors.UndefinedTable, errors.UndefinedColumn):
+            applied = None
+        if applied is not None and all(checksum is not None for checksum in applied.values()):
+            if not _pending(migrations, applied):
+                return []
+        return _apply_locked(conn, migrations)
+
+
+def _apply_locked(conn: extensions.connection, migrations: List[_Migration]) -> List[str]:
+    with conn.cursor() as cur:
+        # ожидание в pg_advisory_lock держит снимок, и CREATE INDEX CONCURRENTLY
+        # у владельца блокировки ждал бы этот сеанс; поэтому опрос из Python
+        while True:
+            cur.execute("SELECT pg_try_advisory_lock(hashtext(%s))", (MIGRATION_LOCK_KEY,))
+            if cur.fetchone()[0]:
+                break
+            time.sleep(MIGRATION_LOCK_POLL)
+        try:
             cur.execute(
                 """
                 CREATE TABLE IF NOT EXISTS schema_migrations (
@@ -65,25 +432,61 @@ def apply_migrations() -> None:
                 )
                 """
             )
-            conn.commit()
+            cur.execute("ALTER TABLE schema_migrations ADD COLUMN IF NOT EXISTS checksum text")
+            # пока ждали блокировку, скрипты мог применить другой экземпляр
+            cur.execute("SELECT filename, checksum FROM schema_migrations")
+            applied: Dict[str, str | None] = dict(cur.fetchall())
 
-        scripts = sorted(sql_dir.glob("*.sql"))
-        for script in scripts:
-            with conn.cursor() as cur:
-                cur.execute("SELECT 1 FROM schema_migrations WHERE filename = %s", (script.name,))
-                if cur.fetchone():
-                    continue
-                sql = script.read_text(encoding="utf-8")
-                cur.execute(sql)
+            # скрипты, применённые до появления контрольных сумм, принимаются как есть
+            known = {migration.filename: migration.checksum for migration in migrations}
+            legacy = [name for name, checksum in applied.items() if checksum is None and name in known]
+            for name in legacy:
                 cur.execute(
-                    "INSERT INTO schema_migrations(filename) VALUES (%s)", (script.name,)
+                    "UPDATE schema_migrations SET checksum = %s WHERE filename = %s", (known[name], name)
                 )
-                conn.commit()
+                applied[name] = known[name]
+
+            pending = _pending(migrations, applied)
+            # скрипты без транзакции разбираются заранее, до применения первого из них
+            for migration in pending:
+                if not migration.transactional:
+                    migration.statements()
+            done = []
+            for migration in pending:
+                _apply_one(conn, cur, migration)
+                done.append(migration.filename)
+            return done
+        finally:
+            # с закрытым соединением блокировка снимается сервером
+            if not conn.closed:
+                if not conn.autocommit:
+                    conn.rollback()
+                    conn.autocommit = True
+                cur.execute("SELECT pg_advisory_unlock(hashtext(%s))", (MIGRATION_LOCK_KEY,))
+
+
+def _apply_one(conn: extensions.connection, cur: extensions.cursor, migration: _Migration) -> None:
+    record = (
+        "INSERT INTO schema_migrations(filename, checksum) VALUES (%s, %s)",
+        (migration.filename, migration.checksum),
+    )
+    if migration.transactional:
+        conn.autocommit = False
+        cur.execute(migration.sql)
+        cur.execute(*record)
+        conn.commit()
+        conn.autocommit = True
+        return
+    # команды должны быть повторяемыми (IF NOT EXISTS): после сбоя скрипт выполняется заново
+    for statement in migration.statements():
+        cur.execute(statement)
+    cur.execute(*record)
 
 
 def close_pool() -> None:
     """Закрывает пул соединений при завершении работы."""
     global _pool
-    if _pool is not None:
-        _pool.closeall()
-        _pool = None
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
@@ -0,0 +1,408 @@
+"""Потоковый экспорт колод и истории повторений через COPY TO и обратный импорт.
+
+Запуск из каталога spaced_repetition_app:
+
+    python exporter.py export --email user@example.com --out backup/
+    python exporter.py import backup/ --email other@example.com
+
+Каждая таблица выгружается командой COPY ... TO STDOUT прямо в файл, поэтому
+расход памяти не зависит от объёма коллекции. Формат parquet требует pyarrow.
+"""
+from __future__ import annotations
+
+import argparse
+import gzip
+import io
+import json
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import IO, Any, Dict, List, Sequence, Tuple
+
+import models
+from db import get_connection
+
+EXPORT_FORMAT_VERSION = 2
+# версия 1 — без дневных лимитов колод и first_reviewed_at; импортируется с NULL в них
+_IMPORT_VERSIONS = (1, 2)
+FORMATS = ("csv", "parquet")
+
+_COPY_BUFFER = 1024 * 1024
+_PARQUET_BATCH_ROWS = 100_000
+
+
+@dataclass(frozen=True)
+class _Table:
+    name: str
+    query: str
+    columns: Tuple[Tuple[str, str], ...]
+
+
+# порядок важен для импорта: ссылки идут только на предыдущие таблицы
+_TABLES: Tuple[_Table, ...] = (
+    _Table(
+        "decks",
+        "SELECT {columns} FROM decks WHERE user_id = %s ORDER BY created_at",
+        (
+            ("id", "uuid"),
+            ("name", "text"),
+            ("description", "text"),
+            ("created_at", "timestamptz"),
+            ("new_per_day", "integer"),
+            ("reviews_per_day", "integer"),
+        ),
+    ),
+    _Table(
+        "notes",
+        "SELECT {columns} FROM notes WHERE user_id = %s",
+        (
+            ("id", "uuid"),
+            ("deck_id", "uuid"),
+            ("front", "text"),
+            ("back", "text"),
+            ("created_at", "timestamptz"),
+            ("updated_at", "timestamptz"),
+        ),
+    ),
+    _Table(
+        "note_tags",
+        "SELECT {columns} FROM note_tags nt JOIN notes n ON n.id = nt.note_id "
+        "JOIN tags t ON t.id = nt.tag_id WHERE n.user_id = %s",
+        (("nt.note_id", "uuid"), ("t.name", "text")),
+    ),
+    _Table(
+        "cards",
+        "SELECT {columns} FROM cards c JOIN card_state cs ON cs.card_id = c.id WHERE c.user_id = %s",
+        (
+            ("c.id", "uuid"),
+            ("c.deck_id", "uuid"),
+            ("c.note_id", "uuid"),
+            ("c.created_at", "timestamptz"),
+            ("cs.ease_factor", "numeric"),
+            ("cs.interval_days", "integer"),
+            ("cs.reps", "integer"),
+            ("cs.lapses", "integer"),
+            ("cs.due_at", "timestamptz"),
+            ("cs.last_reviewed_at", "timestamptz"),
+            ("cs.first_reviewed_at", "timestamptz"),
+            ("cs.suspended", "boolean"),
+        ),
+    ),
+    _Table(
+        "reviews",
+        "SELECT {columns} FROM reviews WHERE user_id = %s",
+        (
+            ("id", "uuid"),
+            ("card_id", "uuid"),
+            ("quality", "smallint"),
+            ("interval_days", "integer"),
+            ("ease_factor", "numeric"),
+            ("reviewed_at", "timestamptz"),
+        ),
+    ),
+)
+
+# перенос из временных таблиц с новыми id; старые id служат только для связей
+_IMPORT_SQL: Tuple[Tuple[str, str], ...] = (
+    (
+        "decks",
+        """
+        INSERT INTO decks(id, user_id, name, description, created_at, new_per_day, reviews_per_day)
+        SELECT new_id, %(user_id)s, name, description, created_at, new_per_day, reviews_per_day
+        FROM stage_decks
+        """,
+    ),
+    (
+        "notes",
+        """
+        INSERT INTO notes(id, user_id, deck_id, front, back, created_at, updated_at)
+        SELECT n.new_id, %(user_id)s, d.new_id, n.front, n.back, n.created_at, n.updated_at
+        FROM stage_notes n
+        JOIN stage_decks d ON d.id = n.deck_id
+        """,
+    ),
+    (
+        "tags",
+        """
+        INSERT INTO tags(name)
+        SELECT name
+        FROM (
+            SELECT DISTINCT ON (lower(s.name)) s.name
+            FROM stage_note_tags s
+            WHERE NOT EXISTS (SELECT 1 FROM tags x WHERE lower(x.name) = lower(s.name))
+            ORDER BY lower(s.name), s.name
+        ) missing
+        ON CONFLICT (lower(name)) DO NOTHING
+        """,
+    ),
+    (
+        "note_tags",
+        """
+        INSERT INTO note_tags(note_id, tag_id)
+        SELECT DISTINCT n.new_id, t.id
+        FROM stage_note_tags s
+        JOIN stage_notes n ON n.id = s.note_id
+        JOIN tags t ON lower(t.name) = lower(s.name)
+        ON CONFLICT DO NOTHING
+        """,
+    ),
+    (
+        "cards",
+        """
+        INSERT INTO cards(id, user_id, deck_id, note_id, created_at)
+        SELECT c.new_id, %(user_id)s, d.new_id, n.new_id, c.created_at
+        FROM stage_cards c
+        JOIN stage_decks d ON d.id = c.deck_id
+        JOIN stage_notes n ON n.id = c.note_id
+        """,
+    ),
+    (
+        "card_state",
+        """
+        INSERT INTO card_state(
+            card_id, user_id, deck_id, ease_factor, interval_days, reps, lapses,
+            due_at, last_reviewed_at, first_reviewed_at, suspended
+        )
+        SELECT c.new_id, %(user_id)s, x.deck_id, c.ease_factor, c.interval_days, c.reps, c.lapses,
+               c.due_at, c.last_reviewed_at, c.first_reviewed_at, c.suspended
+        FROM stage_cards c
+        JOIN cards x ON x.id = c.new_id
+        """,
+    ),
+    (
+        "reviews",
+        """
+        INSERT INTO reviews(id, card_id, user_id, quality, interval_days, ease_factor, reviewed_at)
+        SELECT r.new_id, c.new_id, %(user_id)s, r.quality, r.interval_days, r.ease_factor, r.reviewed_at
+        FROM stage_reviews r
+        JOIN stage_cards c ON c.id = r.card_id
+        JOIN cards x ON x.id = c.new_id
+        """,
+    ),
+)
+
+
+def export_user(user_id: str, directory: str | Path, fmt: str = "csv", compress: bool = False) -> Dict[str, Any]:
+    """Выгружает данные пользователя в каталог и возвращает манифест.
+
+    Все таблицы читаются в одной транзакции REPEATABLE READ, поэтому
+    выгрузка согласована. compress сжимает CSV в gzip.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Неизвестный формат экспорта: {fmt}")
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    started = time.perf_counter()
+    manifest: Dict[str, Any] = {
+        "version": EXPORT_FORMAT_VERSION,
+        "format": fmt,
+        "compressed": compress and fmt == "csv",
+        "user_id": user_id,
+        "exported_at": datetime.now(timezone.utc).isoformat(),
+        "tables": {},
+    }
+
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+            cur.execute("SET LOCAL TIME ZONE 'UTC'")
+            for table in _TABLES:
+                query = cur.mogrify(table.query.format(columns=_select_list(table, fmt)), (user_id,)).decode()
+                if fmt == "csv":
+                    filename = f"{table.name}.csv" + (".gz" if compress else "")
+                    with _open_file(directory / filename, "wb", compress) as out:
+                        cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER true)", out, _COPY_BUFFER)
+                    rows = cur.rowcount
+                else:
+                    filename = f"{table.name}.parquet"
+                    rows = _export_parquet(cur, query, table, directory / filename)
+                manifest["tables"][table.name] = {
+                    "file": filename,
+                    "rows": rows,
+                    "columns": [_column_name(column) for column, _type in table.columns],
+                }
+        conn.rollback()
+
+    manifest["seconds"] = round(time.perf_counter() - started, 3)
+    (directory / "manifest.json").write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+    return manifest
+
+
+def import_export(directory: str | Path, user_id: str) -> Dict[str, int]:
+    """Загружает выгрузку export_user() пользователю user_id с новыми id.
+
+    Файлы копируются через COPY FROM во временные таблицы, затем данные
+    переносятся set-based запросами в одной транзакции. Возвращает число
+    импортированных строк по таблицам.
+    """
+    directory = Path(directory)
+    manifest = json.loads((directory / "manifest.json").read_text(encoding="utf-8"))
+    if manifest.get("version") not in _IMPORT_VERSIONS:
+        raise ValueError(f"Неподдерживаемая версия выгрузки: {manifest.get('version')}")
+    fmt = manifest["format"]
+    counts: Dict[str, int] = {}
+
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            for table in _TABLES:
+                columns = [_column_name(column) for column, _type in table.columns]
+                definitions = ", ".join(
+                    f"{name} {column_type}" for name, (_column, column_type) in zip(columns, table.columns)
+                )
+                if table.name != "note_tags":
+                    definitions += ", new_id uuid NOT NULL DEFAULT gen_random_uuid()"
+                cur.execute(f"CREATE TEMP TABLE stage_{table.name} ({definitions}) ON COMMIT DROP")
+                # столбцы, которых нет в выгрузке старой версии, остаются NULL
+                columns = manifest["tables"][table.name].get("columns", columns)
+                copy_sql = f"COPY stage_{table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, HEADER true)"
+                path = directory / manifest["tables"][table.name]["file"]
+                if fmt == "csv":
+                    with _open_file(path, "rb", manifest.get("compressed", False)) as source:
+                        cur.copy_expert(copy_sql, source, _COPY_BUFFER)
+                else:
+                    _import_parquet(cur, copy_sql, path)
+                cur.execute(f"ANALYZE stage_{table.name}")
+
+            # история старше текущих месяцев иначе легла бы в reviews_default
+            cur.execute("SELECT reviews_ensure_partitions(min(reviewed_at), max(reviewed_at)) FROM stage_reviews")
+            for target, statement in _IMPORT_SQL:
+                cur.execute(statement, {"user_id": user_id})
+                counts[target] = cur.rowcount
+        conn.commit()
+    models.invalidate_user(user_id)
+    return counts
+
+
+def _select_list(table: _Table, fmt: str) -> str:
+    expressions: List[str] = []
+    for column, column_type in table.columns:
+        name = _column_name(column)
+        if fmt == "parquet" and column_type == "timestamptz":
+            # микросекунды от эпохи читаются pyarrow без разбора строк
+            expressions.append(f"(extract(epoch FROM {column}) * 1000000)::bigint AS {name}")
+        elif fmt == "parquet" and column_type == "numeric":
+            expressions.append(f"{column}::float8 AS {name}")
+        else:
+            expressions.append(f"{column} AS {name}")
+    return ", ".join(expressions)
+
+
+def _column_name(column: str) -> str:
+    return column.rsplit(".", 1)[-1]
+
+
+def _open_file(path: Path, mode: str, compress: bool) -> IO[bytes]:
+    return gzip.open(path, mode, compresslevel=6) if compress else open(path, mode)
+
+
+def _pyarrow() -> Tuple[Any, Any, Any, Any]:
+    try:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.csv as pa_csv
+        import pyarrow.parquet as pq
+    except ImportError as exc:
+        raise RuntimeError("Для формата parquet установите пакет pyarrow") from exc
+    return pa, pc, pa_csv, pq
+
+
+def _export_parquet(cur: Any, query: str, table: _Table, path: Path) -> int:
+    """COPY во временный CSV и потоковое преобразование в parquet пачками."""
+    pa, _pc, pa_csv, pq = _pyarrow()
+    read_types = {
+        "uuid": pa.string(),
+        "text": pa.string(),
+        "timestamptz": pa.int64(),
+        "numeric": pa.float64(),
+        "integer": pa.int32(),
+        "smallint": pa.int16(),
+        "boolean": pa.bool_(),
+    }
+    names = [_column_name(column) for column, _type in table.columns]
+    types = [column_type for _column, column_type in table.columns]
+    schema = pa.schema(
+        [
+            (name, pa.timestamp("us", tz="UTC") if column_type == "timestamptz" else read_types[column_type])
+            for name, column_type in zip(names, types)
+        ]
+    )
+
+    tmp_path = path.with_suffix(".csv.tmp")
+    rows = 0
+    try:
+        with open(tmp_path, "wb") as out:
+            cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER true)", out, _COPY_BUFFER)
+        reader = pa_csv.open_csv(
+            tmp_path,
+            convert_options=pa_csv.ConvertOptions(
+                column_types={name: read_types[column_type] for name, column_type in zip(names, types)},
+                strings_can_be_null=True,
+                quoted_strings_can_be_null=False,
+                true_values=["t"],
+                false_values=["f"],
+            ),
+        )
+        with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+            for batch in reader:
+                arrays = [
+                    batch.column(index).cast(schema.field(index).type) if column_type == "timestamptz" else batch.column(index)
+                    for index, column_type in enumerate(types)
+                ]
+                writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+                rows += batch.num_rows
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    return rows
+
+
+def _import_parquet(cur: Any, copy_sql: str, path: Path) -> None:
+    pa, pc, pa_csv, pq = _pyarrow()
+    parquet = pq.ParquetFile(path)
+    for batch in parquet.iter_batches(batch_size=_PARQUET_BATCH_ROWS):
+        arrays = [
+            pc.strftime(column, format="%Y-%m-%dT%H:%M:%S%z") if pa.types.is_timestamp(column.type) else column
+            for column in batch.columns
+        ]
+        buffer = io.BytesIO()
+        pa_csv.write_csv(pa.RecordBatch.from_arrays(arrays, names=batch.schema.names), buffer)
+        buffer.seek(0)
+        cur.copy_expert(copy_sql, buffer, _COPY_BUFFER)
+
+
+def _print_counts(title: str, counts: Sequence[Tuple[str, int]], seconds: float) -> None:
+    total = sum(rows for _name, rows in counts)
+    print(title)
+    for name, rows in counts:
+        print(f"  {name:<12} {rows:>12,}")
+    print(f"  {total:,} строк за {seconds:.1f} с — {total / seconds if seconds else 0:,.0f} строк/с")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="выгрузить данные пользователя")
+    export_parser.add_argument("--email", required=True)
+    export_parser.add_argument("--out", type=Path, required=True, help="каталог выгрузки")
+    export_parser.add_argument("--format", choices=FORMATS, default="csv")
+    export_parser.add_argument("--gzip", action="store_true", help="сжимать CSV")
+
+    import_parser = commands.add_parser("import", help="загрузить выгрузку пользователю")
+    import_parser.add_argument("directory", type=Path)
+    import_parser.add_argument("--email", required=True)
+    args = parser.parse_args()
+
+    user = models.get_or_create_user(args.email)
+    started = time.perf_counter()
+    if args.command == "export":
+        manifest = export_user(user["id"], args.out, args.format, args.gzip)
+        counts = [(name, info["rows"]) for name, info in manifest["tables"].items()]
+        _print_counts(f"Выгружено в {args.out}:", counts, time.perf_counter() - started)
+    else:
+        counts = list(import_export(args.directory, user["id"]).items())
+        _print_counts("Импортировано:", counts, time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""Прогноз нагрузки повторений на основе правил SM-2."""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+from db import get_connection
+from sm2 import CardStateBatch, sm2_batch
+
+# вероятности оценок 0..5 по умолчанию
+DEFAULT_QUALITY_DISTRIBUTION: Tuple[float, ...] = (0.03, 0.03, 0.04, 0.15, 0.40, 0.35)
+
+_FETCH_SIZE = 100_000
+
+
+@dataclass
+class Forecast:
+    """Прогноз по дням: всего повторений и из них новых карточек."""
+
+    days: List[date]
+    reviews: np.ndarray
+    new_cards: np.ndarray
+
+
+def load_card_states(user_id: str | None = None) -> Tuple[CardStateBatch, np.ndarray]:
+    """Загружает активные карточки пользователя (или всех) в виде массивов.
+
+    Возвращает набор состояний и номер дня (от сегодня), когда карточка
+    станет к показу; просроченные карточки относятся к нулевому дню.
+    """
+    query = (
+        "SELECT ease_factor::float8, interval_days, reps, lapses, "
+        "GREATEST(due_at::date - CURRENT_DATE, 0) "
+        "FROM card_state WHERE suspended = false"
+    )
+    params: List[str] = []
+    if user_id:
+        query += " AND user_id = %s"
+        params.append(user_id)
+
+    chunks: List[np.ndarray] = []
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(query, params)
+            while True:
+                rows = cur.fetchmany(_FETCH_SIZE)
+                if not rows:
+                    break
+                chunks.append(np.array(rows, dtype=np.float64))
+
+    data = np.concatenate(chunks) if chunks else np.empty((0, 5))
+    batch = CardStateBatch(
+        ease_factor=data[:, 0],
+        interval_days=data[:, 1],
+        reps=data[:, 2],
+        lapses=data[:, 3],
+    )
+    return batch, data[:, 4].astype(np.int32)
+
+
+def simulate(
+    batch: CardStateBatch,
+    due_day: np.ndarray,
+    days: int,
+    quality_distribution: Sequence[float] = DEFAULT_QUALITY_DISTRIBUTION,
+    new_cards: int = 0,
+    new_per_day: int = 20,
+    daily_limit: int | None = None,
+    seed: int | None = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Моделирует повторения день за днём и возвращает число ревью и новых карточек.
+
+    Предполагается, что пользователь каждый день отвечает на все карточки к
+    показу (не больше daily_limit, остаток переносится на следующий день).
+    new_cards новых карточек вводятся по new_per_day в день, начиная с сегодня.
+    """
+    probabilities = np.asarray(quality_distribution, dtype=np.float64)
+    if probabilities.shape != (6,) or probabilities.min() < 0 or probabilities.sum() <= 0:
+        raise ValueError("Распределение оценок должно содержать 6 неотрицательных вероятностей")
+    probabilities = probabilities / probabilities.sum()
+    if new_cards and new_per_day <= 0:
+        raise ValueError("Количество новых карточек в день должно быть положительным")
+
+    added = CardStateBatch.new(new_cards)
+    ease = np.concatenate([batch.ease_factor, added.ease_factor])
+    interval = np.concatenate([batch.interval_days, added.interval_days])
+    reps = np.concatenate([batch.reps, added.reps])
+    lapses = np.concatenate([batch.lapses, added.lapses])
+    due = np.concatenate(
+        [np.asarray(due_day, dtype=np.int32), (np.arange(new_cards) // max(new_per_day, 1)).astype(np.int32)]
+    )
+
+    rng = np.random.default_rng(seed)
+    now = datetime.utcnow()
+    reviews = np.zeros(days, dtype=np.int64)
+    introduced = np.zeros(days, dtype=np.int64)
+
+    for day in range(days):
+        idx = np.flatnonzero(due <= day)
+        if daily_limit is not None and idx.size > daily_limit:
+            due[idx[daily_limit:]] = day + 1
+            idx = idx[:daily_limit]
+        if not idx.size:
+            continue
+
+        current = CardStateBatch(
+            ease_factor=ease[idx],
+            interval_days=interval[idx],
+            reps=reps[idx],
+            lapses=lapses[idx],
+        )
+        quality = rng.choice(6, size=idx.size, p=probabilities)
+        updated, next_interval = sm2_batch(current, quality, now)
+
+        reviews[day] = idx.size
+        introduced[day] = np.count_nonzero((current.reps == 0) & (current.lapses == 0) & (current.interval_days == 0))
+        ease[idx] = updated.ease_factor
+        interval[idx] = updated.interval_days
+        reps[idx] = updated.reps
+        lapses[idx] = updated.lapses
+        due[idx] = day + next_interval
+
+    return reviews, introduced
+
+
+def forecast_reviews(
+    user_id: str | None = None,
+    days: int = 30,
+    quality_distribution: Sequence[float] = DEFAULT_QUALITY_DISTRIBUTION,
+    new_cards: int = 0,
+    new_per_day: int = 20,
+    daily_limit: int | None = None,
+    seed: int | None = None,
+) -> Forecast:
+    """Загружает состояние карточек из БД и строит прогноз на days дней."""
+    batch, due_day = load_card_states(user_id)
+    reviews, introduced = simulate(
+        batch,
+        due_day,
+        days,
+        quality_distribution=quality_distribution,
+        new_cards=new_cards,
+        new_per_day=new_per_day,
+        daily_limit=daily_limit,
+        seed=seed,
+    )
+    today = date.today()
+    return Forecast(
+        days=[today + timedelta(days=offset) for offset in range(days)],
+        reviews=reviews,
+        new_cards=introduced,
+    )
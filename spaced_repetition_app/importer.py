@@ -0,0 +1,499 @@
+"""Массовый импорт карточек из CSV/TSV и колод Anki (.apkg) через COPY.
+
+Запуск из каталога spaced_repetition_app:
+
+    python importer.py deck.csv --email user@example.com --deck "Английский"
+
+Файл читается потоково и разбирается пачками в пуле процессов; каждая
+пачка загружается командой COPY во временную таблицу и переносится в
+notes/cards/card_state/note_tags несколькими set-based запросами.
+Пачки загружаются параллельно через несколько соединений пула.
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import html
+import io
+import json
+import os
+import queue
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import models
+from db import get_connection
+
+CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "5000"))
+IMPORT_PARALLEL = int(os.getenv("IMPORT_PARALLEL", "2"))
+
+# поля CSV, которые распознаются в строке заголовка
+CSV_COLUMNS = ("front", "back", "tags", "deck")
+
+_COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+_HTML_BREAK_RE = re.compile(r"<br\s*/?>|</div>|</p>", re.IGNORECASE)
+_HTML_TAG_RE = re.compile(r"<[^>]+>")
+
+_STAGE_SQL = """
+    CREATE TEMP TABLE import_stage (
+        deck_name text NOT NULL,
+        front text NOT NULL,
+        back text NOT NULL,
+        tags text[],
+        note_id uuid NOT NULL DEFAULT gen_random_uuid(),
+        card_id uuid NOT NULL DEFAULT gen_random_uuid()
+    ) ON COMMIT DROP
+"""
+
+# новые теги вставляются в одном порядке, чтобы параллельные загрузчики не блокировали друг друга
+_INSERT_TAGS_SQL = """
+    INSERT INTO tags(name)
+    SELECT name
+    FROM (
+        SELECT DISTINCT ON (lower(t.name)) t.name
+        FROM import_stage s
+        CROSS JOIN LATERAL unnest(s.tags) AS t(name)
+        WHERE NOT EXISTS (SELECT 1 FROM tags x WHERE lower(x.name) = lower(t.name))
+        ORDER BY lower(t.name), t.name
+    ) missing
+    ORDER BY lower(name)
+    ON CONFLICT (lower(name)) DO NOTHING
+"""
+
+_INSERT_NOTES_SQL = """
+    INSERT INTO notes(id, user_id, deck_id, front, back)
+    SELECT s.note_id, %s, dk.id, s.front, s.back
+    FROM import_stage s
+    JOIN unnest(%s::text[], %s::uuid[]) AS dk(name, id) ON dk.name = s.deck_name
+"""
+
+_INSERT_NOTE_TAGS_SQL = """
+    INSERT INTO note_tags(note_id, tag_id)
+    SELECT DISTINCT s.note_id, tg.id
+    FROM import_stage s
+    CROSS JOIN LATERAL unnest(s.tags) AS t(name)
+    JOIN tags tg ON lower(tg.name) = lower(t.name)
+    ON CONFLICT DO NOTHING
+"""
+
+# карточки вставляются последними: триггеры счётчиков колод держат блокировку до COMMIT
+_INSERT_CARDS_SQL = """
+    INSERT INTO cards(id, user_id, deck_id, note_id)
+    SELECT s.card_id, %s, n.deck_id, s.note_id
+    FROM import_stage s
+    JOIN notes n ON n.id = s.note_id
+"""
+
+_INSERT_CARD_STATE_SQL = """
+    INSERT INTO card_state(card_id, user_id, deck_id)
+    SELECT s.card_id, %s, c.deck_id
+    FROM import_stage s
+    JOIN cards c ON c.id = s.card_id
+"""
+
+
+@dataclass
+class ImportResult:
+    """Итоги импорта: загруженные и пропущенные строки, время и скорость."""
+
+    rows: int = 0
+    skipped: int = 0
+    chunks: int = 0
+    decks_created: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+@dataclass
+class _EncodedChunk:
+    data: bytes
+    rows: int
+    skipped: int
+    decks: List[str]
+
+
+def import_file(
+    path: str | Path,
+    user_id: str,
+    deck_id: str | None = None,
+    delimiter: str | None = None,
+    tag_separator: str | None = None,
+    chunk_size: int = CHUNK_SIZE,
+    workers: int | None = None,
+    parallel: int = IMPORT_PARALLEL,
+    on_progress: Callable[[int], None] | None = None,
+) -> ImportResult:
+    """Импортирует файл CSV/TSV или .apkg и возвращает итоги.
+
+    Строки без колоды (нет колонки deck или она пуста) попадают в deck_id;
+    колоды из файла ищутся по имени и создаются при отсутствии. Каждая
+    пачка загружается в своей транзакции. on_progress вызывается из потоков
+    загрузки с общим числом загруженных строк.
+    """
+    path = Path(path)
+    result = ImportResult()
+    started = time.perf_counter()
+    decks = _DeckResolver(user_id, deck_id)
+    loader = _ChunkLoader(user_id, max(parallel, 1), on_progress)
+    workers = workers or os.cpu_count() or 1
+    executor = ProcessPoolExecutor(max_workers=workers)
+    max_pending = 2 * workers
+
+    def dispatch(future: "Future[_EncodedChunk]") -> None:
+        encoded = future.result()
+        result.skipped += encoded.skipped
+        if encoded.rows:
+            names, ids = decks.resolve(encoded.decks)
+            loader.put((encoded.data, encoded.rows, names, ids))
+
+    try:
+        with _read_source(path, delimiter, tag_separator, chunk_size, deck_id is not None) as (kind, options, chunks):
+            pending: Deque["Future[_EncodedChunk]"] = deque()
+            for records in chunks:
+                pending.append(executor.submit(_encode_chunk, kind, records, options))
+                if len(pending) >= max_pending:
+                    dispatch(pending.popleft())
+            while pending:
+                dispatch(pending.popleft())
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        loader.close()
+        models.invalidate_user(user_id)
+
+    if loader.error is not None:
+        raise loader.error
+    result.rows = loader.rows
+    result.chunks = loader.chunks
+    result.decks_created = decks.created
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+class _DeckResolver:
+    """Сопоставляет имена колод из файла с id колод пользователя."""
+
+    def __init__(self, user_id: str, default_deck_id: str | None):
+        self.user_id = user_id
+        self.created = 0
+        self._ids: Dict[str, str] = {}
+        if default_deck_id:
+            self._ids[""] = default_deck_id
+
+    def resolve(self, names: Sequence[str]) -> Tuple[List[str], List[str]]:
+        unique = sorted(set(names))
+        missing = [name for name in unique if name not in self._ids]
+        if "" in missing:
+            raise ValueError("Не указана колода для строк без колонки deck")
+        if missing:
+            self._fetch_or_create(missing)
+        return unique, [self._ids[name] for name in unique]
+
+    def _fetch_or_create(self, names: List[str]) -> None:
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT DISTINCT ON (name) name, id
+                    FROM decks
+                    WHERE user_id = %s AND name = ANY(%s)
+                    ORDER BY name, created_at
+                    """,
+                    (self.user_id, names),
+                )
+                found = {name: str(deck_id) for name, deck_id in cur.fetchall()}
+                new_names = [name for name in names if name not in found]
+                if new_names:
+                    cur.execute(
+                        "INSERT INTO decks(user_id, name) SELECT %s, unnest(%s::text[]) RETURNING name, id",
+                        (self.user_id, new_names),
+                    )
+                    found.update({name: str(deck_id) for name, deck_id in cur.fetchall()})
+                    self.created += len(new_names)
+            conn.commit()
+        self._ids.update(found)
+
+
+class _ChunkLoader:
+    """Потоки, загружающие готовые пачки через отдельные соединения пула."""
+
+    def __init__(self, user_id: str, parallel: int, on_progress: Callable[[int], None] | None):
+        self.user_id = user_id
+        self.on_progress = on_progress
+        self.rows = 0
+        self.chunks = 0
+        self.error: Optional[BaseException] = None
+        self._lock = threading.Lock()
+        self._tasks: "queue.Queue[Optional[Tuple[bytes, int, List[str], List[str]]]]" = queue.Queue(
+            maxsize=parallel * 2
+        )
+        self._threads = [
+            threading.Thread(target=self._run, name=f"import-loader-{index}", daemon=True)
+            for index in range(parallel)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def put(self, task: Tuple[bytes, int, List[str], List[str]]) -> None:
+        while True:
+            if self.error is not None:
+                raise self.error
+            try:
+                self._tasks.put(task, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def close(self) -> None:
+        for _ in self._threads:
+            self._tasks.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    def _run(self) -> None:
+        while True:
+            task = self._tasks.get()
+            if task is None:
+                return
+            if self.error is not None:
+                # после ошибки оставшиеся пачки только вычитываются из очереди
+                continue
+            data, rows, deck_names, deck_ids = task
+            try:
+                _load_chunk(self.user_id, data, deck_names, deck_ids)
+            except Exception as exc:
+                with self._lock:
+                    if self.error is None:
+                        self.error = exc
+                continue
+            with self._lock:
+                self.rows += rows
+                self.chunks += 1
+                loaded = self.rows
+            if self.on_progress is not None:
+                self.on_progress(loaded)
+
+
+def _load_chunk(user_id: str, data: bytes, deck_names: List[str], deck_ids: List[str]) -> None:
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(_STAGE_SQL)
+            cur.copy_expert("COPY import_stage (deck_name, front, back, tags) FROM STDIN", io.BytesIO(data))
+            cur.execute(_INSERT_TAGS_SQL)
+            cur.execute(_INSERT_NOTES_SQL, (user_id, deck_names, deck_ids))
+            cur.execute(_INSERT_NOTE_TAGS_SQL)
+            cur.execute(_INSERT_CARDS_SQL, (user_id,))
+            cur.execute(_INSERT_CARD_STATE_SQL, (user_id,))
+        conn.commit()
+
+
+@contextmanager
+def _read_source(
+    path: Path,
+    delimiter: str | None,
+    tag_separator: str | None,
+    chunk_size: int,
+    has_default_deck: bool,
+) -> Iterator[Tuple[str, Dict[str, Any], Iterator[List[Any]]]]:
+    """Открывает файл и отдаёт тип источника, параметры разбора и пачки записей."""
+    if path.suffix.lower() == ".apkg":
+        with _open_anki_collection(path) as collection:
+            options = {"tag_separator": tag_separator, "strip_html": True}
+            yield "anki", options, _anki_chunks(collection, chunk_size)
+        return
+
+    if delimiter is None:
+        delimiter = "\t" if path.suffix.lower() in (".tsv", ".txt") else ","
+    with open(path, newline="", encoding="utf-8-sig") as source:
+        reader = csv.reader(source, delimiter=delimiter)
+        first = next(reader, None)
+        if first is None:
+            yield "csv", {}, iter(())
+            return
+        header = [cell.strip().lower() for cell in first]
+        if "front" in header and "back" in header:
+            columns = {name: header.index(name) for name in CSV_COLUMNS if name in header}
+            head: List[List[str]] = []
+        else:
+            columns = {name: index for index, name in enumerate(CSV_COLUMNS)}
+            head = [first]
+        if not has_default_deck and "deck" not in columns:
+            raise ValueError("Не указана колода для строк без колонки deck")
+        options = {"columns": columns, "tag_separator": tag_separator or ",", "strip_html": False}
+        yield "csv", options, _csv_chunks(head, reader, chunk_size)
+
+
+def _csv_chunks(head: List[List[str]], reader: Iterator[List[str]], chunk_size: int) -> Iterator[List[Any]]:
+    chunk: List[Any] = list(head)
+    for row in reader:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+@contextmanager
+def _open_anki_collection(path: Path) -> Iterator[sqlite3.Connection]:
+    """Распаковывает базу SQLite из .apkg во временный каталог."""
+    with zipfile.ZipFile(path) as archive:
+        names = set(archive.namelist())
+        member = next((name for name in ("collection.anki21", "collection.anki2") if name in names), None)
+        if member is None:
+            if "collection.anki21b" in names:
+                raise ValueError("Формат collection.anki21b не поддерживается: экспортируйте колоду в режиме совместимости")
+            raise ValueError("В архиве нет базы коллекции Anki")
+        with tempfile.TemporaryDirectory(prefix="anki-import-") as tmp_dir:
+            db_path = Path(tmp_dir) / member
+            with archive.open(member) as src, open(db_path, "wb") as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            collection = sqlite3.connect(db_path)
+            try:
+                yield collection
+            finally:
+                collection.close()
+
+
+def _anki_deck_names(collection: sqlite3.Connection) -> Dict[int, str]:
+    try:
+        rows = collection.execute("SELECT id, name FROM decks").fetchall()
+        return {deck_id: name.replace("\x1f", "::") for deck_id, name in rows}
+    except sqlite3.OperationalError:
+        # старая схема: колоды хранятся в JSON в таблице col
+        (decks_json,) = collection.execute("SELECT decks FROM col").fetchone()
+        return {int(deck_id): deck["name"] for deck_id, deck in json.loads(decks_json).items()}
+
+
+def _anki_chunks(collection: sqlite3.Connection, chunk_size: int) -> Iterator[List[Any]]:
+    deck_names = _anki_deck_names(collection)
+    cursor = collection.execute(
+        """
+        SELECT n.flds, n.tags, (SELECT c.did FROM cards c WHERE c.nid = n.id ORDER BY c.ord LIMIT 1)
+        FROM notes n
+        ORDER BY n.id
+        """
+    )
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield [(fields, tags, deck_names.get(deck_id, "")) for fields, tags, deck_id in rows]
+
+
+def _encode_chunk(kind: str, records: List[Any], options: Dict[str, Any]) -> _EncodedChunk:
+    """Разбирает пачку записей в рабочем процессе и готовит данные для COPY."""
+    out = io.StringIO()
+    decks = set()
+    rows = skipped = 0
+    columns = options.get("columns", {})
+    tag_separator = options.get("tag_separator")
+    for record in records:
+        if kind == "anki":
+            fields_raw, tags_raw, deck = record
+            fields = fields_raw.split("\x1f")
+            front = fields[0]
+            back = fields[1] if len(fields) > 1 else ""
+        else:
+            front, back, tags_raw, deck = (
+                record[columns[name]] if name in columns and columns[name] < len(record) else ""
+                for name in CSV_COLUMNS
+            )
+        if options.get("strip_html"):
+            front, back = _strip_html(front), _strip_html(back)
+        front, back, deck = front.strip(), back.strip(), deck.strip()
+        if not front:
+            skipped += 1
+            continue
+        tags = _split_tags(tags_raw, tag_separator)
+        decks.add(deck)
+        out.write(_copy_field(deck))
+        out.write("\t")
+        out.write(_copy_field(front))
+        out.write("\t")
+        out.write(_copy_field(back))
+        out.write("\t")
+        out.write(_copy_field(_array_literal(tags)) if tags else "\\N")
+        out.write("\n")
+        rows += 1
+    return _EncodedChunk(data=out.getvalue().encode("utf-8"), rows=rows, skipped=skipped, decks=sorted(decks))
+
+
+def _split_tags(raw: str, separator: str | None) -> List[str]:
+    seen = set()
+    tags: List[str] = []
+    for tag in raw.split(separator):
+        tag = tag.strip()
+        if tag and tag.lower() not in seen:
+            seen.add(tag.lower())
+            tags.append(tag)
+    return tags
+
+
+def _strip_html(text: str) -> str:
+    return html.unescape(_HTML_TAG_RE.sub("", _HTML_BREAK_RE.sub("\n", text)))
+
+
+def _copy_field(value: str) -> str:
+    return value.replace("\x00", "").translate(_COPY_ESCAPES)
+
+
+def _array_literal(items: List[str]) -> str:
+    quoted = ('"' + item.replace("\\", "\\\\").replace('"', '\\"') + '"' for item in items)
+    return "{" + ",".join(quoted) + "}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", type=Path)
+    parser.add_argument("--email", required=True, help="пользователь, которому добавляются карточки")
+    parser.add_argument("--deck", help="колода для строк без колонки deck (создаётся при отсутствии)")
+    parser.add_argument("--delimiter", help="разделитель CSV (по умолчанию по расширению файла)")
+    parser.add_argument("--tag-separator", help="разделитель тегов (CSV: «,», Anki: пробел)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, help="процессов разбора (по умолчанию по числу ядер)")
+    parser.add_argument("--parallel", type=int, default=IMPORT_PARALLEL, help="параллельных соединений загрузки")
+    args = parser.parse_args()
+
+    user = models.get_or_create_user(args.email)
+    deck_id = None
+    if args.deck:
+        decks = {deck["name"]: deck["id"] for deck in models.list_decks(user["id"])}
+        deck_id = decks.get(args.deck) or models.create_deck(user["id"], args.deck)["id"]
+
+    def report(rows: int) -> None:
+        print(f"\rзагружено строк: {rows:,}", end="", flush=True)
+
+    result = import_file(
+        args.path,
+        user["id"],
+        deck_id=str(deck_id) if deck_id else None,
+        delimiter=args.delimiter,
+        tag_separator=args.tag_separator,
+        chunk_size=args.chunk_size,
+        workers=args.workers,
+        parallel=args.parallel,
+        on_progress=report,
+    )
+    print(
+        f"\nимпортировано {result.rows:,} строк ({result.skipped:,} пропущено, "
+        f"колод создано: {result.decks_created}) за {result.seconds:.1f} с — "
+        f"{result.rows_per_second:,.0f} строк/с"
+    )
+
+
+if __name__ == "__main__":
+    main()
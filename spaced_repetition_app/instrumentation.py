@@ -0,0 +1,385 @@
+"""Замеры времени запросов слоя данных и журнал медленных запросов."""
+from __future__ import annotations
+
+import bisect
+import functools
+import json
+import logging
+import os
+import re
+import signal
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple, Type
+
+from dotenv import load_dotenv
+from psycopg2 import extensions
+
+load_dotenv()
+
+INSTRUMENT = os.getenv("DB_INSTRUMENT", "1") != "0"
+SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "200"))
+SLOW_QUERY_LOG = os.getenv(
+    "DB_SLOW_QUERY_LOG", str(Path.home() / ".spaced_repetition" / "slow_queries.log")
+)
+STATS_DUMP_PATH = Path(
+    os.getenv("DB_STATS_DUMP", str(Path.home() / ".spaced_repetition" / "db_stats.json"))
+)
+
+# верхние границы корзин гистограмм в миллисекундах
+BUCKETS_MS: Tuple[float, ...] = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, float("inf"))
+
+# запросы вне функций models учитываются под этим именем
+OUTSIDE_CALL = "<другое>"
+
+_SQL_SPACES_RE = re.compile(r"\s+")
+_SQL_LOG_LIMIT = 1000
+
+slow_log = logging.getLogger("spaced_repetition.slow_queries")
+
+
+class Histogram:
+    """Гистограмма длительностей с фиксированными корзинами."""
+
+    def __init__(self) -> None:
+        self.counts = [0] * len(BUCKETS_MS)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, ms: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, fraction: float) -> float:
+        """Верхняя граница корзины, в которую попадает заданная доля замеров."""
+        if not self.count:
+            return 0.0
+        threshold = fraction * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS_MS, self.counts):
+            seen += count
+            if seen >= threshold:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "avg_ms": self.total_ms / self.count if self.count else 0.0,
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99),
+            "max_ms": self.max_ms,
+        }
+
+
+@dataclass
+class _FunctionStats:
+    calls: int = 0
+    errors: int = 0
+    statements: int = 0
+    rows: int = 0
+    total: Histogram = field(default_factory=Histogram)
+    acquire: Histogram = field(default_factory=Histogram)
+    execute: Histogram = field(default_factory=Histogram)
+    fetch: Histogram = field(default_factory=Histogram)
+
+
+@dataclass
+class _Call:
+    name: str
+    acquire_ms: float = 0.0
+    execute_ms: float = 0.0
+    fetch_ms: float = 0.0
+    statements: int = 0
+    rows: int = 0
+
+
+_stats: Dict[str, _FunctionStats] = {}
+_stats_lock = threading.Lock()
+_local = threading.local()
+
+
+def _current() -> Optional[_Call]:
+    stack = getattr(_local, "stack", None)
+    return stack[-1] if stack else None
+
+
+def _function_stats(name: str) -> _FunctionStats:
+    stats = _stats.get(name)
+    if stats is None:
+        stats = _stats[name] = _FunctionStats()
+    return stats
+
+
+def timed(name: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """Декоратор функции слоя данных: суммирует замеры её запросов под name."""
+
+    def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            stack = getattr(_local, "stack", None)
+            if stack is None:
+                stack = _local.stack = []
+            call = _Call(name)
+            stack.append(call)
+            started = time.perf_counter()
+            failed = False
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                failed = True
+                raise
+            finally:
+                stack.pop()
+                total_ms = (time.perf_counter() - started) * 1000
+                with _stats_lock:
+                    stats = _function_stats(name)
+                    stats.calls += 1
+                    stats.errors += int(failed)
+                    stats.statements += call.statements
+                    stats.rows += call.rows
+                    stats.total.add(total_ms)
+                    if call.statements:
+                        stats.acquire.add(call.acquire_ms)
+                        stats.execute.add(call.execute_ms)
+                        stats.fetch.add(call.fetch_ms)
+
+        return wrapper
+
+    return decorator
+
+
+def instrument_module(namespace: Dict[str, Any], module: str) -> None:
+    """Оборачивает timed() все публичные функции, определённые в модуле."""
+    for name, value in list(namespace.items()):
+        if name.startswith("_") or not callable(value) or getattr(value, "__module__", None) != module:
+            continue
+        if isinstance(value, type):
+            continue
+        namespace[name] = timed(f"{module}.{name}")(value)
+
+
+def record_acquire(seconds: float) -> None:
+    """Учитывает ожидание соединения из пула в текущем вызове."""
+    call = _current()
+    if call is not None:
+        call.acquire_ms += seconds * 1000
+
+
+def _record_statement(sql: Any, params: Any, seconds: float, rows: int, cursor: Any = None) -> None:
+    ms = seconds * 1000
+    call = _current()
+    if call is not None:
+        call.execute_ms += ms
+        call.statements += 1
+        call.rows += max(rows, 0)
+    else:
+        with _stats_lock:
+            stats = _function_stats(OUTSIDE_CALL)
+            stats.calls += 1
+            stats.statements += 1
+            stats.rows += max(rows, 0)
+            stats.total.add(ms)
+            stats.execute.add(ms)
+    if ms >= SLOW_QUERY_MS:
+        slow_log.warning(
+            "%.1f мс в %s: %s | параметры: %s",
+            ms,
+            call.name if call is not None else OUTSIDE_CALL,
+            _sql_text(sql, cursor),
+            params_shape(params),
+        )
+
+
+def _record_fetch(seconds: float) -> None:
+    call = _current()
+    if call is not None:
+        call.fetch_ms += seconds * 1000
+
+
+def params_shape(params: Any) -> str:
+    """Описание параметров без значений: типы и длины коллекций."""
+    if params is None:
+        return "-"
+    if isinstance(params, dict):
+        return "{" + ", ".join(f"{key}: {params_shape(value)}" for key, value in params.items()) + "}"
+    if isinstance(params, (list, tuple)):
+        if params and all(not isinstance(value, (list, tuple, dict)) for value in params) and len(params) > 8:
+            return f"{type(params).__name__}[{len(params)}]"
+        inner = ", ".join(_value_shape(value) for value in params)
+        return f"({inner})"
+    return _value_shape(params)
+
+
+def _value_shape(value: Any) -> str:
+    if isinstance(value, (list, tuple)):
+        return f"{type(value).__name__}[{len(value)}]"
+    if isinstance(value, dict):
+        return params_shape(value)
+    if isinstance(value, (str, bytes)):
+        return f"{type(value).__name__}({len(value)})"
+    return type(value).__name__
+
+
+def _sql_text(sql: Any, cursor: Any = None) -> str:
+    if isinstance(sql, bytes):
+        sql = sql.decode("utf-8", "replace")
+    elif not isinstance(sql, str):
+        # psycopg2.sql.Composed раскрывается только через курсор или соединение
+        try:
+            sql = sql.as_string(cursor) if cursor is not None else repr(sql)
+        except Exception:
+            sql = repr(sql)
+    text = _SQL_SPACES_RE.sub(" ", sql).strip()
+    return text if len(text) <= _SQL_LOG_LIMIT else text[:_SQL_LOG_LIMIT] + "…"
+
+
+class _TimingCursorMixin:
+    """Замеряет execute/fetch курсора и передаёт результаты в текущий вызов."""
+
+    def execute(self, query: Any, vars: Any = None) -> Any:
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            _record_statement(query, vars, time.perf_counter() - started, self.rowcount, self)
+
+    def executemany(self, query: Any, vars_list: Any) -> Any:
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            _record_statement(query, None, time.perf_counter() - started, self.rowcount, self)
+
+    def copy_expert(self, sql: Any, file: Any, size: int = 8192) -> Any:
+        started = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            _record_statement(sql, None, time.perf_counter() - started, self.rowcount, self)
+
+    def fetchone(self) -> Any:
+        started = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            _record_fetch(time.perf_counter() - started)
+
+    def fetchmany(self, size: Optional[int] = None) -> Any:
+        started = time.perf_counter()
+        try:
+            return super().fetchmany(size) if size is not None else super().fetchmany()
+        finally:
+            _record_fetch(time.perf_counter() - started)
+
+    def fetchall(self) -> Any:
+        started = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            _record_fetch(time.perf_counter() - started)
+
+
+_cursor_classes: Dict[type, type] = {}
+_cursor_classes_lock = threading.Lock()
+
+
+def _instrumented_cursor(factory: Type[extensions.cursor]) -> type:
+    with _cursor_classes_lock:
+        cls = _cursor_classes.get(factory)
+        if cls is None:
+            cls = type(f"Timed{factory.__name__}", (_TimingCursorMixin, factory), {})
+            _cursor_classes[factory] = cls
+        return cls
+
+
+class InstrumentedConnection(extensions.connection):
+    """Соединение, все курсоры которого замеряют время запросов."""
+
+    def cursor(self, *args: Any, **kwargs: Any) -> extensions.cursor:
+        factory = kwargs.get("cursor_factory") or self.cursor_factory or extensions.cursor
+        kwargs["cursor_factory"] = _instrumented_cursor(factory)
+        return super().cursor(*args, **kwargs)
+
+
+def snapshot() -> Dict[str, Dict[str, Any]]:
+    """Сводка по функциям: вызовы, ошибки, строки и перцентили длительностей."""
+    with _stats_lock:
+        return {
+            name: {
+                "calls": stats.calls,
+                "errors": stats.errors,
+                "statements": stats.statements,
+                "rows": stats.rows,
+                "total": stats.total.summary(),
+                "acquire": stats.acquire.summary(),
+                "execute": stats.execute.summary(),
+                "fetch": stats.fetch.summary(),
+            }
+            for name, stats in sorted(_stats.items())
+        }
+
+
+def reset() -> None:
+    with _stats_lock:
+        _stats.clear()
+
+
+def dump_stats(path: Path | None = None, extra: Dict[str, Any] | None = None) -> Path:
+    """Записывает сводку в JSON-файл и возвращает его путь."""
+    path = path or STATS_DUMP_PATH
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data: Dict[str, Any] = {
+        "dumped_at": datetime.now(timezone.utc).isoformat(),
+        "slow_query_ms": SLOW_QUERY_MS,
+        "buckets_ms": [bound if bound != float("inf") else None for bound in BUCKETS_MS],
+        "functions": snapshot(),
+    }
+    if extra:
+        data.update(extra)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    tmp_path.write_text(json.dumps(data, ensure_ascii=False, indent=2, default=str), encoding="utf-8")
+    os.replace(tmp_path, path)
+    return path
+
+
+def configure_slow_log(path: str | None = SLOW_QUERY_LOG) -> None:
+    """Направляет журнал медленных запросов в файл (пустой путь — в stderr)."""
+    if slow_log.handlers:
+        return
+    if path:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        handler: logging.Handler = logging.FileHandler(path, encoding="utf-8")
+    else:
+        handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    slow_log.addHandler(handler)
+    slow_log.setLevel(logging.WARNING)
+    slow_log.propagate = False
+
+
+def install_signal_handler(extra: Callable[[], Dict[str, Any]] | None = None) -> bool:
+    """Сохраняет сводку в STATS_DUMP_PATH по сигналу SIGUSR1 (где он есть).
+
+    Обработчик сигнала выполняется в главном потоке (Tk) между инструкциями и
+    мог бы ждать блокировку, которую этот же поток уже держит. Поэтому он
+    только запускает поток, а сводка собирается уже в нём.
+    """
+    if not hasattr(signal, "SIGUSR1"):
+        return False
+
+    def dump() -> None:
+        dump_stats(extra=extra() if extra else None)
+
+    def handler(_signum: int, _frame: Any) -> None:
+        threading.Thread(target=dump, name="stats-dump", daemon=True).start()
+
+    signal.signal(signal.SIGUSR1, handler)
+    return True
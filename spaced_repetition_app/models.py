@@ -1,18 +1,61 @@
 """Слой доступа к данным и сервисные функции."""
 from __future__ import annotations
 
-from typing import Any, Dict, Iterable, List, Optional
+import os
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
-from psycopg2 import sql
+from psycopg2 import errors, sql
 from psycopg2.extras import RealDictCursor
 
+import instrumentation
+import prepared
+import scheduler
 from db import get_connection
+from query_cache import QueryCache
+
+_cache = QueryCache()
+
+# на сколько месяцев вперёд заранее создаются разделы reviews
+REVIEW_PARTITIONS_AHEAD = int(os.getenv("REVIEW_PARTITIONS_AHEAD", "3"))
+# сколько дней хранятся записи об удалениях для синхронизации локальных копий
+SYNC_DELETIONS_KEEP_DAYS = int(os.getenv("SYNC_DELETIONS_KEEP_DAYS", "30"))
+
+# идентификаторы тегов по имени в нижнем регистре: теги общие и не удаляются
+_TAG_CACHE_SIZE = 10_000
+_tag_ids: Dict[str, str] = {}
+_tag_lock = threading.Lock()
+
+
+def _user_tags(*domains: str):
+    """Теги кэша для данных пользователя из аргумента user_id."""
+    return lambda args: [f"{domain}:{args['user_id']}" for domain in domains]
+
+
+def cache_stats() -> Dict[str, Any]:
+    """Статистика кэша запросов (попадания, промахи, размер)."""
+    return _cache.stats()
+
+
+def invalidate_user(user_id: str | None = None) -> None:
+    """Сбрасывает кэш пользователя (или весь кэш) после изменений в обход models."""
+    if user_id is None:
+        _cache.clear()
+    else:
+        _cache.invalidate(f"decks:{user_id}", f"stats:{user_id}")
+
+
+def invalidate_users() -> None:
+    """Сбрасывает кэш списка пользователей после изменений в обход models."""
+    _cache.invalidate("users")
 
 
 def _dict_fetchall(cursor: RealDictCursor) -> List[Dict[str, Any]]:
     return [dict(row) for row in cursor.fetchall()]
 
 
+@_cache.invalidates(lambda _args: ["users"])
 def get_or_create_user(email: str) -> Dict[str, Any]:
     email = email.strip().lower()
     if not email:
@@ -27,6 +70,7 @@ def get_or_create_user(email: str) -> Dict[str, Any]:
             return dict(cur.fetchone())
 
 
+@_cache.cached(lambda _args: ["users"])
 def list_users() -> List[Dict[str, Any]]:
     with get_connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
@@ -34,27 +78,38 @@ def list_users() -> List[Dict[str, Any]]:
             return _dict_fetchall(cur)
 
 
+prepared.register(
+    "list_decks",
+    """
+    SELECT d.id,
+           d.name,
+           d.description,
+           COALESCE(ds.total_cards, 0) AS total_cards,
+           COALESCE(ds.learned_cards, 0) AS learned_cards,
+           COALESCE(due.cards, 0) AS due_now
+    FROM decks d
+    LEFT JOIN deck_stats ds ON ds.deck_id = d.id
+    LEFT JOIN LATERAL (
+        SELECT SUM(b.cards)::integer AS cards
+        FROM deck_due_buckets b
+        WHERE b.deck_id = d.id AND b.due_day <= utc_day(now())
+    ) due ON true
+    WHERE d.user_id = %s
+    ORDER BY d.created_at
+    """,
+    ("uuid",),
+)
+
+
+@_cache.cached(_user_tags("decks"))
 def list_decks(user_id: str) -> List[Dict[str, Any]]:
     with get_connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(
-                """
-                SELECT d.id,
-                       d.name,
-                       d.description,
-                       COALESCE(dp.total_cards, 0) AS total_cards,
-                       COALESCE(dp.learned_cards, 0) AS learned_cards,
-                       COALESCE(dp.due_now, 0) AS due_now
-                FROM decks d
-                LEFT JOIN v_deck_progress dp ON dp.deck_id = d.id
-                WHERE d.user_id = %s
-                ORDER BY d.created_at
-                """,
-                (user_id,),
-            )
+            prepared.execute(cur, "list_decks", (user_id,))
             return _dict_fetchall(cur)
 
 
+@_cache.invalidates(_user_tags("decks"))
 def create_deck(user_id: str, name: str, description: str | None = None) -> Dict[str, Any]:
     with get_connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
@@ -67,6 +122,7 @@ def create_deck(user_id: str, name: str, description: str | None = None) -> Dict
             return deck
 
 
+@_cache.invalidates(_user_tags("decks"))
 def update_deck(deck_id: str, user_id: str, name: str, description: str | None) -> None:
     with get_connection() as conn:
         with conn.cursor() as cur:
@@ -77,6 +133,19 @@ def update_deck(deck_id: str, user_id: str, name: str, description: str | None)
             conn.commit()
 
 
+@_cache.invalidates(_user_tags("decks"))
+def set_deck_limits(deck_id: str, user_id: str, new_per_day: int | None, reviews_per_day: int | None) -> None:
+    """Дневные лимиты колоды для планировщика; None — лимит по умолчанию."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "UPDATE decks SET new_per_day = %s, reviews_per_day = %s WHERE id = %s AND user_id = %s",
+                (new_per_day, reviews_per_day, deck_id, user_id),
+            )
+            conn.commit()
+
+
+@_cache.invalidates(_user_tags("decks", "stats"))
 def delete_deck(deck_id: str, user_id: str) -> None:
     with get_connection() as conn:
         with conn.cursor() as cur:
@@ -84,50 +153,98 @@ def delete_deck(deck_id: str, user_id: str) -> None:
             conn.commit()
 
 
-def list_notes(
+# запрос полнотекстового поиска: русская морфология плюс точные словоформы
+_SEARCH_TSQUERY = "(websearch_to_tsquery('russian', %s) || websearch_to_tsquery('simple', %s))"
+_SEARCH_HEADLINE = "StartSel=«, StopSel=», MaxFragments=2, MaxWords=20, MinWords=5"
+
+
+def _note_filters(
     user_id: str,
-    deck_id: str | None = None,
-    tags: Iterable[str] | None = None,
-    search: str | None = None,
-) -> List[Dict[str, Any]]:
-    filters = [sql.SQL("n.user_id = %s")]
+    deck_id: str | None,
+    tags: Iterable[str] | None,
+    search: str | None,
+) -> Tuple[List[str], List[Any]]:
+    """Условия WHERE по заметкам (alias n) с параметрами %s."""
+    filters: List[str] = ["n.user_id = %s"]
     params: List[Any] = [user_id]
 
     if deck_id:
-        filters.append(sql.SQL("n.deck_id = %s"))
+        filters.append("n.deck_id = %s")
         params.append(deck_id)
     if search:
-        filters.append(sql.SQL("(n.front ILIKE %s OR n.back ILIKE %s)"))
-        params.extend([f"%{search}%", f"%{search}%"])
+        # tsvector-индекс находит слова, триграммный индекс подстроки
+        filters.append("(n.search_vector @@ " + _SEARCH_TSQUERY + " OR (n.front || ' ' || n.back) ILIKE %s)")
+        params.extend([search, search, f"%{search}%"])
     if tags:
         tag_list = list({t.strip().lower() for t in tags if t.strip()})
         if tag_list:
             filters.append(
-                sql.SQL(
-                    "n.id IN (SELECT nt.note_id FROM note_tags nt JOIN tags t ON t.id = nt.tag_id WHERE lower(t.name) = ANY(%s))"
-                )
+                "n.id IN (SELECT nt.note_id FROM note_tags nt JOIN tags t ON t.id = nt.tag_id WHERE lower(t.name) = ANY(%s))"
             )
             params.append(tag_list)
+    return filters, params
+
+
+def _search_columns(alias: str, search: str | None, highlight: bool) -> Tuple[str, List[Any]]:
+    """Колонки rank и snippet для поиска (пустые значения без поиска)."""
+    if not search:
+        return "0::float8 AS rank, NULL::text AS snippet", []
+    columns = "ts_rank({a}.search_vector, " + _SEARCH_TSQUERY + ")::float8 AS rank, "
+    params: List[Any] = [search, search]
+    if highlight:
+        columns += "ts_headline('russian', {a}.front || ' ' || {a}.back, " + _SEARCH_TSQUERY + ", %s) AS snippet"
+        params.extend([search, search, _SEARCH_HEADLINE])
+    else:
+        columns += "NULL::text AS snippet"
+    return columns.format(a=alias), params
+
+
+_LIST_NOTES_SQL = """
+    SELECT n.id,
+           n.deck_id,
+           n.front,
+           n.back,
+           n.updated_at,
+           d.name AS deck_name,
+           COALESCE(array_agg(DISTINCT t.name) FILTER (WHERE t.name IS NOT NULL), ARRAY[]::text[]) AS tags,
+           {columns}
+    FROM notes n
+    JOIN decks d ON d.id = n.deck_id
+    LEFT JOIN note_tags nt ON nt.note_id = n.id
+    LEFT JOIN tags t ON t.id = nt.tag_id
+    WHERE {where}
+    GROUP BY n.id, d.name
+    ORDER BY rank DESC, n.updated_at DESC
+"""
+
+
+def _list_notes_query(
+    user_id: str,
+    deck_id: str | None,
+    tags: Iterable[str] | None,
+    search: str | None,
+    highlight: bool,
+) -> Tuple[str, List[Any]]:
+    """Текст запроса list_notes с %s и его параметры (общий с async_models)."""
+    columns, params = _search_columns("n", search, highlight)
+    filters, filter_params = _note_filters(user_id, deck_id, tags, search)
+    params.extend(filter_params)
+    return _LIST_NOTES_SQL.format(columns=columns, where=" AND ".join(filters)), params
 
-    where_clause = sql.SQL(" AND ").join(filters)
-    query = sql.SQL(
-        """
-        SELECT n.id,
-               n.deck_id,
-               n.front,
-               n.back,
-               n.updated_at,
-               d.name AS deck_name,
-               COALESCE(array_agg(DISTINCT t.name) FILTER (WHERE t.name IS NOT NULL), ARRAY[]::text[]) AS tags
-        FROM notes n
-        JOIN decks d ON d.id = n.deck_id
-        LEFT JOIN note_tags nt ON nt.note_id = n.id
-        LEFT JOIN tags t ON t.id = nt.tag_id
-        WHERE {where}
-        GROUP BY n.id, d.name
-        ORDER BY n.updated_at DESC
-        """
-    ).format(where=where_clause)
+
+def list_notes(
+    user_id: str,
+    deck_id: str | None = None,
+    tags: Iterable[str] | None = None,
+    search: str | None = None,
+    highlight: bool = False,
+) -> List[Dict[str, Any]]:
+    """Заметки по фильтрам; при поиске упорядочены по релевантности.
+
+    С highlight=True в поле snippet возвращается фрагмент текста с
+    найденными словами в «кавычках».
+    """
+    query, params = _list_notes_query(user_id, deck_id, tags, search, highlight)
 
     with get_connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
@@ -135,19 +252,155 @@ def list_notes(
             return _dict_fetchall(cur)
 
 
+def list_notes_page(
+    user_id: str,
+    deck_id: str | None = None,
+    tags: Iterable[str] | None = None,
+    search: str | None = None,
+    after: Tuple[Any, ...] | None = None,
+    limit: int = 100,
+    highlight: bool = False,
+) -> Tuple[List[Dict[str, Any]], Tuple[Any, ...] | None]:
+    """Возвращает страницу заметок и курсор следующей.
+
+    Без поиска заметки идут по (updated_at, id) по убыванию, при поиске —
+    по (rank, updated_at, id). Курсор передаётся в after при запросе
+    следующей страницы; None означает, что страниц больше нет. Теги и
+    фрагменты с подсветкой вычисляются только для заметок страницы.
+    """
+    filters, params = _note_filters(user_id, deck_id, tags, search)
+
+    if search:
+        # ранг вычисляется для найденных заметок, курсор включает его
+        rank_columns, rank_params = _search_columns("n", search, highlight=False)
+        params = rank_params + params
+        keyset = sql.SQL("")
+        if after is not None:
+            keyset = sql.SQL("WHERE (s.rank, s.updated_at, s.id) < (%s, %s, %s::uuid)")
+            params.extend(after)
+        inner = sql.SQL(
+            """
+            SELECT s.* FROM (
+                SELECT n.id, n.deck_id, n.front, n.back, n.updated_at, {rank}
+                FROM notes n
+                WHERE {where}
+            ) s
+            {keyset}
+            ORDER BY s.rank DESC, s.updated_at DESC, s.id DESC
+            LIMIT %s
+            """
+        ).format(rank=sql.SQL(rank_columns), where=sql.SQL(" AND ".join(filters)), keyset=keyset)
+    else:
+        if after is not None:
+            filters.append("(n.updated_at, n.id) < (%s, %s::uuid)")
+            params.extend(after)
+        inner = sql.SQL(
+            """
+            SELECT n.id, n.deck_id, n.front, n.back, n.updated_at, 0::float8 AS rank
+            FROM notes n
+            WHERE {where}
+            ORDER BY n.updated_at DESC, n.id DESC
+            LIMIT %s
+            """
+        ).format(where=sql.SQL(" AND ".join(filters)))
+    params.append(limit)
+
+    snippet = sql.SQL("NULL::text AS snippet")
+    snippet_params: List[Any] = []
+    if search and highlight:
+        snippet = sql.SQL("ts_headline('russian', p.front || ' ' || p.back, " + _SEARCH_TSQUERY + ", %s) AS snippet")
+        snippet_params = [search, search, _SEARCH_HEADLINE]
+
+    query = sql.SQL(
+        """
+        SELECT p.id,
+               p.deck_id,
+               p.front,
+               p.back,
+               p.updated_at,
+               p.rank,
+               {snippet},
+               d.name AS deck_name,
+               COALESCE(tg.tags, ARRAY[]::text[]) AS tags
+        FROM ({inner}) p
+        JOIN decks d ON d.id = p.deck_id
+        LEFT JOIN LATERAL (
+            SELECT array_agg(t.name ORDER BY t.name) AS tags
+            FROM note_tags nt
+            JOIN tags t ON t.id = nt.tag_id
+            WHERE nt.note_id = p.id
+        ) tg ON true
+        ORDER BY p.rank DESC, p.updated_at DESC, p.id DESC
+        """
+    ).format(snippet=snippet, inner=inner)
+
+    with get_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(query, snippet_params + params)
+            rows = _dict_fetchall(cur)
+    next_cursor = None
+    if len(rows) == limit:
+        last = rows[-1]
+        if search:
+            next_cursor = (last["rank"], last["updated_at"], last["id"])
+        else:
+            next_cursor = (last["updated_at"], last["id"])
+    return rows, next_cursor
+
+
+def _resolve_tags(cur: Any, names: List[str] | None) -> Tuple[List[str], Dict[str, str]]:
+    """Идентификаторы тегов по именам: известные берутся из кэша процесса,
+    остальные находятся или создаются одним вызовом ensure_tags().
+
+    Новые пары возвращаются отдельно: в кэш они попадают только после COMMIT.
+    """
+    if not names:
+        return [], {}
+    with _tag_lock:
+        cached = {name: _tag_ids.get(name.lower()) for name in names}
+    found: Dict[str, str] = {}
+    missing = [name for name, tag_id in cached.items() if tag_id is None]
+    if missing:
+        cur.execute("SELECT tag_name, tag_id FROM ensure_tags(%s)", (missing,))
+        found = {name.lower(): str(tag_id) for name, tag_id in cur.fetchall()}
+    ids = {cached[name] or found.get(name.lower()) for name in names}
+    return sorted(tag_id for tag_id in ids if tag_id), found
+
+
+def _remember_tags(found: Dict[str, str]) -> None:
+    with _tag_lock:
+        if len(_tag_ids) + len(found) > _TAG_CACHE_SIZE:
+            _tag_ids.clear()
+        _tag_ids.update(found)
+
+
+def _forget_tags() -> None:
+    """Сбрасывает кэш тегов (например, если тег удалили в обход приложения)."""
+    with _tag_lock:
+        _tag_ids.clear()
+
+
+@_cache.invalidates(_user_tags("decks", "stats"))
 def create_note(user_id: str, deck_id: str, front: str, back: str, tags: Iterable[str] | None) -> str:
     tags_array = _prepare_tags(tags)
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                "SELECT add_note_with_card(%s, %s, %s, %s, %s)",
-                (user_id, deck_id, front, back, tags_array),
-            )
-            card_id = cur.fetchone()[0]
-            conn.commit()
-            return str(card_id)
+    try:
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                tag_ids, found = _resolve_tags(cur, tags_array)
+                cur.execute(
+                    "SELECT add_note_with_card_tag_ids(%s, %s, %s, %s, %s::uuid[])",
+                    (user_id, deck_id, front, back, tag_ids),
+                )
+                card_id = cur.fetchone()[0]
+                conn.commit()
+    except errors.ForeignKeyViolation:
+        _forget_tags()
+        raise
+    _remember_tags(found)
+    return str(card_id)
 
 
+@_cache.invalidates(_user_tags("decks", "stats"))
 def update_note(
     note_id: str,
     user_id: str,
@@ -157,25 +410,38 @@ def update_note(
     tags: Iterable[str] | None,
 ) -> None:
     tags_array = _prepare_tags(tags)
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                "UPDATE notes SET deck_id = %s, front = %s, back = %s WHERE id = %s AND user_id = %s",
-                (deck_id, front, back, note_id, user_id),
-            )
-            cur.execute("DELETE FROM note_tags WHERE note_id = %s", (note_id,))
-            if tags_array:
-                cur.execute(
-                    "SELECT ensure_tag(x) FROM unnest(%s) AS x",
-                    (tags_array,),
-                )
+    try:
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                tag_ids, found = _resolve_tags(cur, tags_array)
+                # снимаются только теги, которых больше нет; оставшиеся не переписываются
                 cur.execute(
-                    "INSERT INTO note_tags(note_id, tag_id) SELECT %s, t.id FROM tags t WHERE lower(t.name) = ANY(%s)",
-                    (note_id, [tag.lower() for tag in tags_array]),
+                    """
+                    WITH note AS (
+                        UPDATE notes SET deck_id = %s, front = %s, back = %s
+                        WHERE id = %s AND user_id = %s
+                        RETURNING id
+                    ), removed AS (
+                        DELETE FROM note_tags nt
+                        USING note
+                        WHERE nt.note_id = note.id AND nt.tag_id <> ALL(%s::uuid[])
+                    )
+                    INSERT INTO note_tags(note_id, tag_id)
+                    SELECT note.id, t.id
+                    FROM note
+                    CROSS JOIN unnest(%s::uuid[]) AS t(id)
+                    ON CONFLICT DO NOTHING
+                    """,
+                    (deck_id, front, back, note_id, user_id, tag_ids, tag_ids),
                 )
-            conn.commit()
+                conn.commit()
+    except errors.ForeignKeyViolation:
+        _forget_tags()
+        raise
+    _remember_tags(found)
 
 
+@_cache.invalidates(_user_tags("decks", "stats"))
 def delete_note(note_id: str, user_id: str) -> None:
     with get_connection() as conn:
         with conn.cursor() as cur:
@@ -184,34 +450,94 @@ def delete_note(note_id: str, user_id: str) -> None:
 
 
 def get_due_queue(user_id: str, deck_id: str | None = None, limit: int = 50) -> List[Dict[str, Any]]:
-    params: List[Any] = [user_id]
-    deck_filter = ""
-    if deck_id:
-        deck_filter = " AND dq.deck_id = %s"
-        params.append(deck_id)
-    query = (
-        "SELECT dq.card_id, dq.deck_id, dq.note_id, dq.front, dq.back, dq.due_at, dq.deck_name "
-        "FROM v_due_queue dq WHERE dq.user_id = %s AND dq.due_at <= now() + interval '7 days'"
-        + deck_filter
-        + " ORDER BY dq.due_at LIMIT %s"
-    )
-    params.append(limit)
+    """Карточки к показу с содержимым по плану scheduler: дневные лимиты колод,
+    чередование колод и новых карточек."""
+    return scheduler.build_session(user_id, deck_id, limit)
+
+
+def get_due_card_ids(
+    user_id: str,
+    deck_id: str | None = None,
+    limit: int = 50,
+    exclude: Iterable[str] | None = None,
+) -> List[Dict[str, Any]]:
+    """Возвращает только идентификаторы и сроки карточек к показу, без содержимого."""
+    return scheduler.build_session(user_id, deck_id, limit, exclude, content=False)
+
+
+def get_cards_content(user_id: str, card_ids: Iterable[str]) -> List[Dict[str, Any]]:
+    """Загружает содержимое карточек в порядке переданных идентификаторов."""
+    ids = list(card_ids)
+    if not ids:
+        return []
     with get_connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(query, params)
-            return _dict_fetchall(cur)
+            cur.execute(
+                """
+                SELECT c.id AS card_id, c.deck_id, n.id AS note_id, n.front, n.back, d.name AS deck_name
+                FROM cards c
+                JOIN notes n ON n.id = c.note_id
+                JOIN decks d ON d.id = c.deck_id
+                WHERE c.user_id = %s AND c.id = ANY(%s::uuid[])
+                """,
+                (user_id, ids),
+            )
+            by_id = {str(row["card_id"]): dict(row) for row in cur.fetchall()}
+    return [by_id[card_id] for card_id in ids if card_id in by_id]
 
 
+prepared.register(
+    "record_review",
+    "SELECT apply_sm2(%s::uuid, %s::uuid, %s::smallint)",
+    ("uuid", "uuid", "smallint"),
+)
+
+
+@_cache.invalidates(_user_tags("decks", "stats"))
 def record_review(user_id: str, card_id: str, quality: int) -> None:
     with get_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute(
-                "SELECT apply_sm2(%s::uuid, %s::uuid, %s::smallint)",
-                (user_id, card_id, quality),
-            )
+            prepared.execute(cur, "record_review", (user_id, card_id, quality))
             conn.commit()
 
 
+@_cache.invalidates(_user_tags("decks", "stats"))
+def record_reviews_bulk(user_id: str, reviews: Iterable[Dict[str, Any]]) -> int:
+    """Записывает много оценок пользователя одним вызовом apply_sm2_batch().
+
+    Каждая запись содержит card_id и quality, необязательно reviewed_at и
+    review_id. Возвращает число применённых оценок.
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            applied = _apply_sm2_batch(cur, user_id, list(reviews))
+            conn.commit()
+    return applied
+
+
+def record_journal_reviews(reviews: Iterable[Dict[str, Any]]) -> int:
+    """Записывает пачку оценок из локального журнала одной транзакцией.
+
+    Каждая запись содержит review_id, user_id, card_id, quality и reviewed_at;
+    уже записанные review_id сервер пропускает. Возвращает число применённых оценок.
+    """
+    by_user: Dict[str, List[Dict[str, Any]]] = {}
+    for review in reviews:
+        by_user.setdefault(review["user_id"], []).append(review)
+    applied = 0
+    try:
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                for user_id, user_reviews in by_user.items():
+                    applied += _apply_sm2_batch(cur, user_id, user_reviews)
+                conn.commit()
+    finally:
+        for user_id in by_user:
+            invalidate_user(user_id)
+    return applied
+
+
+@_cache.invalidates(_user_tags("decks", "stats"))
 def suspend_card(user_id: str, card_id: str, suspended: bool = True) -> None:
     with get_connection() as conn:
         with conn.cursor() as cur:
@@ -222,80 +548,184 @@ def suspend_card(user_id: str, card_id: str, suspended: bool = True) -> None:
             conn.commit()
 
 
+# due_now, как и у колод в list_decks: срок наступает не позже конца текущего дня (UTC)
+prepared.register(
+    "summary_cards",
+    """
+    WITH user_decks AS (
+        SELECT d.id FROM decks d WHERE d.user_id = %s
+    )
+    SELECT
+        COALESCE((
+            SELECT SUM(b.cards)
+            FROM deck_due_buckets b
+            JOIN user_decks d ON d.id = b.deck_id
+            WHERE b.due_day <= utc_day(now())
+        ), 0)::integer AS due_now,
+        COALESCE((
+            SELECT SUM(ds.learned_cards)
+            FROM deck_stats ds
+            JOIN user_decks d ON d.id = ds.deck_id
+        ), 0)::integer AS learned
+    """,
+    ("uuid",),
+)
+prepared.register(
+    "summary_reviews",
+    """
+    SELECT
+        COALESCE(SUM(reviews) FILTER (WHERE day = utc_day(now())), 0) AS reviewed_today,
+        COALESCE(
+            SUM(successes) FILTER (WHERE day > utc_day(now()) - 7)::numeric
+            / NULLIF(SUM(reviews) FILTER (WHERE day > utc_day(now()) - 7), 0),
+            0
+        ) AS success_7,
+        COALESCE(SUM(successes)::numeric / NULLIF(SUM(reviews), 0), 0) AS success_30
+    FROM daily_review_stats
+    WHERE user_id = %s AND day > utc_day(now()) - 30
+    """,
+    ("uuid",),
+)
+
+
+@_cache.cached(_user_tags("stats"))
 def get_summary_counts(user_id: str) -> Dict[str, Any]:
     with get_connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(
-                """
-                SELECT
-                    COALESCE(SUM(CASE WHEN due_at <= now() AND suspended = false THEN 1 ELSE 0 END), 0) AS due_now,
-                    COALESCE(SUM(CASE WHEN reps > 0 THEN 1 ELSE 0 END), 0) AS learned
-                FROM card_state
-                WHERE user_id = %s
-                """,
-                (user_id,),
-            )
+            prepared.execute(cur, "summary_cards", (user_id,))
             summary = dict(cur.fetchone())
-
-            cur.execute(
-                """
-                SELECT
-                    COALESCE(COUNT(*) FILTER (WHERE reviewed_at::date = CURRENT_DATE), 0) AS reviewed_today,
-                    COALESCE(AVG((quality >= 3)::int) FILTER (WHERE reviewed_at >= now() - interval '7 days'), 0) AS success_7,
-                    COALESCE(AVG((quality >= 3)::int) FILTER (WHERE reviewed_at >= now() - interval '30 days'), 0) AS success_30
-                FROM reviews
-                WHERE user_id = %s
-                """,
-                (user_id,),
-            )
+            prepared.execute(cur, "summary_reviews", (user_id,))
             rates = dict(cur.fetchone())
             summary.update(rates)
             return summary
 
 
+_DAILY_STATS_SQL = """
+    WITH span AS (
+        SELECT generate_series(
+            utc_day(now()) - (%s::int - 1),
+            utc_day(now()),
+            interval '1 day'
+        )::date AS day
+    )
+    SELECT
+        span.day,
+        COALESCE(s.reviews, 0) AS reviews_count,
+        COALESCE(s.successes::numeric / NULLIF(s.reviews, 0), 0) AS success_rate
+    FROM span
+    LEFT JOIN daily_review_stats s ON s.user_id = %s AND s.day = span.day
+    ORDER BY span.day
+"""
+
+
+@_cache.cached(_user_tags("stats"))
 def get_daily_stats(user_id: str, days: int = 30) -> List[Dict[str, Any]]:
     with get_connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(_DAILY_STATS_SQL, (days, user_id))
+            return _dict_fetchall(cur)
+
+
+_DECK_PROGRESS_SQL = """
+    SELECT d.id AS deck_id,
+           d.name,
+           COALESCE(ds.total_cards, 0) AS total_cards,
+           COALESCE(ds.learned_cards, 0) AS learned_cards,
+           COALESCE(due.cards, 0) AS due_now
+    FROM decks d
+    LEFT JOIN deck_stats ds ON ds.deck_id = d.id
+    LEFT JOIN LATERAL (
+        SELECT SUM(b.cards)::integer AS cards
+        FROM deck_due_buckets b
+        WHERE b.deck_id = d.id AND b.due_day <= utc_day(now())
+    ) due ON true
+    WHERE d.user_id = %s
+    ORDER BY d.created_at
+"""
+
+
+@_cache.cached(_user_tags("decks"))
+def get_deck_progress(user_id: str) -> List[Dict[str, Any]]:
+    with get_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(_DECK_PROGRESS_SQL, (user_id,))
+            return _dict_fetchall(cur)
+
+
+def rebuild_daily_review_stats(user_id: str | None = None) -> int:
+    """Пересчитывает дневные итоги повторений из reviews и возвращает число дней."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT daily_review_stats_rebuild(%s::uuid)", (user_id,))
+            days = cur.fetchone()[0]
+        conn.commit()
+    invalidate_user(user_id)
+    return days
+
+
+def ensure_review_partitions(
+    start: datetime | None = None, end: datetime | None = None, months_ahead: int | None = None
+) -> int:
+    """Создаёт месячные разделы reviews от start (по умолчанию сейчас) до end
+    или на months_ahead месяцев вперёд и возвращает число новых разделов."""
+    months = REVIEW_PARTITIONS_AHEAD if months_ahead is None else months_ahead
+    with get_connection() as conn:
+        with conn.cursor() as cur:
             cur.execute(
                 """
-                WITH span AS (
-                    SELECT generate_series(
-                        (CURRENT_DATE - (%s::int - 1))::date,
-                        CURRENT_DATE,
-                        interval '1 day'
-                    ) AS day
-                ), stats AS (
-                    SELECT
-                        (date_trunc('day', reviewed_at))::date AS day,
-                        COUNT(*) AS reviews_count,
-                        AVG(CASE WHEN quality >= 3 THEN 1.0 ELSE 0.0 END) AS success_rate
-                    FROM reviews
-                    WHERE user_id = %s AND reviewed_at >= (CURRENT_DATE - (%s::int - 1))
-                    GROUP BY 1
+                SELECT reviews_ensure_partitions(
+                    COALESCE(%s::timestamptz, now()),
+                    COALESCE(%s::timestamptz, now() + make_interval(months => %s))
                 )
-                SELECT
-                    span.day::date AS day,
-                    COALESCE(stats.reviews_count, 0) AS reviews_count,
-                    COALESCE(stats.success_rate, 0) AS success_rate
-                FROM span
-                LEFT JOIN stats ON stats.day = span.day::date
-                ORDER BY span.day
                 """,
-                (days, user_id, days),
+                (start, end, months),
             )
-            return _dict_fetchall(cur)
+            created = cur.fetchone()[0]
+        conn.commit()
+    return created
 
 
-def get_deck_progress(user_id: str) -> List[Dict[str, Any]]:
+def archive_review_partitions(before: datetime) -> List[str]:
+    """Отсоединяет разделы reviews за месяцы раньше before и переносит их в схему
+    reviews_archive. Дневная статистика за эти месяцы сохраняется."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT reviews_archive_partitions(%s)", (before,))
+            archived = [row[0] for row in cur.fetchall()]
+        conn.commit()
+    return archived
+
+
+def prune_sync_deletions(keep_days: int | None = None) -> int:
+    """Удаляет записи sync_deletions старше keep_days дней и возвращает их число."""
+    days = SYNC_DELETIONS_KEEP_DAYS if keep_days is None else keep_days
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT sync_deletions_prune(make_interval(days => %s))", (days,))
+            removed = cur.fetchone()[0]
+        conn.commit()
+    return removed
+
+
+def check_deck_stats(user_id: str | None = None) -> List[Dict[str, Any]]:
+    """Возвращает расхождения счётчиков колод с фактическими данными."""
     with get_connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(
-                "SELECT deck_id, name, total_cards, learned_cards, due_now FROM v_deck_progress WHERE user_id = %s",
-                (user_id,),
-            )
+            cur.execute("SELECT * FROM deck_stats_check(%s::uuid)", (user_id,))
             return _dict_fetchall(cur)
 
 
+def rebuild_deck_stats(user_id: str | None = None) -> int:
+    """Пересчитывает счётчики колод с нуля и возвращает число колод."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT deck_stats_rebuild(%s::uuid)", (user_id,))
+            decks = cur.fetchone()[0]
+        conn.commit()
+    invalidate_user(user_id)
+    return decks
+
+
 def get_note_details(note_id: str, user_id: str) -> Optional[Dict[str, Any]]:
     with get_connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
@@ -318,8 +748,116 @@ def get_note_details(note_id: str, user_id: str) -> Optional[Dict[str, Any]]:
             return dict(row) if row else None
 
 
+# таблицы локальной копии (offline_store) в порядке применения и их столбцы
+_SYNC_QUERIES: Tuple[Tuple[str, str], ...] = (
+    ("decks", "SELECT id, name, description FROM decks"),
+    ("notes", "SELECT id, deck_id, front, back, updated_at FROM notes"),
+    ("cards", "SELECT id, deck_id, note_id FROM cards"),
+    (
+        "card_state",
+        "SELECT card_id, ease_factor, interval_days, reps, lapses, due_at, last_reviewed_at, suspended FROM card_state",
+    ),
+    ("deletions", "SELECT entity, entity_id FROM sync_deletions"),
+)
+
+
+def iter_sync_changes(user_id: str, since: str = "0", batch_size: int = 5000) -> Iterator[Tuple[str, Any]]:
+    """Изменения данных пользователя для локальной копии, начиная с версии since.
+
+    Первым идёт ("horizon", xid): его нужно передать как since в следующий
+    раз. Если записи об удалениях после since уже удалены по сроку хранения,
+    затем идёт ("reset", True): копию нужно очистить, дальше следует полная
+    выгрузка. Затем пачками по batch_size строк идут decks, notes, cards,
+    card_state и deletions (entity, entity_id). Всё читается из одного
+    снимка, строки с change_xid >= since могут повторяться в соседних выгрузках.
+    """
+    with get_connection() as conn:
+        conn.set_session(isolation_level="REPEATABLE READ", readonly=True)
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_snapshot_xmin(pg_current_snapshot())::text")
+                yield "horizon", cur.fetchone()[0]
+                if since != "0":
+                    cur.execute("SELECT %s::xid8 <= pruned_xid FROM sync_retention", (since,))
+                    row = cur.fetchone()
+                    if row is not None and row[0]:
+                        yield "reset", True
+                        since = "0"
+            for table, query in _SYNC_QUERIES:
+                if table == "deletions" and since == "0":
+                    # первая выгрузка содержит только существующие строки
+                    continue
+                with conn.cursor(name=f"sync_{table}") as cur:
+                    cur.execute(query + " WHERE user_id = %s AND change_xid >= %s::xid8", (user_id, since))
+                    while True:
+                        rows = cur.fetchmany(batch_size)
+                        if not rows:
+                            break
+                        yield table, rows
+        finally:
+            conn.rollback()
+            conn.set_session(isolation_level="DEFAULT", readonly="DEFAULT")
+
+
+def apply_note_edits(user_id: str, edits: Iterable[Dict[str, Any]]) -> int:
+    """Применяет правки текста заметок, сделанные без связи с сервером.
+
+    Каждая правка содержит note_id, front, back и edited_at. Правка
+    применяется, только если заметка на сервере менялась раньше edited_at
+    (при равенстве остаётся серверная версия); из нескольких правок одной
+    заметки берётся последняя. Возвращает число изменённых заметок.
+    """
+    latest: Dict[str, Dict[str, Any]] = {}
+    for edit in edits:
+        previous = latest.get(edit["note_id"])
+        if previous is None or previous["edited_at"] <= edit["edited_at"]:
+            latest[edit["note_id"]] = edit
+    if not latest:
+        return 0
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                UPDATE notes n
+                SET front = e.front, back = e.back
+                FROM unnest(%s::uuid[], %s::text[], %s::text[], %s::timestamptz[]) AS e(id, front, back, edited_at)
+                WHERE n.id = e.id AND n.user_id = %s AND n.updated_at < e.edited_at
+                """,
+                (
+                    list(latest),
+                    [edit["front"] for edit in latest.values()],
+                    [edit["back"] for edit in latest.values()],
+                    [edit["edited_at"] for edit in latest.values()],
+                    user_id,
+                ),
+            )
+            updated = cur.rowcount
+            conn.commit()
+    return updated
+
+
+def _apply_sm2_batch(cur: Any, user_id: str, reviews: List[Dict[str, Any]]) -> int:
+    if not reviews:
+        return 0
+    cur.execute(
+        "SELECT apply_sm2_batch(%s::uuid, %s::uuid[], %s::smallint[], %s::timestamptz[], %s::uuid[])",
+        (
+            user_id,
+            [review["card_id"] for review in reviews],
+            [review["quality"] for review in reviews],
+            [review.get("reviewed_at") for review in reviews],
+            [review.get("review_id") for review in reviews],
+        ),
+    )
+    return int(cur.fetchone()[0])
+
+
 def _prepare_tags(tags: Iterable[str] | None) -> List[str] | None:
     if not tags:
         return None
     normalized = [tag.strip() for tag in tags if tag and tag.strip()]
     return list({t for t in normalized}) or None
+
+
+# замеры времени для всех публичных функций модуля
+instrumentation.instrument_module(globals(), __name__)
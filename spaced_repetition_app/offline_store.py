@@ -0,0 +1,485 @@
+"""Локальная копия данных пользователя в SQLite для работы без связи с сервером."""
+from __future__ import annotations
+
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+import models
+from sm2 import CardState, sm2
+
+OFFLINE_MODE = os.getenv("OFFLINE_MODE", "0") != "0"
+OFFLINE_DIR = Path(os.getenv("OFFLINE_DIR", str(Path.home() / ".spaced_repetition" / "offline")))
+SYNC_INTERVAL = float(os.getenv("OFFLINE_SYNC_INTERVAL", "60"))
+SYNC_BATCH_SIZE = int(os.getenv("OFFLINE_SYNC_BATCH", "5000"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS decks (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    description TEXT
+);
+CREATE TABLE IF NOT EXISTS notes (
+    id TEXT PRIMARY KEY,
+    deck_id TEXT NOT NULL REFERENCES decks(id) ON DELETE CASCADE,
+    front TEXT NOT NULL,
+    back TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cards (
+    id TEXT PRIMARY KEY,
+    deck_id TEXT NOT NULL REFERENCES decks(id) ON DELETE CASCADE,
+    note_id TEXT NOT NULL REFERENCES notes(id) ON DELETE CASCADE
+);
+CREATE TABLE IF NOT EXISTS card_state (
+    card_id TEXT PRIMARY KEY REFERENCES cards(id) ON DELETE CASCADE,
+    ease_factor REAL NOT NULL,
+    interval_days INTEGER NOT NULL,
+    reps INTEGER NOT NULL,
+    lapses INTEGER NOT NULL,
+    due_at TEXT NOT NULL,
+    last_reviewed_at TEXT,
+    suspended INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS outbox (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    entity_id TEXT NOT NULL,
+    payload TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_cards_deck ON cards (deck_id);
+CREATE INDEX IF NOT EXISTS idx_cards_note ON cards (note_id);
+CREATE INDEX IF NOT EXISTS idx_notes_deck ON notes (deck_id);
+CREATE INDEX IF NOT EXISTS idx_card_state_due ON card_state (suspended, due_at);
+CREATE INDEX IF NOT EXISTS idx_outbox_entity ON outbox (entity_id);
+"""
+
+# upsert строк сервера; строки с неотправленными локальными изменениями не трогаются
+_UPSERTS = {
+    "decks": """
+        INSERT INTO decks (id, name, description) VALUES (?, ?, ?)
+        ON CONFLICT (id) DO UPDATE SET name = excluded.name, description = excluded.description
+    """,
+    "notes": """
+        INSERT INTO notes (id, deck_id, front, back, updated_at) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (id) DO UPDATE SET
+            deck_id = excluded.deck_id,
+            front = excluded.front,
+            back = excluded.back,
+            updated_at = excluded.updated_at
+        WHERE NOT EXISTS (SELECT 1 FROM outbox WHERE entity_id = excluded.id)
+    """,
+    "cards": """
+        INSERT INTO cards (id, deck_id, note_id) VALUES (?, ?, ?)
+        ON CONFLICT (id) DO UPDATE SET deck_id = excluded.deck_id, note_id = excluded.note_id
+    """,
+    "card_state": """
+        INSERT INTO card_state (card_id, ease_factor, interval_days, reps, lapses, due_at, last_reviewed_at, suspended)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (card_id) DO UPDATE SET
+            ease_factor = excluded.ease_factor,
+            interval_days = excluded.interval_days,
+            reps = excluded.reps,
+            lapses = excluded.lapses,
+            due_at = excluded.due_at,
+            last_reviewed_at = excluded.last_reviewed_at,
+            suspended = excluded.suspended
+        WHERE NOT EXISTS (SELECT 1 FROM outbox WHERE entity_id = excluded.card_id)
+    """,
+}
+
+_DELETES = {
+    "decks": "DELETE FROM decks WHERE id = ?",
+    "notes": "DELETE FROM notes WHERE id = ?",
+    "cards": "DELETE FROM cards WHERE id = ?",
+}
+
+_store: "OfflineStore | None" = None
+_store_lock = threading.Lock()
+
+
+def _ts(value: datetime | None) -> str | None:
+    """Время в UTC с фиксированной длиной строки, чтобы строки сравнивались как даты."""
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f+00:00")
+
+
+def _next_utc_day() -> datetime:
+    """Начало следующего дня UTC: due_now, как на сервере, — срок не позже конца сегодняшнего дня."""
+    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    return today + timedelta(days=1)
+
+
+def _local_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return _ts(value)
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+
+class OfflineStore:
+    """Копия колод, заметок и состояний карточек пользователя в файле SQLite.
+
+    Повторения и правки записываются локально вместе с записью в outbox и
+    отправляются на сервер фоновым потоком по порядку seq; затем с сервера
+    забираются строки, изменённые после прошлой синхронизации. Конфликты
+    решаются так: оценки не теряются (сервер применяет каждую review_id один
+    раз к своему состоянию карточки), состояние карточек после отправки
+    берётся с сервера, правка текста заметки побеждает, только если сделана
+    позже последнего изменения на сервере. Строки с неотправленными
+    изменениями не перезаписываются данными сервера до их отправки.
+    """
+
+    def __init__(self, user: Dict[str, str], path: Path | None = None, sync_interval: float = SYNC_INTERVAL):
+        self.user_id = str(user["id"])
+        self.email = user["email"]
+        self.path = path or OFFLINE_DIR / f"{self.user_id}.sqlite3"
+        self.sync_interval = sync_interval
+        self.last_error: Optional[str] = None
+        self.last_sync_at: Optional[datetime] = None
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        # без fsync на каждую оценку: при сбое питания теряются только последние записи
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="offline-sync", daemon=True)
+        self._set_meta("email", self.email)
+
+    @property
+    def ready(self) -> bool:
+        """Копия хотя бы раз полностью загружена с сервера."""
+        return self._get_meta("synced_xid") is not None
+
+    @property
+    def pending_count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def request_sync(self) -> None:
+        self._wakeup.set()
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Останавливает поток синхронизации и делает последнюю попытку отправки."""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+        if self._sync_lock.acquire(timeout=timeout):
+            try:
+                self.push()
+            except Exception:
+                # изменения останутся в outbox до следующего запуска
+                pass
+            finally:
+                self._sync_lock.release()
+        with self._lock:
+            self._conn.close()
+
+    # --- чтение ---
+
+    def list_decks(self) -> List[Dict[str, Any]]:
+        due_before = _ts(_next_utc_day())
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT d.id, d.name, d.description,
+                       COUNT(c.id) AS total_cards,
+                       COALESCE(SUM(cs.reps > 0), 0) AS learned_cards,
+                       COALESCE(SUM(cs.suspended = 0 AND cs.due_at < ?), 0) AS due_now
+                FROM decks d
+                LEFT JOIN cards c ON c.deck_id = d.id
+                LEFT JOIN card_state cs ON cs.card_id = c.id
+                GROUP BY d.id
+                ORDER BY d.name
+                """,
+                (due_before,),
+            ).fetchall()
+        columns = ("id", "name", "description", "total_cards", "learned_cards", "due_now")
+        return [dict(zip(columns, row)) for row in rows]
+
+    def summary_counts(self) -> Dict[str, Any]:
+        """Счётчики главного окна, которые можно получить из локальной копии."""
+        now = datetime.now(timezone.utc)
+        today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        with self._lock:
+            due_now, learned, reviewed_today = self._conn.execute(
+                """
+                SELECT COALESCE(SUM(suspended = 0 AND due_at < ?), 0),
+                       COALESCE(SUM(reps > 0), 0),
+                       COALESCE(SUM(last_reviewed_at >= ?), 0)
+                FROM card_state
+                """,
+                (_ts(_next_utc_day()), _ts(today)),
+            ).fetchone()
+        # доля успешных ответов по истории ревью локально не хранится
+        return {"reviewed_today": reviewed_today, "due_now": due_now, "learned": learned, "success_7": 0, "success_30": 0}
+
+    def get_due_cards(
+        self,
+        deck_id: str | None = None,
+        limit: int = 50,
+        exclude: Iterable[str] | None = None,
+    ) -> List[Dict[str, Any]]:
+        """Карточки к показу с содержимым, как get_due_card_ids() + get_cards_content().
+
+        Запасной вариант на время без связи: только карточки, срок которых
+        наступил, по сроку; дневные лимиты и чередование колод планировщика
+        сервера (scheduler.py) здесь не применяются.
+        """
+        excluded = list(exclude or [])
+        query = """
+            SELECT c.id, c.deck_id, n.id, n.front, n.back, d.name, cs.due_at
+            FROM card_state cs
+            JOIN cards c ON c.id = cs.card_id
+            JOIN notes n ON n.id = c.note_id
+            JOIN decks d ON d.id = c.deck_id
+            WHERE cs.suspended = 0 AND cs.due_at <= ?
+        """
+        params: List[Any] = [_ts(datetime.now(timezone.utc))]
+        if deck_id:
+            query += " AND c.deck_id = ?"
+            params.append(str(deck_id))
+        if excluded:
+            query += f" AND c.id NOT IN ({', '.join('?' * len(excluded))})"
+            params.extend(excluded)
+        query += " ORDER BY cs.due_at LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        columns = ("card_id", "deck_id", "note_id", "front", "back", "deck_name", "due_at")
+        return [dict(zip(columns, row)) for row in rows]
+
+    # --- локальные изменения ---
+
+    def record_review(self, card_id: str, quality: int) -> str:
+        """Применяет оценку по SM-2 к локальному состоянию и ставит её в outbox."""
+        if quality < 0 or quality > 5:
+            raise ValueError("Оценка качества должна быть между 0 и 5")
+        now = datetime.now(timezone.utc)
+        review_id = str(uuid.uuid4())
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT ease_factor, interval_days, reps, lapses FROM card_state WHERE card_id = ?",
+                (card_id,),
+            ).fetchone()
+            if row is None:
+                raise KeyError(f"Карточка {card_id} отсутствует в локальной копии")
+            state, _interval = sm2(CardState(*row), quality, now)
+            self._conn.execute(
+                """
+                UPDATE card_state
+                SET ease_factor = ?, interval_days = ?, reps = ?, lapses = ?,
+                    due_at = ?, last_reviewed_at = ?, suspended = 0
+                WHERE card_id = ?
+                """,
+                (
+                    round(state.ease_factor, 2),
+                    state.interval_days,
+                    state.reps,
+                    state.lapses,
+                    _ts(state.due_at),
+                    _ts(now),
+                    card_id,
+                ),
+            )
+            self._append(
+                "review",
+                card_id,
+                {"review_id": review_id, "card_id": card_id, "quality": quality, "reviewed_at": _ts(now)},
+            )
+        return review_id
+
+    def suspend(self, card_id: str, suspended: bool = True) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE card_state SET suspended = ? WHERE card_id = ?", (int(suspended), card_id))
+            self._append("suspend", card_id, {"card_id": card_id, "suspended": suspended})
+
+    def update_note(self, note_id: str, front: str, back: str) -> None:
+        """Сохраняет правку текста заметки до отправки на сервер."""
+        now = _ts(datetime.now(timezone.utc))
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE notes SET front = ?, back = ?, updated_at = ? WHERE id = ?",
+                (front, back, now, note_id),
+            )
+            self._append("note", note_id, {"note_id": note_id, "front": front, "back": back, "edited_at": now})
+
+    # --- синхронизация ---
+
+    def sync(self) -> Dict[str, int]:
+        """Отправляет outbox и забирает изменения сервера; возвращает число строк."""
+        with self._sync_lock:
+            pushed = self.push()
+            pulled = self.pull()
+        self.last_sync_at = datetime.now(timezone.utc)
+        return {"pushed": pushed, "pulled": pulled}
+
+    def push(self) -> int:
+        """Отправляет локальные изменения по порядку seq, подряд идущие одного вида — пачкой."""
+        pushed = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT seq, kind, payload FROM outbox ORDER BY seq LIMIT ?",
+                    (SYNC_BATCH_SIZE,),
+                ).fetchall()
+            if not rows:
+                return pushed
+            for kind, group in itertools.groupby(rows, key=lambda row: row[1]):
+                group = list(group)
+                self._send(kind, [json.loads(payload) for _seq, _kind, payload in group])
+                with self._lock, self._conn:
+                    self._conn.execute("DELETE FROM outbox WHERE seq <= ?", (group[-1][0],))
+                pushed += len(group)
+
+    def push_pending(self) -> int:
+        """Отправляет outbox вне фонового цикла, не пересекаясь с sync()."""
+        with self._sync_lock:
+            return self.push()
+
+    def pull(self) -> int:
+        """Забирает строки, изменённые на сервере после прошлой синхронизации."""
+        since = self._get_meta("synced_xid") or "0"
+        horizon: str | None = None
+        pulled = 0
+        for table, rows in models.iter_sync_changes(self.user_id, since, SYNC_BATCH_SIZE):
+            if table == "horizon":
+                horizon = rows
+                continue
+            if table == "reset":
+                # удаления за пропущенный период уже не хранятся: копия загружается заново
+                with self._lock, self._conn:
+                    self._conn.execute("DELETE FROM decks")
+                continue
+            with self._lock, self._conn:
+                if table == "deletions":
+                    for entity, entity_id in rows:
+                        if entity in _DELETES:
+                            self._conn.execute(_DELETES[entity], (str(entity_id),))
+                else:
+                    self._conn.executemany(
+                        _UPSERTS[table],
+                        [tuple(_local_value(value) for value in row) for row in rows],
+                    )
+            pulled += len(rows)
+        if horizon is not None:
+            self._set_meta("synced_xid", horizon)
+        return pulled
+
+    def _send(self, kind: str, entries: List[Dict[str, Any]]) -> None:
+        if kind == "review":
+            models.record_journal_reviews([{**entry, "user_id": self.user_id} for entry in entries])
+        elif kind == "suspend":
+            for entry in entries:
+                models.suspend_card(self.user_id, entry["card_id"], entry["suspended"])
+        elif kind == "note":
+            models.apply_note_edits(self.user_id, entries)
+        else:
+            raise ValueError(f"Неизвестный вид изменения: {kind}")
+
+    def _append(self, kind: str, entity_id: str, payload: Dict[str, Any]) -> None:
+        self._conn.execute(
+            "INSERT INTO outbox (kind, entity_id, payload) VALUES (?, ?, ?)",
+            (kind, entity_id, json.dumps(payload)),
+        )
+
+    def _get_meta(self, key: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+                (key, value),
+            )
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                self.sync()
+                self.last_error = None
+            except Exception as exc:
+                # сервер недоступен: повтор на следующем цикле
+                self.last_error = str(exc)
+            self._wakeup.wait(self.sync_interval)
+            self._wakeup.clear()
+
+
+def local_users() -> List[Dict[str, str]]:
+    """Пользователи, для которых на этом компьютере есть локальная копия."""
+    users: List[Dict[str, str]] = []
+    for path in sorted(OFFLINE_DIR.glob("*.sqlite3")):
+        try:
+            conn = sqlite3.connect(path)
+            try:
+                row = conn.execute("SELECT value FROM meta WHERE key = 'email'").fetchone()
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            continue
+        if row:
+            users.append({"id": path.stem, "email": row[0]})
+    return users
+
+
+def find_local_user(email: str) -> Optional[Dict[str, str]]:
+    email = email.strip().lower()
+    return next((user for user in local_users() if user["email"].lower() == email), None)
+
+
+def open_store(user: Dict[str, str]) -> Optional[OfflineStore]:
+    """Открывает локальную копию пользователя и запускает синхронизацию (если режим включён)."""
+    global _store
+    if not OFFLINE_MODE:
+        return None
+    with _store_lock:
+        if _store is not None and _store.user_id != str(user["id"]):
+            _store.close()
+            _store = None
+        if _store is None:
+            _store = OfflineStore(user)
+            _store.start()
+        return _store
+
+
+def get_store() -> Optional[OfflineStore]:
+    return _store
+
+
+def close_store() -> None:
+    global _store
+    with _store_lock:
+        if _store is not None:
+            _store.close()
+            _store = None
@@ -0,0 +1,136 @@
+"""Реестр серверных подготовленных запросов (PREPARE / EXECUTE)."""
+from __future__ import annotations
+
+import os
+import re
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Sequence, Tuple
+
+from psycopg2 import errors, extensions
+
+from db import connection_state
+
+PREPARED_STATEMENTS = os.getenv("DB_PREPARED_STATEMENTS", "1") != "0"
+
+_PLACEHOLDER_RE = re.compile(r"%(s|%)")
+
+
+@dataclass(frozen=True)
+class PreparedStatement:
+    """Запрос реестра: исходный текст с %s и его форма для PREPARE с $1..$n."""
+
+    name: str
+    sql: str
+    server_sql: str
+    params: int
+    types: Tuple[str, ...]
+
+    @property
+    def prepare_sql(self) -> str:
+        types = f" ({', '.join(self.types)})" if self.types else ""
+        return f"PREPARE {self.name}{types} AS {self.server_sql}"
+
+    @property
+    def execute_sql(self) -> str:
+        if not self.params:
+            return f"EXECUTE {self.name}"
+        return f"EXECUTE {self.name} ({', '.join(['%s'] * self.params)})"
+
+
+def to_server_sql(sql: str) -> Tuple[str, int]:
+    """Переводит текст с %s в форму сервера с $1..$n и возвращает число параметров."""
+    params = 0
+
+    def placeholder(match: "re.Match[str]") -> str:
+        nonlocal params
+        if match.group(1) == "%":
+            return "%"
+        params += 1
+        return f"${params}"
+
+    return _PLACEHOLDER_RE.sub(placeholder, sql), params
+
+
+class StatementRegistry:
+    """Готовит запросы один раз на соединение пула и выполняет их по имени.
+
+    Список подготовленных запросов хранится в данных соединения пула, поэтому
+    пересозданное соединение готовит запросы заново. Если сервер не знает
+    запрос (например, после DISCARD ALL), он готовится повторно, а вызов
+    повторяется, когда это безопасно: ошибка случилась в начале транзакции.
+    """
+
+    def __init__(self, enabled: bool = PREPARED_STATEMENTS):
+        self.enabled = enabled
+        self._statements: Dict[str, PreparedStatement] = {}
+        self._lock = threading.Lock()
+        self._counters = {"prepares": 0, "executes": 0, "reprepares": 0, "plain": 0}
+
+    def register(self, name: str, sql: str, types: Sequence[str] = ()) -> PreparedStatement:
+        """Добавляет запрос; sql записывается с %s, как для cursor.execute()."""
+        server_sql, params = to_server_sql(sql)
+        if types and len(types) != params:
+            raise ValueError(f"Запрос {name}: {params} параметров, но {len(types)} типов")
+        statement = PreparedStatement(
+            name=f"sr_{name}",
+            sql=sql,
+            server_sql=server_sql,
+            params=params,
+            types=tuple(types),
+        )
+        self._statements[name] = statement
+        return statement
+
+    def get(self, name: str) -> PreparedStatement:
+        return self._statements[name]
+
+    def execute(self, cur: extensions.cursor, name: str, params: Sequence[Any] = ()) -> None:
+        """Выполняет запрос реестра на курсоре; результат читается как обычно."""
+        statement = self._statements[name]
+        conn = cur.connection
+        state = connection_state(conn) if self.enabled else None
+        if state is None:
+            self._count("plain")
+            cur.execute(statement.sql, params)
+            return
+
+        prepared = state.setdefault("prepared", set())
+        at_start = conn.info.transaction_status == extensions.TRANSACTION_STATUS_IDLE
+        if statement.name not in prepared:
+            self._prepare(cur, statement, prepared)
+        try:
+            cur.execute(statement.execute_sql, params)
+        except errors.InvalidSqlStatementName:
+            prepared.discard(statement.name)
+            if not at_start:
+                raise
+            conn.rollback()
+            self._count("reprepares")
+            self._prepare(cur, statement, prepared)
+            cur.execute(statement.execute_sql, params)
+        self._count("executes")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"enabled": self.enabled, "statements": len(self._statements), **self._counters}
+
+    def _prepare(self, cur: extensions.cursor, statement: PreparedStatement, prepared: set) -> None:
+        cur.execute(statement.prepare_sql)
+        prepared.add(statement.name)
+        self._count("prepares")
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            self._counters[counter] += 1
+
+
+registry = StatementRegistry()
+
+
+def register(name: str, sql: str, types: Sequence[str] = ()) -> PreparedStatement:
+    return registry.register(name, sql, types)
+
+
+def execute(cur: extensions.cursor, name: str, params: Sequence[Any] = ()) -> None:
+    registry.execute(cur, name, params)
@@ -0,0 +1,202 @@
+"""Кэш результатов запросов в памяти процесса с TTL, LRU и сбросом по тегам."""
+from __future__ import annotations
+
+import copy
+import functools
+import inspect
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, Iterable, Mapping, Optional, Set, Tuple, TypeVar
+
+QUERY_CACHE_ENABLED = os.getenv("QUERY_CACHE", "1") != "0"
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "30"))
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "256"))
+
+TagsFunc = Callable[[Mapping[str, Any]], Iterable[str]]
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+@dataclass
+class _Entry:
+    value: Any
+    expires_at: float
+    tags: Tuple[str, ...]
+
+
+class QueryCache:
+    """Кэш «функция + аргументы → результат» для функций чтения.
+
+    Запись живёт не дольше ttl секунд; при превышении maxsize вытесняется
+    давно не использованная запись. Каждая запись помечается тегами (например,
+    «decks:<user_id>»), и функции записи сбрасывают записи по своим тегам.
+    Если тег сброшен во время выполнения запроса, результат не кэшируется.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = QUERY_CACHE_SIZE,
+        ttl: float = QUERY_CACHE_TTL,
+        enabled: bool = QUERY_CACHE_ENABLED,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.enabled = enabled and maxsize > 0 and ttl > 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._by_tag: Dict[str, Set[Hashable]] = {}
+        self._generations: Dict[str, int] = {}
+        self._epoch = 0
+        self._counters = {
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0,
+            "stale_skips": 0,
+        }
+
+    def cached(self, tags: TagsFunc, ttl: float | None = None) -> Callable[[F], F]:
+        """Декоратор функции чтения; tags получает словарь её аргументов."""
+
+        def decorator(func: F) -> F:
+            signature = inspect.signature(func)
+
+            @functools.wraps(func)
+            def wrapper(*args: Any, **kwargs: Any) -> Any:
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                key = _make_key(func.__qualname__, bound.arguments)
+                if key is None:
+                    return func(*args, **kwargs)
+                hit, value = self._get(key)
+                if hit:
+                    return copy.deepcopy(value)
+                entry_tags = tuple(tags(bound.arguments))
+                token = self._token(entry_tags)
+                value = func(*args, **kwargs)
+                self._set(key, value, entry_tags, token, self.ttl if ttl is None else ttl)
+                return copy.deepcopy(value)
+
+            return wrapper  # type: ignore[return-value]
+
+        return decorator
+
+    def invalidates(self, tags: TagsFunc) -> Callable[[F], F]:
+        """Декоратор функции записи: после вызова сбрасывает записи по тегам."""
+
+        def decorator(func: F) -> F:
+            signature = inspect.signature(func)
+
+            @functools.wraps(func)
+            def wrapper(*args: Any, **kwargs: Any) -> Any:
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.invalidate(*tags(bound.arguments))
+
+            return wrapper  # type: ignore[return-value]
+
+        return decorator
+
+    def invalidate(self, *tags: str) -> int:
+        """Удаляет записи с любым из тегов и возвращает их число."""
+        removed = 0
+        with self._lock:
+            for tag in tags:
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+                for key in list(self._by_tag.get(tag, ())):
+                    self._remove(key)
+                    removed += 1
+            self._counters["invalidations"] += removed
+        return removed
+
+    def clear(self) -> None:
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+            self._by_tag.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Счётчики попаданий, промахов, вытеснений и текущий размер кэша."""
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"]
+            return {
+                "enabled": self.enabled,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                **self._counters,
+                "hit_rate": self._counters["hits"] / lookups if lookups else 0.0,
+            }
+
+    def _get(self, key: Hashable) -> Tuple[bool, Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counters["misses"] += 1
+                return False, None
+            if entry.expires_at <= time.monotonic():
+                self._remove(key)
+                self._counters["expirations"] += 1
+                self._counters["misses"] += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+            return True, entry.value
+
+    def _token(self, tags: Tuple[str, ...]) -> Tuple[int, ...]:
+        with self._lock:
+            return (self._epoch, *(self._generations.get(tag, 0) for tag in tags))
+
+    def _set(self, key: Hashable, value: Any, tags: Tuple[str, ...], token: Tuple[int, ...], ttl: float) -> None:
+        with self._lock:
+            if (self._epoch, *(self._generations.get(tag, 0) for tag in tags)) != token:
+                # данные изменились, пока выполнялся запрос
+                self._counters["stale_skips"] += 1
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(value=value, expires_at=time.monotonic() + ttl, tags=tags)
+            for tag in tags:
+                self._by_tag.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._counters["evictions"] += 1
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry.tags:
+            keys = self._by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_tag[tag]
+
+
+def _make_key(name: str, arguments: Mapping[str, Any]) -> Optional[Hashable]:
+    try:
+        key = (name, _freeze(dict(arguments)))
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+def _freeze(value: Any) -> Hashable:
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(_freeze(v) for v in value)
+    return value
@@ -0,0 +1,255 @@
+"""Локальный журнал оценок с отложенной пакетной записью в PostgreSQL."""
+from __future__ import annotations
+
+import itertools
+import json
+import os
+import threading
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import models
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+JOURNAL_PATH = Path(
+    os.getenv("REVIEW_JOURNAL_PATH", str(Path.home() / ".spaced_repetition" / "review_journal.jsonl"))
+)
+WRITE_BEHIND = os.getenv("REVIEW_WRITE_BEHIND", "1") != "0"
+FLUSH_BATCH_SIZE = int(os.getenv("REVIEW_FLUSH_BATCH", "25"))
+FLUSH_INTERVAL = float(os.getenv("REVIEW_FLUSH_INTERVAL", "5"))
+
+_journal: "ReviewJournal | None" = None
+_journal_lock = threading.Lock()
+
+
+class ReviewJournal:
+    """Журнал оценок на диске, который фоновый поток сбрасывает в БД пачками.
+
+    Каждая оценка получает review_id на клиенте и до подтверждения сервером
+    хранится в файле (запись с fsync). Сброс выполняется при накоплении
+    batch_size оценок или раз в flush_interval секунд; записи, оставшиеся в
+    файле после сбоя, отправляются повторно при следующем запуске. Сервер
+    игнорирует уже записанные review_id, поэтому повтор безопасен.
+
+    Файл журнала принадлежит одному процессу: на время работы держится
+    исключительная блокировка файла <журнал>.lock. Если журнал занят другим
+    запущенным экземпляром, используется следующий свободный файл
+    (review_journal.1.jsonl и т. д.). При запуске записи из журналов, не
+    занятых ни одним процессом, переносятся в свой журнал.
+    """
+
+    def __init__(
+        self,
+        path: Path = JOURNAL_PATH,
+        batch_size: int = FLUSH_BATCH_SIZE,
+        flush_interval: float = FLUSH_INTERVAL,
+    ):
+        self.path = path
+        # файл, которым владеет этот процесс (path или path.N)
+        self.file_path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.last_error: Optional[str] = None
+
+        self._pending: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._file = None
+        self._lock_file = None
+        self._thread = threading.Thread(target=self._run, name="review-journal", daemon=True)
+
+    def start(self) -> None:
+        """Загружает неотправленные записи прошлого запуска и запускает поток."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            for slot in itertools.count():
+                self._lock_file = _try_lock(self._slot_path(slot))
+                if self._lock_file is not None:
+                    self.file_path = self._slot_path(slot)
+                    break
+            self._pending = self._read_entries(self.file_path)
+            self._file = open(self.file_path, "a", encoding="utf-8")
+            self._adopt_orphans()
+        self._thread.start()
+        if self._pending:
+            self._wakeup.set()
+
+    def append(self, user_id: str, card_id: str, quality: int) -> str:
+        """Сохраняет оценку в журнал и возвращает её review_id."""
+        if quality < 0 or quality > 5:
+            raise ValueError("Оценка качества должна быть между 0 и 5")
+        entry = {
+            "review_id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "card_id": card_id,
+            "quality": quality,
+            "reviewed_at": datetime.now(timezone.utc).isoformat(),
+        }
+        with self._lock:
+            self._file.write(json.dumps(entry) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._pending.append(entry)
+            pending = len(self._pending)
+        if pending >= self.batch_size:
+            self._wakeup.set()
+        return entry["review_id"]
+
+    @property
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def request_flush(self) -> None:
+        """Просит фоновый поток отправить накопленные оценки без ожидания."""
+        self._wakeup.set()
+
+    def flush(self) -> int:
+        """Отправляет все накопленные оценки и возвращает число применённых сервером."""
+        with self._flush_lock:
+            with self._lock:
+                batch = list(self._pending)
+            if not batch:
+                return 0
+            try:
+                applied = models.record_journal_reviews(batch)
+            except Exception as exc:
+                self.last_error = str(exc)
+                raise
+            self.last_error = None
+            with self._lock:
+                del self._pending[: len(batch)]
+                self._rewrite()
+            return applied
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Останавливает поток и делает последнюю попытку сброса."""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+        try:
+            self.flush()
+        except Exception:
+            # записи останутся в журнале до следующего запуска
+            pass
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if self._lock_file is not None:
+                self._lock_file.close()
+                self._lock_file = None
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if self._stopped.is_set():
+                break
+            try:
+                self.flush()
+            except Exception:
+                # ошибка сохранена в last_error, повтор на следующем цикле
+                pass
+
+    def _slot_path(self, slot: int) -> Path:
+        if slot == 0:
+            return self.path
+        return self.path.with_name(f"{self.path.stem}.{slot}{self.path.suffix}")
+
+    def _adopt_orphans(self) -> None:
+        """Переносит в свой журнал записи журналов, не занятых другими процессами."""
+        known = {entry.get("review_id") for entry in self._pending}
+        candidates = [self.path] + sorted(self.path.parent.glob(f"{self.path.stem}.*{self.path.suffix}"))
+        for path in candidates:
+            if path == self.file_path or not path.exists():
+                continue
+            lock_file = _try_lock(path)
+            if lock_file is None:
+                continue
+            try:
+                adopted = [e for e in self._read_entries(path) if e.get("review_id") not in known]
+                # сначала записи надёжно сохраняются у себя, затем чужой файл удаляется
+                for entry in adopted:
+                    self._file.write(json.dumps(entry) + "\n")
+                    known.add(entry.get("review_id"))
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._pending.extend(adopted)
+                path.unlink()
+            finally:
+                lock_file.close()
+
+    def _read_entries(self, path: Path) -> List[Dict[str, Any]]:
+        if not path.exists():
+            return []
+        entries: List[Dict[str, Any]] = []
+        with open(path, encoding="utf-8") as journal:
+            for line in journal:
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # недописанная строка после аварийного завершения
+                    continue
+        return entries
+
+    def _rewrite(self) -> None:
+        """Атомарно заменяет файл журнала оставшимися неотправленными записями."""
+        tmp_path = self.file_path.with_suffix(self.file_path.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as tmp:
+            for entry in self._pending:
+                tmp.write(json.dumps(entry) + "\n")
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        self._file.close()
+        os.replace(tmp_path, self.file_path)
+        self._file = open(self.file_path, "a", encoding="utf-8")
+
+
+def _try_lock(journal_path: Path):
+    """Открытый файл <journal_path>.lock с исключительной блокировкой или None, если он занят.
+
+    Файл блокировки не удаляется: иначе два процесса могли бы заблокировать
+    разные копии одного и того же имени.
+    """
+    lock_file = open(journal_path.with_name(journal_path.name + ".lock"), "a+b")
+    try:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+def get_journal() -> Optional[ReviewJournal]:
+    """Возвращает общий журнал процесса (None, если отложенная запись выключена)."""
+    global _journal
+    if not WRITE_BEHIND:
+        return None
+    with _journal_lock:
+        if _journal is None:
+            _journal = ReviewJournal()
+            _journal.start()
+        return _journal
+
+
+def close_journal() -> None:
+    """Сбрасывает и закрывает журнал при завершении работы."""
+    global _journal
+    with _journal_lock:
+        if _journal is not None:
+            _journal.close()
+            _journal = None
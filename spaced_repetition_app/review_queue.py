@@ -0,0 +1,199 @@
+"""Очередь карточек сессии повторения с фоновой подгрузкой из БД."""
+from __future__ import annotations
+
+import queue
+import sqlite3
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+import models
+from offline_store import OfflineStore
+from review_journal import ReviewJournal
+
+Event = Tuple[str, Any]
+
+
+class ReviewQueue:
+    """Локальная очередь карточек, которую фоновый поток пополняет пачками.
+
+    Все обращения к БД (подгрузка карточек и запись результатов) выполняются
+    одним рабочим потоком строго по порядку постановки. Если передан
+    журнал, оценки сначала сохраняются в нём и отправляются на сервер пачками.
+    С локальной копией (store) оценки и паузы записываются в неё сразу и
+    отправляются на сервер при синхронизации. Очередь и тогда строит
+    планировщик сервера: перед подгрузкой пачки outbox копии отправляется,
+    чтобы лимиты учли уже сделанные оценки. Из копии очередь читается, только
+    когда сервер недоступен, и до конца сессии.
+    Методы очереди вызываются только из потока Tk; результаты работы потока
+    забираются через poll().
+    """
+
+    def __init__(
+        self,
+        user_id: str,
+        deck_id: Optional[str] = None,
+        batch_size: int = 20,
+        low_watermark: int = 5,
+        journal: Optional[ReviewJournal] = None,
+        store: Optional[OfflineStore] = None,
+    ):
+        self.user_id = user_id
+        self.deck_id = deck_id
+        self.batch_size = batch_size
+        self.low_watermark = low_watermark
+        self.journal = journal
+        self.store = store
+        self.ready: Deque[Dict[str, Any]] = deque()
+        self.exhausted = False
+
+        self._seen: Set[str] = set()
+        self._fetching = False
+        # сервер не ответил: дальше очередь читается из локальной копии
+        self._offline = False
+        self._tasks: "queue.Queue[Optional[Callable[[], Optional[Event]]]]" = queue.Queue()
+        self._events: "queue.Queue[Event]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="review-queue", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+        self.top_up()
+
+    def is_alive(self) -> bool:
+        return self._thread.is_alive()
+
+    @property
+    def loading(self) -> bool:
+        return self._fetching
+
+    def top_up(self) -> None:
+        """Запрашивает следующую пачку, если локальный запас подходит к концу."""
+        if self._fetching or self.exhausted or len(self.ready) >= self.low_watermark:
+            return
+        self._fetching = True
+        exclude = list(self._seen)
+        self._tasks.put(lambda: self._fetch_batch(exclude))
+
+    def pop(self) -> Optional[Dict[str, Any]]:
+        card = self.ready.popleft() if self.ready else None
+        self.top_up()
+        return card
+
+    def push_back(self, card: Dict[str, Any]) -> None:
+        self.ready.append(card)
+
+    def record_review(self, card_id: str, quality: int) -> None:
+        if self.store is not None:
+            try:
+                self.store.record_review(card_id, quality)
+                return
+            except (KeyError, sqlite3.Error):
+                # карточки нет в локальной копии: записываем на сервер
+                pass
+        if self.journal is not None:
+            try:
+                self.journal.append(self.user_id, card_id, quality)
+                return
+            except OSError:
+                # журнал недоступен: записываем напрямую
+                pass
+        self._submit_write(
+            lambda: models.record_review(self.user_id, card_id, quality),
+            "Не удалось записать результат",
+        )
+
+    def suspend(self, card_id: str) -> None:
+        if self.store is not None:
+            try:
+                self.store.suspend(card_id, True)
+                return
+            except sqlite3.Error:
+                pass
+        self._submit_write(
+            lambda: models.suspend_card(self.user_id, card_id, True),
+            "Не удалось обновить карточку",
+        )
+
+    def poll(self) -> List[Event]:
+        """Применяет готовые результаты потока и возвращает события для окна."""
+        events: List[Event] = []
+        while True:
+            try:
+                kind, payload = self._events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "cards":
+                cards, exhausted = payload
+                self._fetching = False
+                self.exhausted = exhausted
+                for card in cards:
+                    card_id = str(card["card_id"])
+                    if card_id not in self._seen:
+                        self._seen.add(card_id)
+                        self.ready.append(card)
+            elif kind == "fetch_error":
+                self._fetching = False
+                self.exhausted = True
+            events.append((kind, payload))
+        self.top_up()
+        return events
+
+    def close(self) -> None:
+        """Завершает поток после выполнения уже поставленных задач."""
+        if self.store is not None:
+            self.store.request_sync()
+        if self.journal is not None:
+            self._submit_write(self.journal.flush, "Оценки сохранены локально и будут отправлены позже")
+        self._tasks.put(None)
+
+    def _submit_write(self, action: Callable[[], None], error_text: str) -> None:
+        def task() -> Optional[Event]:
+            try:
+                action()
+            except Exception as exc:
+                return ("write_error", f"{error_text}: {exc}")
+            return None
+
+        self._tasks.put(task)
+
+    def _fetch_batch(self, exclude: List[str]) -> Event:
+        if self.store is not None and not self._offline:
+            try:
+                self.store.push_pending()
+            except Exception:
+                self._offline = True
+        if self.store is None or not self._offline:
+            try:
+                due = models.get_due_card_ids(
+                    self.user_id,
+                    deck_id=self.deck_id,
+                    limit=self.batch_size,
+                    exclude=exclude,
+                )
+                cards = models.get_cards_content(self.user_id, [str(row["card_id"]) for row in due])
+            except Exception as exc:
+                if self.store is None:
+                    return ("fetch_error", f"Не удалось загрузить очередь: {exc}")
+                self._offline = True
+            else:
+                return self._server_batch(due, cards)
+        try:
+            cards = self.store.get_due_cards(self.deck_id, self.batch_size, exclude)
+        except sqlite3.Error as exc:
+            return ("fetch_error", f"Не удалось загрузить очередь из локальной копии: {exc}")
+        return ("cards", (cards, len(cards) < self.batch_size))
+
+    def _server_batch(self, due: List[Dict[str, Any]], cards: List[Dict[str, Any]]) -> Event:
+        due_at = {str(row["card_id"]): row["due_at"] for row in due}
+        for card in cards:
+            card["due_at"] = due_at.get(str(card["card_id"]))
+        return ("cards", (cards, len(due) < self.batch_size))
+
+    def _run(self) -> None:
+        while True:
+            task = self._tasks.get()
+            if task is None:
+                break
+            event = task()
+            if event is not None:
+                self._events.put(event)
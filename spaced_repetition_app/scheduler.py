@@ -0,0 +1,183 @@
+"""Планировщик сессии повторения по нескольким колодам с дневными лимитами.
+
+Сессия собирается одним запросом. Для каждой колоды остаток дневных лимитов
+считается по карточкам, повторённым сегодня, и карточкам, уже выданным в этой
+сессии (exclude): их оценки могут ещё лежать в журнале. Затем из частичных
+индексов card_state берутся первые по сроку карточки на повторение и новые
+карточки в пределах остатка. Колоды чередуются по кругу: сначала первая
+карточка каждой колоды, затем вторая и так далее. Карточки на повторение идут
+по убыванию относительной просрочки (просрочка в днях / интервал), новые
+вставляются между ними в доле new_ratio.
+"""
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from psycopg2.extras import RealDictCursor
+
+import prepared
+from db import get_connection
+
+SCHEDULER_NEW_PER_DAY = int(os.getenv("SCHEDULER_NEW_PER_DAY", "20"))
+SCHEDULER_REVIEWS_PER_DAY = int(os.getenv("SCHEDULER_REVIEWS_PER_DAY", "200"))
+SCHEDULER_NEW_RATIO = float(os.getenv("SCHEDULER_NEW_RATIO", "0.25"))
+
+
+@dataclass(frozen=True)
+class SessionLimits:
+    """Лимиты по умолчанию; decks.new_per_day / decks.reviews_per_day их переопределяют."""
+
+    new_per_day: int = SCHEDULER_NEW_PER_DAY
+    reviews_per_day: int = SCHEDULER_REVIEWS_PER_DAY
+    # доля новых карточек в сессии: 0.25 — одна новая на три повторения, 0 — без новых
+    new_ratio: float = SCHEDULER_NEW_RATIO
+
+
+_SESSION_SQL = """
+    WITH params AS (
+        SELECT %s::uuid AS user_id,
+               %s::uuid AS deck_id,
+               %s::uuid[] AS excluded,
+               %s::integer AS session_limit,
+               %s::integer AS new_per_day,
+               %s::integer AS reviews_per_day,
+               %s::float8 AS new_ratio,
+               utc_day(now())::timestamp AT TIME ZONE 'UTC' AS day_start
+    ), seen AS (
+        SELECT cs.deck_id,
+               COALESCE(cs.last_reviewed_at IS NULL OR cs.first_reviewed_at >= p.day_start, false) AS introduced
+        FROM params p
+        CROSS JOIN LATERAL (
+            SELECT r.card_id FROM reviews r WHERE r.user_id = p.user_id AND r.reviewed_at >= p.day_start
+            UNION
+            SELECT unnest(p.excluded)
+        ) s
+        JOIN card_state cs ON cs.card_id = s.card_id
+    ), quota AS (
+        SELECT d.id AS deck_id,
+               CASE WHEN p.new_ratio > 0
+                   THEN GREATEST(COALESCE(d.new_per_day, p.new_per_day) - COUNT(s.deck_id) FILTER (WHERE s.introduced), 0)
+                   ELSE 0
+               END AS new_left,
+               GREATEST(COALESCE(d.reviews_per_day, p.reviews_per_day) - COUNT(s.deck_id) FILTER (WHERE NOT s.introduced), 0)
+                   AS reviews_left
+        FROM params p
+        JOIN decks d ON d.user_id = p.user_id AND (p.deck_id IS NULL OR d.id = p.deck_id)
+        LEFT JOIN seen s ON s.deck_id = d.id
+        GROUP BY d.id, d.new_per_day, d.reviews_per_day, p.new_per_day, p.reviews_per_day, p.new_ratio
+    ), candidates AS (
+        SELECT q.deck_id,
+               c.card_id,
+               c.due_at,
+               c.is_new,
+               c.overdue,
+               row_number() OVER (PARTITION BY q.deck_id, c.is_new ORDER BY c.overdue DESC, c.due_at) AS deck_rank
+        FROM params p
+        JOIN quota q ON q.new_left > 0 OR q.reviews_left > 0
+        CROSS JOIN LATERAL (
+            (
+                SELECT cs.card_id,
+                       cs.due_at,
+                       false AS is_new,
+                       EXTRACT(EPOCH FROM now() - cs.due_at) / 86400 / GREATEST(cs.interval_days, 1) AS overdue
+                FROM card_state cs
+                WHERE cs.user_id = p.user_id AND cs.deck_id = q.deck_id
+                  AND cs.suspended = false AND cs.last_reviewed_at IS NOT NULL
+                  AND cs.due_at <= now() AND cs.card_id <> ALL(p.excluded)
+                ORDER BY cs.due_at
+                LIMIT LEAST(q.reviews_left, p.session_limit)
+            )
+            UNION ALL
+            (
+                SELECT cs.card_id, cs.due_at, true, 0
+                FROM card_state cs
+                WHERE cs.user_id = p.user_id AND cs.deck_id = q.deck_id
+                  AND cs.suspended = false AND cs.last_reviewed_at IS NULL
+                  AND cs.due_at <= now() AND cs.card_id <> ALL(p.excluded)
+                ORDER BY cs.due_at
+                LIMIT LEAST(q.new_left, p.session_limit)
+            )
+        ) c
+    ), picked AS (
+        SELECT c.card_id,
+               c.deck_id,
+               c.due_at,
+               c.is_new,
+               c.kind_rank,
+               CASE WHEN c.is_new
+                   THEN (c.kind_rank - 0.5) * (1 - p.new_ratio) / p.new_ratio
+                   ELSE c.kind_rank
+               END AS slot
+        FROM params p
+        CROSS JOIN (
+            SELECT candidates.*,
+                   row_number() OVER (PARTITION BY is_new ORDER BY deck_rank, overdue DESC, due_at) AS kind_rank
+            FROM candidates
+        ) c
+        ORDER BY slot, c.kind_rank
+        LIMIT (SELECT session_limit FROM params)
+    )
+    SELECT {columns}
+    FROM picked q{joins}
+    ORDER BY q.slot, q.kind_rank
+"""
+_TYPES = ("uuid", "uuid", "uuid[]", "integer", "integer", "integer", "double precision")
+
+prepared.register(
+    "due_session",
+    _SESSION_SQL.format(
+        columns="q.card_id, q.deck_id, c.note_id, n.front, n.back, q.due_at, d.name AS deck_name, q.is_new",
+        joins=(
+            "\n    JOIN cards c ON c.id = q.card_id"
+            "\n    JOIN notes n ON n.id = c.note_id"
+            "\n    JOIN decks d ON d.id = q.deck_id"
+        ),
+    ),
+    _TYPES,
+)
+prepared.register(
+    "due_session_ids",
+    _SESSION_SQL.format(columns="q.card_id, q.due_at, q.is_new", joins=""),
+    _TYPES,
+)
+
+
+def session_params(
+    user_id: str,
+    deck_id: Optional[str] = None,
+    limit: int = 50,
+    exclude: Iterable[str] | None = None,
+    limits: SessionLimits | None = None,
+) -> Tuple[Any, ...]:
+    """Параметры запросов due_session / due_session_ids по порядку."""
+    limits = limits or SessionLimits()
+    return (
+        user_id,
+        deck_id,
+        list(exclude or []),
+        limit,
+        limits.new_per_day,
+        limits.reviews_per_day,
+        limits.new_ratio,
+    )
+
+
+def build_session(
+    user_id: str,
+    deck_id: Optional[str] = None,
+    limit: int = 50,
+    exclude: Iterable[str] | None = None,
+    limits: SessionLimits | None = None,
+    content: bool = True,
+) -> List[Dict[str, Any]]:
+    """Следующие limit карточек сессии по всем колодам или по deck_id.
+
+    content=False возвращает только card_id, due_at и is_new, без текста заметок.
+    """
+    name = "due_session" if content else "due_session_ids"
+    with get_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            prepared.execute(cur, name, session_params(user_id, deck_id, limit, exclude, limits))
+            return [dict(row) for row in cur.fetchall()]
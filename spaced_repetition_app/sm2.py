@@ -2,8 +2,10 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from datetime import datetime, timedelta
-from typing import Tuple
+from datetime import datetime, timedelta, timezone
+from typing import List, Sequence, Tuple
+
+import numpy as np
 
 
 @dataclass
@@ -17,6 +19,72 @@ class CardState:
     due_at: datetime | None = None
 
 
+@dataclass
+class CardStateBatch:
+    """Состояния набора карточек в виде массивов одинаковой длины."""
+
+    ease_factor: np.ndarray
+    interval_days: np.ndarray
+    reps: np.ndarray
+    lapses: np.ndarray
+    due_at: np.ndarray | None = None
+
+    def __post_init__(self) -> None:
+        self.ease_factor = np.asarray(self.ease_factor, dtype=np.float64)
+        self.interval_days = np.asarray(self.interval_days, dtype=np.int32)
+        self.reps = np.asarray(self.reps, dtype=np.int32)
+        self.lapses = np.asarray(self.lapses, dtype=np.int32)
+        if self.due_at is not None:
+            self.due_at = np.asarray(self.due_at, dtype="datetime64[us]")
+        size = self.ease_factor.shape
+        for name in ("interval_days", "reps", "lapses"):
+            if getattr(self, name).shape != size:
+                raise ValueError(f"Массив {name} должен иметь размер {size}")
+
+    def __len__(self) -> int:
+        return int(self.ease_factor.shape[0])
+
+    @classmethod
+    def new(cls, count: int) -> "CardStateBatch":
+        """Создаёт набор из count новых карточек с начальными параметрами."""
+        return cls(
+            ease_factor=np.full(count, 2.5),
+            interval_days=np.zeros(count, dtype=np.int32),
+            reps=np.zeros(count, dtype=np.int32),
+            lapses=np.zeros(count, dtype=np.int32),
+        )
+
+    @classmethod
+    def from_states(cls, states: Sequence[CardState]) -> "CardStateBatch":
+        """Собирает массивы из списка скалярных состояний."""
+        return cls(
+            ease_factor=[s.ease_factor for s in states],
+            interval_days=[s.interval_days for s in states],
+            reps=[s.reps for s in states],
+            lapses=[s.lapses for s in states],
+        )
+
+    def to_states(self) -> List[CardState]:
+        """Разворачивает массивы обратно в список CardState."""
+        due = self.due_at.tolist() if self.due_at is not None else [None] * len(self)
+        return [
+            CardState(
+                ease_factor=float(ease),
+                interval_days=int(interval),
+                reps=int(reps),
+                lapses=int(lapses),
+                due_at=due_at,
+            )
+            for ease, interval, reps, lapses, due_at in zip(
+                self.ease_factor.tolist(),
+                self.interval_days.tolist(),
+                self.reps.tolist(),
+                self.lapses.tolist(),
+                due,
+            )
+        ]
+
+
 def sm2(schedule: CardState, quality: int, now: datetime | None = None) -> Tuple[CardState, int]:
     """Возвращает новое состояние карточки и количество дней до следующего показа."""
     if quality < 0 or quality > 5:
@@ -55,3 +123,48 @@ def sm2(schedule: CardState, quality: int, now: datetime | None = None) -> Tuple
         due_at=due_at,
     )
     return new_state, interval
+
+
+def sm2_batch(
+    batch: CardStateBatch,
+    quality: np.ndarray | Sequence[int] | int,
+    now: datetime | None = None,
+) -> Tuple[CardStateBatch, np.ndarray]:
+    """Векторный аналог sm2(): обновляет все карточки набора за один вызов.
+
+    Результаты поэлементно совпадают с sm2(). Даты due_at возвращаются как
+    datetime64[us]; для now с часовым поясом они приводятся к UTC.
+    """
+    quality = np.broadcast_to(np.asarray(quality), batch.ease_factor.shape)
+    if quality.size and (quality.min() < 0 or quality.max() > 5):
+        raise ValueError("Оценка качества должна быть между 0 и 5")
+
+    now = now or datetime.utcnow()
+    if now.tzinfo is not None:
+        now = now.astimezone(timezone.utc).replace(tzinfo=None)
+
+    ease_factor = batch.ease_factor
+    failed = quality < 3
+    penalty = (5 - quality).astype(np.float64)
+
+    grown = np.maximum(np.round(batch.interval_days * ease_factor), 1).astype(np.int32)
+    interval = np.where(batch.reps == 0, 1, np.where(batch.reps == 1, 6, grown))
+    interval = np.where(failed, 1, interval).astype(np.int32)
+
+    new_ease = np.where(
+        failed,
+        np.maximum(1.3, ease_factor - 0.2),
+        np.maximum(1.3, ease_factor + (0.1 - penalty * (0.08 + penalty * 0.02))),
+    )
+    reps = np.where(failed, 0, batch.reps + 1)
+    lapses = batch.lapses + failed
+
+    due_at = np.datetime64(now, "us") + interval.astype("timedelta64[D]")
+    new_batch = CardStateBatch(
+        ease_factor=new_ease,
+        interval_days=interval,
+        reps=reps,
+        lapses=lapses,
+        due_at=due_at,
+    )
+    return new_batch, interval
@@ -0,0 +1,86 @@
+-- Идемпотентная запись оценки: review_id формируется на клиенте, повторная
+-- отправка того же review_id (например, при повторе из локального журнала)
+-- игнорируется.
+CREATE OR REPLACE FUNCTION apply_sm2(
+    p_user_id uuid,
+    p_card_id uuid,
+    p_quality smallint,
+    p_review_id uuid,
+    p_reviewed_at timestamptz
+) RETURNS boolean AS $$
+DECLARE
+    v_state card_state%ROWTYPE;
+    v_interval integer;
+    v_ease numeric(4,2);
+    v_reps integer;
+    v_lapses integer;
+    v_now timestamptz := COALESCE(p_reviewed_at, now());
+BEGIN
+    IF p_quality < 0 OR p_quality > 5 THEN
+        RAISE EXCEPTION 'Quality should be between 0 and 5';
+    END IF;
+
+    -- блокировка строки карточки упорядочивает конкурентные повторы одного review_id
+    SELECT * INTO v_state
+    FROM card_state
+    WHERE user_id = p_user_id AND card_id = p_card_id
+    FOR UPDATE;
+
+    IF NOT FOUND THEN
+        -- карточка удалена, пока оценка ждала отправки
+        RETURN false;
+    END IF;
+
+    IF EXISTS (SELECT 1 FROM reviews WHERE id = p_review_id) THEN
+        RETURN false;
+    END IF;
+
+    v_ease := v_state.ease_factor;
+    v_reps := v_state.reps;
+    v_lapses := v_state.lapses;
+
+    IF p_quality < 3 THEN
+        v_reps := 0;
+        v_lapses := v_lapses + 1;
+        v_interval := 1;
+        v_ease := GREATEST(1.30, v_ease - 0.20);
+    ELSE
+        v_reps := v_reps + 1;
+        IF v_state.reps = 0 THEN
+            v_interval := 1;
+        ELSIF v_state.reps = 1 THEN
+            v_interval := 6;
+        ELSE
+            v_interval := CEIL(v_state.interval_days * v_ease);
+        END IF;
+        v_ease := GREATEST(1.30, v_ease + (0.1 - (5 - p_quality) * (0.08 + (5 - p_quality) * 0.02)));
+    END IF;
+
+    UPDATE card_state
+    SET ease_factor = v_ease,
+        interval_days = v_interval,
+        reps = v_reps,
+        lapses = v_lapses,
+        due_at = v_now + make_interval(days => v_interval),
+        last_reviewed_at = v_now,
+        suspended = false
+    WHERE card_id = p_card_id AND user_id = p_user_id;
+
+    INSERT INTO reviews(id, card_id, user_id, quality, interval_days, ease_factor, reviewed_at)
+    VALUES (p_review_id, p_card_id, p_user_id, p_quality, v_interval, v_ease, v_now);
+
+    RETURN true;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION apply_sm2(
+    p_user_id uuid,
+    p_card_id uuid,
+    p_quality smallint
+) RETURNS void AS $$
+BEGIN
+    IF NOT apply_sm2(p_user_id, p_card_id, p_quality, gen_random_uuid(), now()) THEN
+        RAISE EXCEPTION 'Card state not found for card %', p_card_id;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,125 @@
+-- Пакетное применение SM-2: одна блокировка набора строк в порядке card_id,
+-- один UPDATE ... FROM unnest(...) и одна многострочная вставка в reviews.
+-- Если одна карточка встречается в пачке несколько раз, оценки применяются
+-- раундами в порядке времени. Уже записанные review_id пропускаются,
+-- карточки, удалённые до отправки пачки, тоже.
+CREATE OR REPLACE FUNCTION apply_sm2_batch(
+    p_user_id uuid,
+    p_card_ids uuid[],
+    p_qualities smallint[],
+    p_reviewed_at timestamptz[] DEFAULT NULL,
+    p_review_ids uuid[] DEFAULT NULL
+) RETURNS integer AS $$
+DECLARE
+    v_size integer := COALESCE(cardinality(p_card_ids), 0);
+    v_cards uuid[];
+    v_qualities smallint[];
+    v_times timestamptz[];
+    v_ids uuid[];
+    v_rounds bigint[];
+    v_last_round integer;
+    v_count integer;
+    v_applied integer := 0;
+BEGIN
+    IF v_size = 0 THEN
+        RETURN 0;
+    END IF;
+
+    IF COALESCE(cardinality(p_qualities), 0) <> v_size
+        OR (p_reviewed_at IS NOT NULL AND cardinality(p_reviewed_at) <> v_size)
+        OR (p_review_ids IS NOT NULL AND cardinality(p_review_ids) <> v_size) THEN
+        RAISE EXCEPTION 'Array arguments should have the same length';
+    END IF;
+
+    IF EXISTS (SELECT 1 FROM unnest(p_qualities) AS q WHERE q IS NULL OR q < 0 OR q > 5) THEN
+        RAISE EXCEPTION 'Quality should be between 0 and 5';
+    END IF;
+
+    PERFORM 1
+    FROM card_state
+    WHERE user_id = p_user_id AND card_id = ANY(p_card_ids)
+    ORDER BY card_id
+    FOR UPDATE;
+
+    SELECT array_agg(b.card_id ORDER BY b.round, b.card_id),
+           array_agg(b.quality ORDER BY b.round, b.card_id),
+           array_agg(b.reviewed_at ORDER BY b.round, b.card_id),
+           array_agg(b.review_id ORDER BY b.round, b.card_id),
+           array_agg(b.round ORDER BY b.round, b.card_id)
+    INTO v_cards, v_qualities, v_times, v_ids, v_rounds
+    FROM (
+        SELECT u.card_id,
+               u.quality,
+               u.reviewed_at,
+               u.review_id,
+               row_number() OVER (PARTITION BY u.card_id ORDER BY u.reviewed_at, u.ord) AS round
+        FROM (
+            SELECT DISTINCT ON (i.review_id) i.card_id, i.quality, i.reviewed_at, i.review_id, i.ord
+            FROM (
+                SELECT x.card_id,
+                       x.quality,
+                       COALESCE(x.reviewed_at, now()) AS reviewed_at,
+                       COALESCE(x.review_id, gen_random_uuid()) AS review_id,
+                       x.ord
+                FROM unnest(p_card_ids, p_qualities, p_reviewed_at, p_review_ids)
+                    WITH ORDINALITY AS x(card_id, quality, reviewed_at, review_id, ord)
+            ) i
+            WHERE NOT EXISTS (SELECT 1 FROM reviews r WHERE r.id = i.review_id)
+            ORDER BY i.review_id, i.ord
+        ) u
+    ) b;
+
+    IF v_cards IS NULL THEN
+        RETURN 0;
+    END IF;
+
+    SELECT max(r) INTO v_last_round FROM unnest(v_rounds) AS r;
+
+    FOR v_round IN 1..v_last_round LOOP
+        WITH batch AS (
+            SELECT b.card_id, b.quality, b.reviewed_at, b.review_id
+            FROM unnest(v_cards, v_qualities, v_times, v_ids, v_rounds)
+                AS b(card_id, quality, reviewed_at, review_id, round)
+            WHERE b.round = v_round
+        ), computed AS (
+            SELECT b.card_id,
+                   b.quality,
+                   b.reviewed_at,
+                   b.review_id,
+                   CASE
+                       WHEN b.quality < 3 THEN 1
+                       WHEN cs.reps = 0 THEN 1
+                       WHEN cs.reps = 1 THEN 6
+                       ELSE CEIL(cs.interval_days * cs.ease_factor)::integer
+                   END AS interval_days,
+                   (CASE
+                       WHEN b.quality < 3 THEN GREATEST(1.30, cs.ease_factor - 0.20)
+                       ELSE GREATEST(1.30, cs.ease_factor + (0.1 - (5 - b.quality) * (0.08 + (5 - b.quality) * 0.02)))
+                   END)::numeric(4,2) AS ease_factor,
+                   CASE WHEN b.quality < 3 THEN 0 ELSE cs.reps + 1 END AS reps,
+                   CASE WHEN b.quality < 3 THEN cs.lapses + 1 ELSE cs.lapses END AS lapses
+            FROM batch b
+            JOIN card_state cs ON cs.card_id = b.card_id AND cs.user_id = p_user_id
+        ), updated AS (
+            UPDATE card_state cs
+            SET ease_factor = c.ease_factor,
+                interval_days = c.interval_days,
+                reps = c.reps,
+                lapses = c.lapses,
+                due_at = c.reviewed_at + make_interval(days => c.interval_days),
+                last_reviewed_at = c.reviewed_at,
+                suspended = false
+            FROM computed c
+            WHERE cs.card_id = c.card_id AND cs.user_id = p_user_id
+        )
+        INSERT INTO reviews(id, card_id, user_id, quality, interval_days, ease_factor, reviewed_at)
+        SELECT c.review_id, c.card_id, p_user_id, c.quality, c.interval_days, c.ease_factor, c.reviewed_at
+        FROM computed c;
+
+        GET DIAGNOSTICS v_count = ROW_COUNT;
+        v_applied := v_applied + v_count;
+    END LOOP;
+
+    RETURN v_applied;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,4 @@
+-- Индексы для постраничного вывода заметок по (updated_at, id).
+CREATE INDEX IF NOT EXISTS idx_notes_user_updated ON notes (user_id, updated_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_notes_deck_updated ON notes (deck_id, updated_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_note_tags_tag ON note_tags (tag_id, note_id);
@@ -0,0 +1,14 @@
+-- Полнотекстовый и триграммный поиск по заметкам вместо ILIKE '%...%'.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+ALTER TABLE notes
+    ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        to_tsvector('russian'::regconfig, front || ' ' || back)
+        || to_tsvector('simple'::regconfig, front || ' ' || back)
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_notes_search_vector ON notes USING gin (search_vector);
+
+-- поиск подстрок (в том числе частей слов) по тому же выражению, что и в запросах
+CREATE INDEX IF NOT EXISTS idx_notes_search_trgm ON notes USING gin ((front || ' ' || back) gin_trgm_ops);
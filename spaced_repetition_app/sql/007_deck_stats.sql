@@ -0,0 +1,245 @@
+-- Счётчики по колодам, которые поддерживаются триггерами вместо подсчёта
+-- через v_deck_progress при каждом обновлении главного окна.
+-- Сроки показа группируются по дням (UTC): due_now колоды — это карточки,
+-- срок которых наступает не позже сегодняшнего дня.
+CREATE OR REPLACE FUNCTION utc_day(p_ts timestamptz) RETURNS date AS $$
+    SELECT (p_ts AT TIME ZONE 'UTC')::date;
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE TABLE IF NOT EXISTS deck_stats (
+    deck_id uuid PRIMARY KEY REFERENCES decks(id) ON DELETE CASCADE,
+    user_id uuid NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    total_cards integer NOT NULL DEFAULT 0,
+    learned_cards integer NOT NULL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS idx_deck_stats_user ON deck_stats (user_id);
+
+CREATE TABLE IF NOT EXISTS deck_due_buckets (
+    deck_id uuid NOT NULL REFERENCES decks(id) ON DELETE CASCADE,
+    due_day date NOT NULL,
+    cards integer NOT NULL,
+    PRIMARY KEY (deck_id, due_day)
+);
+
+CREATE OR REPLACE FUNCTION deck_stats_bump(p_deck_id uuid, p_total integer, p_learned integer) RETURNS void AS $$
+BEGIN
+    IF p_total <> 0 OR p_learned <> 0 THEN
+        UPDATE deck_stats
+        SET total_cards = total_cards + p_total,
+            learned_cards = learned_cards + p_learned
+        WHERE deck_id = p_deck_id;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION deck_due_bump(p_deck_id uuid, p_day date, p_delta integer) RETURNS void AS $$
+BEGIN
+    IF p_delta > 0 THEN
+        INSERT INTO deck_due_buckets(deck_id, due_day, cards)
+        VALUES (p_deck_id, p_day, p_delta)
+        ON CONFLICT (deck_id, due_day) DO UPDATE SET cards = deck_due_buckets.cards + EXCLUDED.cards;
+    ELSIF p_delta < 0 THEN
+        UPDATE deck_due_buckets
+        SET cards = cards + p_delta
+        WHERE deck_id = p_deck_id AND due_day = p_day;
+        DELETE FROM deck_due_buckets
+        WHERE deck_id = p_deck_id AND due_day = p_day AND cards <= 0;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+-- вклад состояния карточки в счётчики колоды со знаком p_sign (+1 или -1)
+CREATE OR REPLACE FUNCTION deck_stats_apply_state(p_deck_id uuid, p_state card_state, p_sign integer) RETURNS void AS $$
+BEGIN
+    PERFORM deck_stats_bump(p_deck_id, 0, CASE WHEN p_state.reps > 0 THEN p_sign ELSE 0 END);
+    IF NOT p_state.suspended THEN
+        PERFORM deck_due_bump(p_deck_id, utc_day(p_state.due_at), p_sign);
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION trg_deck_stats_decks() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO deck_stats(deck_id, user_id) VALUES (NEW.id, NEW.user_id)
+    ON CONFLICT (deck_id) DO NOTHING;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION trg_deck_stats_cards() RETURNS trigger AS $$
+DECLARE
+    v_state card_state%ROWTYPE;
+    v_has_state boolean;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM deck_stats_bump(NEW.deck_id, 1, 0);
+        RETURN NEW;
+    END IF;
+
+    -- состояние карточки ещё существует: при удалении триггер срабатывает до каскада
+    SELECT * INTO v_state FROM card_state WHERE card_id = OLD.id;
+    v_has_state := FOUND;
+
+    IF TG_OP = 'DELETE' THEN
+        PERFORM deck_stats_bump(OLD.deck_id, -1, 0);
+        IF v_has_state THEN
+            PERFORM deck_stats_apply_state(OLD.deck_id, v_state, -1);
+        END IF;
+        RETURN OLD;
+    END IF;
+
+    IF NEW.deck_id IS DISTINCT FROM OLD.deck_id THEN
+        PERFORM deck_stats_bump(OLD.deck_id, -1, 0);
+        PERFORM deck_stats_bump(NEW.deck_id, 1, 0);
+        IF v_has_state THEN
+            PERFORM deck_stats_apply_state(OLD.deck_id, v_state, -1);
+            PERFORM deck_stats_apply_state(NEW.deck_id, v_state, 1);
+        END IF;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION trg_deck_stats_card_state() RETURNS trigger AS $$
+DECLARE
+    v_deck_id uuid;
+BEGIN
+    SELECT deck_id INTO v_deck_id
+    FROM cards
+    WHERE id = CASE WHEN TG_OP = 'DELETE' THEN OLD.card_id ELSE NEW.card_id END;
+
+    -- карточка уже удалена: её вклад снят триггером на cards
+    IF v_deck_id IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM deck_stats_apply_state(v_deck_id, OLD, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM deck_stats_apply_state(v_deck_id, NEW, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_decks_deck_stats ON decks;
+CREATE TRIGGER trg_decks_deck_stats
+    AFTER INSERT ON decks
+    FOR EACH ROW
+    EXECUTE FUNCTION trg_deck_stats_decks();
+
+DROP TRIGGER IF EXISTS trg_cards_deck_stats_insert ON cards;
+CREATE TRIGGER trg_cards_deck_stats_insert
+    AFTER INSERT ON cards
+    FOR EACH ROW
+    EXECUTE FUNCTION trg_deck_stats_cards();
+
+DROP TRIGGER IF EXISTS trg_cards_deck_stats_update ON cards;
+CREATE TRIGGER trg_cards_deck_stats_update
+    AFTER UPDATE OF deck_id ON cards
+    FOR EACH ROW
+    WHEN (OLD.deck_id IS DISTINCT FROM NEW.deck_id)
+    EXECUTE FUNCTION trg_deck_stats_cards();
+
+DROP TRIGGER IF EXISTS trg_cards_deck_stats_delete ON cards;
+CREATE TRIGGER trg_cards_deck_stats_delete
+    BEFORE DELETE ON cards
+    FOR EACH ROW
+    EXECUTE FUNCTION trg_deck_stats_cards();
+
+DROP TRIGGER IF EXISTS trg_card_state_deck_stats ON card_state;
+CREATE TRIGGER trg_card_state_deck_stats
+    AFTER INSERT OR DELETE ON card_state
+    FOR EACH ROW
+    EXECUTE FUNCTION trg_deck_stats_card_state();
+
+DROP TRIGGER IF EXISTS trg_card_state_deck_stats_update ON card_state;
+CREATE TRIGGER trg_card_state_deck_stats_update
+    AFTER UPDATE ON card_state
+    FOR EACH ROW
+    WHEN (
+        (OLD.reps > 0) IS DISTINCT FROM (NEW.reps > 0)
+        OR OLD.suspended IS DISTINCT FROM NEW.suspended
+        OR utc_day(OLD.due_at) IS DISTINCT FROM utc_day(NEW.due_at)
+    )
+    EXECUTE FUNCTION trg_deck_stats_card_state();
+
+-- Пересчёт счётчиков с нуля для пользователя (или всех пользователей).
+-- Блокировка таблиц счётчиков задерживает триггеры параллельных транзакций
+-- до окончания пересчёта, поэтому их изменения не теряются.
+CREATE OR REPLACE FUNCTION deck_stats_rebuild(p_user_id uuid DEFAULT NULL) RETURNS integer AS $$
+DECLARE
+    v_decks integer;
+BEGIN
+    LOCK TABLE deck_stats, deck_due_buckets IN SHARE ROW EXCLUSIVE MODE;
+
+    INSERT INTO deck_stats(deck_id, user_id, total_cards, learned_cards)
+    SELECT d.id,
+           d.user_id,
+           COUNT(c.id),
+           COUNT(c.id) FILTER (WHERE cs.reps > 0)
+    FROM decks d
+    LEFT JOIN cards c ON c.deck_id = d.id
+    LEFT JOIN card_state cs ON cs.card_id = c.id
+    WHERE p_user_id IS NULL OR d.user_id = p_user_id
+    GROUP BY d.id, d.user_id
+    ON CONFLICT (deck_id) DO UPDATE
+    SET total_cards = EXCLUDED.total_cards,
+        learned_cards = EXCLUDED.learned_cards;
+    GET DIAGNOSTICS v_decks = ROW_COUNT;
+
+    DELETE FROM deck_due_buckets b
+    USING decks d
+    WHERE b.deck_id = d.id AND (p_user_id IS NULL OR d.user_id = p_user_id);
+
+    INSERT INTO deck_due_buckets(deck_id, due_day, cards)
+    SELECT c.deck_id, utc_day(cs.due_at), COUNT(*)
+    FROM card_state cs
+    JOIN cards c ON c.id = cs.card_id
+    WHERE cs.suspended = false AND (p_user_id IS NULL OR cs.user_id = p_user_id)
+    GROUP BY c.deck_id, utc_day(cs.due_at);
+
+    RETURN v_decks;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Сравнение сохранённых счётчиков с фактическими данными; возвращает расхождения.
+CREATE OR REPLACE FUNCTION deck_stats_check(p_user_id uuid DEFAULT NULL)
+RETURNS TABLE(deck_id uuid, counter text, stored bigint, actual bigint) AS $$
+    WITH actual AS (
+        SELECT d.id AS deck_id,
+               COUNT(c.id) AS total_cards,
+               COUNT(c.id) FILTER (WHERE cs.reps > 0) AS learned_cards,
+               COUNT(c.id) FILTER (WHERE cs.suspended = false AND utc_day(cs.due_at) <= utc_day(now())) AS due_today
+        FROM decks d
+        LEFT JOIN cards c ON c.deck_id = d.id
+        LEFT JOIN card_state cs ON cs.card_id = c.id
+        WHERE p_user_id IS NULL OR d.user_id = p_user_id
+        GROUP BY d.id
+    ), stored AS (
+        SELECT d.id AS deck_id,
+               COALESCE(ds.total_cards, 0)::bigint AS total_cards,
+               COALESCE(ds.learned_cards, 0)::bigint AS learned_cards,
+               COALESCE((
+                   SELECT SUM(b.cards)
+                   FROM deck_due_buckets b
+                   WHERE b.deck_id = d.id AND b.due_day <= utc_day(now())
+               ), 0)::bigint AS due_today
+        FROM decks d
+        LEFT JOIN deck_stats ds ON ds.deck_id = d.id
+        WHERE p_user_id IS NULL OR d.user_id = p_user_id
+    )
+    SELECT a.deck_id, x.counter, x.stored, x.actual
+    FROM actual a
+    JOIN stored s ON s.deck_id = a.deck_id
+    CROSS JOIN LATERAL (
+        VALUES ('total_cards', s.total_cards, a.total_cards),
+               ('learned_cards', s.learned_cards, a.learned_cards),
+               ('due_today', s.due_today, a.due_today)
+    ) AS x(counter, stored, actual)
+    WHERE x.stored <> x.actual;
+$$ LANGUAGE sql STABLE;
+
+SELECT deck_stats_rebuild();
@@ -0,0 +1,89 @@
+-- Дневные итоги повторений по пользователям (день по UTC).
+-- Таблица обновляется триггерами на reviews в той же транзакции, что и
+-- apply_sm2() / apply_sm2_batch(), поэтому статистика не читает историю ревью.
+CREATE TABLE IF NOT EXISTS daily_review_stats (
+    user_id uuid NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    day date NOT NULL,
+    reviews integer NOT NULL DEFAULT 0,
+    successes integer NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, day)
+);
+
+CREATE OR REPLACE FUNCTION trg_daily_review_stats_insert() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO daily_review_stats(user_id, day, reviews, successes)
+    SELECT user_id, utc_day(reviewed_at), COUNT(*), COUNT(*) FILTER (WHERE quality >= 3)
+    FROM new_reviews
+    GROUP BY user_id, utc_day(reviewed_at)
+    ORDER BY 1, 2
+    ON CONFLICT (user_id, day) DO UPDATE
+    SET reviews = daily_review_stats.reviews + EXCLUDED.reviews,
+        successes = daily_review_stats.successes + EXCLUDED.successes;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION trg_daily_review_stats_delete() RETURNS trigger AS $$
+BEGIN
+    UPDATE daily_review_stats s
+    SET reviews = s.reviews - d.reviews,
+        successes = s.successes - d.successes
+    FROM (
+        SELECT user_id, utc_day(reviewed_at) AS day, COUNT(*) AS reviews, COUNT(*) FILTER (WHERE quality >= 3) AS successes
+        FROM old_reviews
+        GROUP BY user_id, utc_day(reviewed_at)
+    ) d
+    WHERE s.user_id = d.user_id AND s.day = d.day;
+
+    DELETE FROM daily_review_stats s
+    USING (SELECT DISTINCT user_id, utc_day(reviewed_at) AS day FROM old_reviews) d
+    WHERE s.user_id = d.user_id AND s.day = d.day AND s.reviews <= 0;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_reviews_daily_stats_insert ON reviews;
+CREATE TRIGGER trg_reviews_daily_stats_insert
+    AFTER INSERT ON reviews
+    REFERENCING NEW TABLE AS new_reviews
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION trg_daily_review_stats_insert();
+
+DROP TRIGGER IF EXISTS trg_reviews_daily_stats_delete ON reviews;
+CREATE TRIGGER trg_reviews_daily_stats_delete
+    AFTER DELETE ON reviews
+    REFERENCING OLD TABLE AS old_reviews
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION trg_daily_review_stats_delete();
+
+-- Пересчёт итогов из reviews для пользователя (или всех пользователей).
+CREATE OR REPLACE FUNCTION daily_review_stats_rebuild(p_user_id uuid DEFAULT NULL) RETURNS integer AS $$
+DECLARE
+    v_days integer;
+BEGIN
+    LOCK TABLE daily_review_stats IN SHARE ROW EXCLUSIVE MODE;
+
+    DELETE FROM daily_review_stats
+    WHERE p_user_id IS NULL OR user_id = p_user_id;
+
+    INSERT INTO daily_review_stats(user_id, day, reviews, successes)
+    SELECT user_id, utc_day(reviewed_at), COUNT(*), COUNT(*) FILTER (WHERE quality >= 3)
+    FROM reviews
+    WHERE p_user_id IS NULL OR user_id = p_user_id
+    GROUP BY user_id, utc_day(reviewed_at);
+    GET DIAGNOSTICS v_days = ROW_COUNT;
+
+    RETURN v_days;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE VIEW v_daily_stats AS
+SELECT
+    s.user_id,
+    s.day,
+    s.reviews::bigint AS reviews_count,
+    s.successes::numeric / s.reviews AS success_rate
+FROM daily_review_stats s
+WHERE s.reviews > 0;
+
+SELECT daily_review_stats_rebuild();
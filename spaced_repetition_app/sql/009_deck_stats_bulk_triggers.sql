@@ -0,0 +1,61 @@
+-- Триггеры счётчиков колод на вставку срабатывают один раз на оператор:
+-- массовый импорт обновляет deck_stats и deck_due_buckets агрегатами по
+-- колодам, а не отдельным UPDATE на каждую карточку.
+CREATE OR REPLACE FUNCTION trg_deck_stats_cards_insert() RETURNS trigger AS $$
+BEGIN
+    UPDATE deck_stats ds
+    SET total_cards = ds.total_cards + x.cards
+    FROM (
+        SELECT deck_id, COUNT(*) AS cards
+        FROM new_cards
+        GROUP BY deck_id
+    ) x
+    WHERE ds.deck_id = x.deck_id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION trg_deck_stats_card_state_insert() RETURNS trigger AS $$
+BEGIN
+    UPDATE deck_stats ds
+    SET learned_cards = ds.learned_cards + x.learned
+    FROM (
+        SELECT c.deck_id, COUNT(*) AS learned
+        FROM new_states n
+        JOIN cards c ON c.id = n.card_id
+        WHERE n.reps > 0
+        GROUP BY c.deck_id
+    ) x
+    WHERE ds.deck_id = x.deck_id;
+
+    INSERT INTO deck_due_buckets(deck_id, due_day, cards)
+    SELECT c.deck_id, utc_day(n.due_at), COUNT(*)
+    FROM new_states n
+    JOIN cards c ON c.id = n.card_id
+    WHERE n.suspended = false
+    GROUP BY c.deck_id, utc_day(n.due_at)
+    ORDER BY 1, 2
+    ON CONFLICT (deck_id, due_day) DO UPDATE SET cards = deck_due_buckets.cards + EXCLUDED.cards;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_cards_deck_stats_insert ON cards;
+CREATE TRIGGER trg_cards_deck_stats_insert
+    AFTER INSERT ON cards
+    REFERENCING NEW TABLE AS new_cards
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION trg_deck_stats_cards_insert();
+
+DROP TRIGGER IF EXISTS trg_card_state_deck_stats ON card_state;
+CREATE TRIGGER trg_card_state_deck_stats
+    AFTER DELETE ON card_state
+    FOR EACH ROW
+    EXECUTE FUNCTION trg_deck_stats_card_state();
+
+DROP TRIGGER IF EXISTS trg_card_state_deck_stats_insert ON card_state;
+CREATE TRIGGER trg_card_state_deck_stats_insert
+    AFTER INSERT ON card_state
+    REFERENCING NEW TABLE AS new_states
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION trg_deck_stats_card_state_insert();
@@ -0,0 +1,86 @@
+-- Версии строк для инкрементальной синхронизации локальных копий (offline_store.py).
+-- Каждая вставка или изменение записывает в change_xid номер транзакции
+-- (xid8, растёт монотонно), удаления попадают в sync_deletions. Клиент
+-- запрашивает строки с change_xid не меньше xmin снимка прошлой синхронизации:
+-- все транзакции с меньшими номерами к тому моменту уже были завершены.
+-- Существующие строки получают 0 и выгружаются при первой синхронизации.
+ALTER TABLE decks ADD COLUMN IF NOT EXISTS change_xid xid8 NOT NULL DEFAULT '0';
+ALTER TABLE notes ADD COLUMN IF NOT EXISTS change_xid xid8 NOT NULL DEFAULT '0';
+ALTER TABLE cards ADD COLUMN IF NOT EXISTS change_xid xid8 NOT NULL DEFAULT '0';
+ALTER TABLE card_state ADD COLUMN IF NOT EXISTS change_xid xid8 NOT NULL DEFAULT '0';
+
+CREATE INDEX IF NOT EXISTS idx_decks_user_change ON decks (user_id, change_xid);
+CREATE INDEX IF NOT EXISTS idx_notes_user_change ON notes (user_id, change_xid);
+CREATE INDEX IF NOT EXISTS idx_cards_user_change ON cards (user_id, change_xid);
+CREATE INDEX IF NOT EXISTS idx_card_state_user_change ON card_state (user_id, change_xid);
+
+CREATE TABLE IF NOT EXISTS sync_deletions (
+    id bigserial PRIMARY KEY,
+    user_id uuid NOT NULL,
+    entity text NOT NULL,
+    entity_id uuid NOT NULL,
+    change_xid xid8 NOT NULL DEFAULT pg_current_xact_id(),
+    deleted_at timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_sync_deletions_user_change ON sync_deletions (user_id, change_xid);
+
+CREATE OR REPLACE FUNCTION trg_sync_change_xid() RETURNS trigger AS $$
+BEGIN
+    NEW.change_xid := pg_current_xact_id();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION trg_sync_deletions() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO sync_deletions(user_id, entity, entity_id)
+    SELECT user_id, TG_TABLE_NAME, id FROM old_rows;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_decks_change_xid ON decks;
+CREATE TRIGGER trg_decks_change_xid
+    BEFORE INSERT OR UPDATE ON decks
+    FOR EACH ROW
+    EXECUTE FUNCTION trg_sync_change_xid();
+
+DROP TRIGGER IF EXISTS trg_notes_change_xid ON notes;
+CREATE TRIGGER trg_notes_change_xid
+    BEFORE INSERT OR UPDATE ON notes
+    FOR EACH ROW
+    EXECUTE FUNCTION trg_sync_change_xid();
+
+DROP TRIGGER IF EXISTS trg_cards_change_xid ON cards;
+CREATE TRIGGER trg_cards_change_xid
+    BEFORE INSERT OR UPDATE ON cards
+    FOR EACH ROW
+    EXECUTE FUNCTION trg_sync_change_xid();
+
+DROP TRIGGER IF EXISTS trg_card_state_change_xid ON card_state;
+CREATE TRIGGER trg_card_state_change_xid
+    BEFORE INSERT OR UPDATE ON card_state
+    FOR EACH ROW
+    EXECUTE FUNCTION trg_sync_change_xid();
+
+DROP TRIGGER IF EXISTS trg_decks_sync_deletions ON decks;
+CREATE TRIGGER trg_decks_sync_deletions
+    AFTER DELETE ON decks
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION trg_sync_deletions();
+
+DROP TRIGGER IF EXISTS trg_notes_sync_deletions ON notes;
+CREATE TRIGGER trg_notes_sync_deletions
+    AFTER DELETE ON notes
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION trg_sync_deletions();
+
+DROP TRIGGER IF EXISTS trg_cards_sync_deletions ON cards;
+CREATE TRIGGER trg_cards_sync_deletions
+    AFTER DELETE ON cards
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION trg_sync_deletions();
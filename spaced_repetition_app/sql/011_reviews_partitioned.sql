@@ -0,0 +1,377 @@
+-- Таблица reviews секционируется по месяцам (UTC) по reviewed_at.
+-- Журнал ревью только растёт; индексы каждого раздела остаются небольшими,
+-- поэтому стоимость вставки не зависит от объёма истории. По времени внутри
+-- разделов строится BRIN: строки пишутся почти в порядке reviewed_at.
+-- Первичный ключ секционированной таблицы обязан включать reviewed_at, поэтому
+-- повтор review_id проверяется по паре (id, reviewed_at): журнал и автономный
+-- режим отправляют повтор с тем же временем, и проверка затрагивает один раздел.
+-- Строки вне созданных разделов попадают в reviews_default;
+-- reviews_ensure_partitions() переносит их при создании раздела.
+ALTER TABLE reviews RENAME TO reviews_unpartitioned;
+ALTER INDEX reviews_pkey RENAME TO reviews_unpartitioned_pkey;
+ALTER INDEX idx_reviews_user_date RENAME TO idx_reviews_unpartitioned_user_date;
+
+CREATE TABLE reviews (
+    id uuid NOT NULL DEFAULT gen_random_uuid(),
+    card_id uuid NOT NULL REFERENCES cards(id) ON DELETE CASCADE,
+    user_id uuid NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    quality smallint NOT NULL CHECK (quality BETWEEN 0 AND 5),
+    interval_days integer NOT NULL,
+    ease_factor numeric(4,2) NOT NULL,
+    reviewed_at timestamptz NOT NULL DEFAULT now(),
+    PRIMARY KEY (id, reviewed_at)
+) PARTITION BY RANGE (reviewed_at);
+
+CREATE TABLE reviews_default PARTITION OF reviews DEFAULT;
+
+CREATE INDEX idx_reviews_user_date ON reviews (user_id, reviewed_at);
+CREATE INDEX idx_reviews_reviewed_at_brin ON reviews USING brin (reviewed_at);
+
+-- Отсоединённые разделы: таблицы переносятся в схему reviews_archive,
+-- их границы сохраняются здесь.
+CREATE SCHEMA IF NOT EXISTS reviews_archive;
+
+CREATE TABLE IF NOT EXISTS reviews_archive_log (
+    partition_name text PRIMARY KEY,
+    range_start timestamptz NOT NULL,
+    range_end timestamptz NOT NULL,
+    row_count bigint NOT NULL,
+    archived_at timestamptz NOT NULL DEFAULT now()
+);
+
+-- Создаёт недостающие месячные разделы для [p_from, p_to] и возвращает их число.
+-- Месяцы, уже отправленные в архив, не пересоздаются.
+CREATE OR REPLACE FUNCTION reviews_ensure_partitions(p_from timestamptz, p_to timestamptz) RETURNS integer AS $$
+DECLARE
+    v_month timestamp := date_trunc('month', p_from AT TIME ZONE 'UTC');
+    v_last timestamp := date_trunc('month', p_to AT TIME ZONE 'UTC');
+    v_start timestamptz;
+    v_end timestamptz;
+    v_name text;
+    v_created integer := 0;
+BEGIN
+    -- клиенты вызывают функцию при запуске; разделы создаются по очереди
+    PERFORM pg_advisory_xact_lock(hashtext('spaced_repetition.reviews_partitions'));
+
+    WHILE v_month <= v_last LOOP
+        v_name := 'reviews_' || to_char(v_month, 'YYYY_MM');
+        v_start := v_month AT TIME ZONE 'UTC';
+        v_end := (v_month + interval '1 month') AT TIME ZONE 'UTC';
+
+        IF to_regclass(v_name) IS NULL
+            AND NOT EXISTS (SELECT 1 FROM reviews_archive_log WHERE partition_name = v_name) THEN
+            IF EXISTS (SELECT 1 FROM reviews_default WHERE reviewed_at >= v_start AND reviewed_at < v_end) THEN
+                -- строки месяца уже лежат в разделе по умолчанию: переносятся до подключения;
+                -- триггеры статистики висят на reviews и при этом не срабатывают
+                EXECUTE format('CREATE TABLE %I (LIKE reviews INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', v_name);
+                EXECUTE format(
+                    'WITH moved AS (
+                        DELETE FROM reviews_default WHERE reviewed_at >= $1 AND reviewed_at < $2 RETURNING *
+                    ) INSERT INTO %I SELECT * FROM moved ORDER BY reviewed_at',
+                    v_name
+                ) USING v_start, v_end;
+                EXECUTE format(
+                    'ALTER TABLE reviews ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                    v_name, v_start, v_end
+                );
+            ELSE
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF reviews FOR VALUES FROM (%L) TO (%L)',
+                    v_name, v_start, v_end
+                );
+            END IF;
+            v_created := v_created + 1;
+        END IF;
+
+        v_month := v_month + interval '1 month';
+    END LOOP;
+
+    RETURN v_created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Отсоединяет месячные разделы, целиком лежащие раньше p_before, переносит их
+-- в схему reviews_archive и возвращает имена. Дневные итоги за эти месяцы
+-- в daily_review_stats сохраняются.
+CREATE OR REPLACE FUNCTION reviews_archive_partitions(p_before timestamptz) RETURNS SETOF text AS $$
+DECLARE
+    v_name text;
+    v_start timestamptz;
+    v_end timestamptz;
+    v_rows bigint;
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('spaced_repetition.reviews_partitions'));
+
+    FOR v_name IN
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'reviews'::regclass
+          AND c.relname ~ '^reviews_[0-9]{4}_[0-9]{2}$'
+        ORDER BY c.relname
+    LOOP
+        v_start := to_date(right(v_name, 7), 'YYYY_MM')::timestamp AT TIME ZONE 'UTC';
+        v_end := (to_date(right(v_name, 7), 'YYYY_MM') + interval '1 month') AT TIME ZONE 'UTC';
+        EXIT WHEN v_end > p_before;
+
+        EXECUTE format('ALTER TABLE reviews DETACH PARTITION %I', v_name);
+        EXECUTE format('SELECT count(*) FROM %I', v_name) INTO v_rows;
+        EXECUTE format('ALTER TABLE %I SET SCHEMA reviews_archive', v_name);
+        INSERT INTO reviews_archive_log(partition_name, range_start, range_end, row_count)
+        VALUES (v_name, v_start, v_end, v_rows);
+        RETURN NEXT v_name;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Разделы на всю имеющуюся историю и три месяца вперёд; строки переносятся
+-- в порядке времени, чтобы BRIN-индексы разделов были плотными.
+SELECT reviews_ensure_partitions(
+    COALESCE((SELECT min(reviewed_at) FROM reviews_unpartitioned), now()),
+    now() + interval '3 months'
+);
+
+INSERT INTO reviews(id, card_id, user_id, quality, interval_days, ease_factor, reviewed_at)
+SELECT id, card_id, user_id, quality, interval_days, ease_factor, reviewed_at
+FROM reviews_unpartitioned
+ORDER BY reviewed_at;
+
+-- триггеры статистики создаются после переноса: итоги в daily_review_stats уже посчитаны
+DROP TABLE reviews_unpartitioned;
+
+CREATE TRIGGER trg_reviews_daily_stats_insert
+    AFTER INSERT ON reviews
+    REFERENCING NEW TABLE AS new_reviews
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION trg_daily_review_stats_insert();
+
+CREATE TRIGGER trg_reviews_daily_stats_delete
+    AFTER DELETE ON reviews
+    REFERENCING OLD TABLE AS old_reviews
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION trg_daily_review_stats_delete();
+
+-- Пересчёт не трогает дни архивных месяцев: их ревью уже не в reviews.
+CREATE OR REPLACE FUNCTION daily_review_stats_rebuild(p_user_id uuid DEFAULT NULL) RETURNS integer AS $$
+DECLARE
+    v_days integer;
+    v_since timestamptz := COALESCE((SELECT max(range_end) FROM reviews_archive_log), '-infinity');
+BEGIN
+    LOCK TABLE daily_review_stats IN SHARE ROW EXCLUSIVE MODE;
+
+    DELETE FROM daily_review_stats
+    WHERE (p_user_id IS NULL OR user_id = p_user_id)
+      AND day >= utc_day(v_since);
+
+    INSERT INTO daily_review_stats(user_id, day, reviews, successes)
+    SELECT user_id, utc_day(reviewed_at), COUNT(*), COUNT(*) FILTER (WHERE quality >= 3)
+    FROM reviews
+    WHERE (p_user_id IS NULL OR user_id = p_user_id)
+      AND reviewed_at >= v_since
+    GROUP BY user_id, utc_day(reviewed_at);
+    GET DIAGNOSTICS v_days = ROW_COUNT;
+
+    RETURN v_days;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Повтор review_id ищется по (id, reviewed_at), чтобы затронуть один раздел.
+CREATE OR REPLACE FUNCTION apply_sm2(
+    p_user_id uuid,
+    p_card_id uuid,
+    p_quality smallint,
+    p_review_id uuid,
+    p_reviewed_at timestamptz
+) RETURNS boolean AS $$
+DECLARE
+    v_state card_state%ROWTYPE;
+    v_interval integer;
+    v_ease numeric(4,2);
+    v_reps integer;
+    v_lapses integer;
+    v_now timestamptz := COALESCE(p_reviewed_at, now());
+BEGIN
+    IF p_quality < 0 OR p_quality > 5 THEN
+        RAISE EXCEPTION 'Quality should be between 0 and 5';
+    END IF;
+
+    -- блокировка строки карточки упорядочивает конкурентные повторы одного review_id
+    SELECT * INTO v_state
+    FROM card_state
+    WHERE user_id = p_user_id AND card_id = p_card_id
+    FOR UPDATE;
+
+    IF NOT FOUND THEN
+        -- карточка удалена, пока оценка ждала отправки
+        RETURN false;
+    END IF;
+
+    -- с известным временем проверяется один раздел; без него — все
+    IF p_reviewed_at IS NOT NULL THEN
+        IF EXISTS (SELECT 1 FROM reviews WHERE id = p_review_id AND reviewed_at = p_reviewed_at) THEN
+            RETURN false;
+        END IF;
+    ELSIF EXISTS (SELECT 1 FROM reviews WHERE id = p_review_id) THEN
+        RETURN false;
+    END IF;
+
+    v_ease := v_state.ease_factor;
+    v_reps := v_state.reps;
+    v_lapses := v_state.lapses;
+
+    IF p_quality < 3 THEN
+        v_reps := 0;
+        v_lapses := v_lapses + 1;
+        v_interval := 1;
+        v_ease := GREATEST(1.30, v_ease - 0.20);
+    ELSE
+        v_reps := v_reps + 1;
+        IF v_state.reps = 0 THEN
+            v_interval := 1;
+        ELSIF v_state.reps = 1 THEN
+            v_interval := 6;
+        ELSE
+            v_interval := CEIL(v_state.interval_days * v_ease);
+        END IF;
+        v_ease := GREATEST(1.30, v_ease + (0.1 - (5 - p_quality) * (0.08 + (5 - p_quality) * 0.02)));
+    END IF;
+
+    UPDATE card_state
+    SET ease_factor = v_ease,
+        interval_days = v_interval,
+        reps = v_reps,
+        lapses = v_lapses,
+        due_at = v_now + make_interval(days => v_interval),
+        last_reviewed_at = v_now,
+        suspended = false
+    WHERE card_id = p_card_id AND user_id = p_user_id;
+
+    INSERT INTO reviews(id, card_id, user_id, quality, interval_days, ease_factor, reviewed_at)
+    VALUES (p_review_id, p_card_id, p_user_id, p_quality, v_interval, v_ease, v_now);
+
+    RETURN true;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION apply_sm2_batch(
+    p_user_id uuid,
+    p_card_ids uuid[],
+    p_qualities smallint[],
+    p_reviewed_at timestamptz[] DEFAULT NULL,
+    p_review_ids uuid[] DEFAULT NULL
+) RETURNS integer AS $$
+DECLARE
+    v_size integer := COALESCE(cardinality(p_card_ids), 0);
+    v_cards uuid[];
+    v_qualities smallint[];
+    v_times timestamptz[];
+    v_ids uuid[];
+    v_rounds bigint[];
+    v_last_round integer;
+    v_count integer;
+    v_applied integer := 0;
+BEGIN
+    IF v_size = 0 THEN
+        RETURN 0;
+    END IF;
+
+    IF COALESCE(cardinality(p_qualities), 0) <> v_size
+        OR (p_reviewed_at IS NOT NULL AND cardinality(p_reviewed_at) <> v_size)
+        OR (p_review_ids IS NOT NULL AND cardinality(p_review_ids) <> v_size) THEN
+        RAISE EXCEPTION 'Array arguments should have the same length';
+    END IF;
+
+    IF EXISTS (SELECT 1 FROM unnest(p_qualities) AS q WHERE q IS NULL OR q < 0 OR q > 5) THEN
+        RAISE EXCEPTION 'Quality should be between 0 and 5';
+    END IF;
+
+    PERFORM 1
+    FROM card_state
+    WHERE user_id = p_user_id AND card_id = ANY(p_card_ids)
+    ORDER BY card_id
+    FOR UPDATE;
+
+    SELECT array_agg(b.card_id ORDER BY b.round, b.card_id),
+           array_agg(b.quality ORDER BY b.round, b.card_id),
+           array_agg(b.reviewed_at ORDER BY b.round, b.card_id),
+           array_agg(b.review_id ORDER BY b.round, b.card_id),
+           array_agg(b.round ORDER BY b.round, b.card_id)
+    INTO v_cards, v_qualities, v_times, v_ids, v_rounds
+    FROM (
+        SELECT u.card_id,
+               u.quality,
+               u.reviewed_at,
+               u.review_id,
+               row_number() OVER (PARTITION BY u.card_id ORDER BY u.reviewed_at, u.ord) AS round
+        FROM (
+            SELECT DISTINCT ON (i.review_id) i.card_id, i.quality, i.reviewed_at, i.review_id, i.ord
+            FROM (
+                SELECT x.card_id,
+                       x.quality,
+                       COALESCE(x.reviewed_at, now()) AS reviewed_at,
+                       COALESCE(x.review_id, gen_random_uuid()) AS review_id,
+                       x.reviewed_at IS NULL AND x.review_id IS NOT NULL AS untimed,
+                       x.ord
+                FROM unnest(p_card_ids, p_qualities, p_reviewed_at, p_review_ids)
+                    WITH ORDINALITY AS x(card_id, quality, reviewed_at, review_id, ord)
+            ) i
+            WHERE NOT EXISTS (SELECT 1 FROM reviews r WHERE r.id = i.review_id AND r.reviewed_at = i.reviewed_at)
+              AND NOT (i.untimed AND EXISTS (SELECT 1 FROM reviews r WHERE r.id = i.review_id))
+            ORDER BY i.review_id, i.ord
+        ) u
+    ) b;
+
+    IF v_cards IS NULL THEN
+        RETURN 0;
+    END IF;
+
+    SELECT max(r) INTO v_last_round FROM unnest(v_rounds) AS r;
+
+    FOR v_round IN 1..v_last_round LOOP
+        WITH batch AS (
+            SELECT b.card_id, b.quality, b.reviewed_at, b.review_id
+            FROM unnest(v_cards, v_qualities, v_times, v_ids, v_rounds)
+                AS b(card_id, quality, reviewed_at, review_id, round)
+            WHERE b.round = v_round
+        ), computed AS (
+            SELECT b.card_id,
+                   b.quality,
+                   b.reviewed_at,
+                   b.review_id,
+                   CASE
+                       WHEN b.quality < 3 THEN 1
+                       WHEN cs.reps = 0 THEN 1
+                       WHEN cs.reps = 1 THEN 6
+                       ELSE CEIL(cs.interval_days * cs.ease_factor)::integer
+                   END AS interval_days,
+                   (CASE
+                       WHEN b.quality < 3 THEN GREATEST(1.30, cs.ease_factor - 0.20)
+                       ELSE GREATEST(1.30, cs.ease_factor + (0.1 - (5 - b.quality) * (0.08 + (5 - b.quality) * 0.02)))
+                   END)::numeric(4,2) AS ease_factor,
+                   CASE WHEN b.quality < 3 THEN 0 ELSE cs.reps + 1 END AS reps,
+                   CASE WHEN b.quality < 3 THEN cs.lapses + 1 ELSE cs.lapses END AS lapses
+            FROM batch b
+            JOIN card_state cs ON cs.card_id = b.card_id AND cs.user_id = p_user_id
+        ), updated AS (
+            UPDATE card_state cs
+            SET ease_factor = c.ease_factor,
+                interval_days = c.interval_days,
+                reps = c.reps,
+                lapses = c.lapses,
+                due_at = c.reviewed_at + make_interval(days => c.interval_days),
+                last_reviewed_at = c.reviewed_at,
+                suspended = false
+            FROM computed c
+            WHERE cs.card_id = c.card_id AND cs.user_id = p_user_id
+        )
+        INSERT INTO reviews(id, card_id, user_id, quality, interval_days, ease_factor, reviewed_at)
+        SELECT c.review_id, c.card_id, p_user_id, c.quality, c.interval_days, c.ease_factor, c.reviewed_at
+        FROM computed c;
+
+        GET DIAGNOSTICS v_count = ROW_COUNT;
+        v_applied := v_applied + v_count;
+    END LOOP;
+
+    RETURN v_applied;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,65 @@
+-- Колода карточки дублируется в card_state, чтобы очередь повторения по колоде
+-- выбиралась из одного индекса card_state без соединения с cards.
+-- deck_id поддерживается триггерами: перенос заметки в другую колоду
+-- переносит её карточки, перенос карточки обновляет card_state.
+ALTER TABLE card_state ADD COLUMN IF NOT EXISTS deck_id uuid;
+
+CREATE OR REPLACE FUNCTION trg_card_state_deck_id() RETURNS trigger AS $$
+BEGIN
+    NEW.deck_id := (SELECT deck_id FROM cards WHERE id = NEW.card_id);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION trg_cards_move_state() RETURNS trigger AS $$
+BEGIN
+    UPDATE card_state SET deck_id = NEW.deck_id WHERE card_id = NEW.id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION trg_notes_move_cards() RETURNS trigger AS $$
+BEGIN
+    UPDATE cards SET deck_id = NEW.deck_id WHERE note_id = NEW.id AND deck_id <> NEW.deck_id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- вставки без deck_id (например, add_note_with_card) получают колоду из cards
+DROP TRIGGER IF EXISTS trg_card_state_deck_id ON card_state;
+CREATE TRIGGER trg_card_state_deck_id
+    BEFORE INSERT ON card_state
+    FOR EACH ROW
+    WHEN (NEW.deck_id IS NULL)
+    EXECUTE FUNCTION trg_card_state_deck_id();
+
+DROP TRIGGER IF EXISTS trg_cards_move_state ON cards;
+CREATE TRIGGER trg_cards_move_state
+    AFTER UPDATE OF deck_id ON cards
+    FOR EACH ROW
+    WHEN (OLD.deck_id IS DISTINCT FROM NEW.deck_id)
+    EXECUTE FUNCTION trg_cards_move_state();
+
+DROP TRIGGER IF EXISTS trg_notes_move_cards ON notes;
+CREATE TRIGGER trg_notes_move_cards
+    AFTER UPDATE OF deck_id ON notes
+    FOR EACH ROW
+    WHEN (OLD.deck_id IS DISTINCT FROM NEW.deck_id)
+    EXECUTE FUNCTION trg_notes_move_cards();
+
+-- До этой миграции update_note() переносил заметку без её карточек;
+-- такие карточки переносятся сейчас, счётчики колод обновят их триггеры.
+UPDATE cards c
+SET deck_id = n.deck_id
+FROM notes n
+WHERE n.id = c.note_id AND c.deck_id <> n.deck_id;
+
+-- Заполнение не меняет данных карточек для автономных копий: change_xid не трогается.
+ALTER TABLE card_state DISABLE TRIGGER trg_card_state_change_xid;
+UPDATE card_state cs
+SET deck_id = c.deck_id
+FROM cards c
+WHERE c.id = cs.card_id AND cs.deck_id IS DISTINCT FROM c.deck_id;
+ALTER TABLE card_state ENABLE TRIGGER trg_card_state_change_xid;
+
+ALTER TABLE card_state ALTER COLUMN deck_id SET NOT NULL;
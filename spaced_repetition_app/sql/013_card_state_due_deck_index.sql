@@ -0,0 +1,15 @@
+-- migrate: no-transaction
+-- Частичные индексы очереди повторения по колоде: новые карточки и карточки
+-- на повторение каждой колоды выбираются по сроку только из индекса, без
+-- чтения строк card_state (interval_days нужен планировщику для порядка по
+-- относительной просрочке).
+-- Индексы строятся без блокировки записи; недостроенный после сбоя индекс
+-- удаляется при повторном запуске миграции.
+DROP INDEX CONCURRENTLY IF EXISTS idx_card_state_new_deck;
+CREATE INDEX CONCURRENTLY idx_card_state_new_deck
+    ON card_state (user_id, deck_id, due_at) INCLUDE (card_id)
+    WHERE suspended = false AND last_reviewed_at IS NULL;
+DROP INDEX CONCURRENTLY IF EXISTS idx_card_state_review_deck;
+CREATE INDEX CONCURRENTLY idx_card_state_review_deck
+    ON card_state (user_id, deck_id, due_at) INCLUDE (card_id, interval_days)
+    WHERE suspended = false AND last_reviewed_at IS NOT NULL;
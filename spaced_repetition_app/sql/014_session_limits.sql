@@ -0,0 +1,22 @@
+-- Дневные лимиты колод для планировщика сессий (scheduler.py).
+-- NULL означает лимит по умолчанию из настроек приложения.
+ALTER TABLE decks ADD COLUMN IF NOT EXISTS new_per_day integer CHECK (new_per_day >= 0);
+ALTER TABLE decks ADD COLUMN IF NOT EXISTS reviews_per_day integer CHECK (reviews_per_day >= 0);
+
+-- Время первого повторения: по нему считаются новые карточки, начатые сегодня.
+-- У карточек, повторённых до этой миграции, остаётся NULL: они уже не новые.
+ALTER TABLE card_state ADD COLUMN IF NOT EXISTS first_reviewed_at timestamptz;
+
+CREATE OR REPLACE FUNCTION trg_card_state_first_reviewed() RETURNS trigger AS $$
+BEGIN
+    NEW.first_reviewed_at := NEW.last_reviewed_at;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_card_state_first_reviewed ON card_state;
+CREATE TRIGGER trg_card_state_first_reviewed
+    BEFORE UPDATE ON card_state
+    FOR EACH ROW
+    WHEN (OLD.last_reviewed_at IS NULL AND NEW.last_reviewed_at IS NOT NULL)
+    EXECUTE FUNCTION trg_card_state_first_reviewed();
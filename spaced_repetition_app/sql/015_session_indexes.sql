@@ -0,0 +1,4 @@
+-- migrate: no-transaction
+-- Общий индекс очереди idx_card_state_due_deck заменён частичными индексами
+-- из 013_card_state_due_deck_index.sql; здесь он удаляется там, где был построен.
+DROP INDEX CONCURRENTLY IF EXISTS idx_card_state_due_deck;
@@ -0,0 +1,90 @@
+-- Теги сравниваются без учёта регистра: уникальность и поиск идут по lower(name).
+-- Дубликаты, различающиеся регистром (могли появиться при параллельной
+-- вставке), сливаются в один тег до создания индекса.
+WITH ranked AS (
+    SELECT id, first_value(id) OVER (PARTITION BY lower(name) ORDER BY name, id) AS keep_id
+    FROM tags
+), moved AS (
+    INSERT INTO note_tags(note_id, tag_id)
+    SELECT nt.note_id, r.keep_id
+    FROM note_tags nt
+    JOIN ranked r ON r.id = nt.tag_id
+    WHERE r.id <> r.keep_id
+    ON CONFLICT DO NOTHING
+)
+DELETE FROM tags t
+USING ranked r
+WHERE t.id = r.id AND r.id <> r.keep_id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_tags_lower_name ON tags (lower(name));
+-- уникальность name следует из индекса по lower(name)
+ALTER TABLE tags DROP CONSTRAINT IF EXISTS tags_name_key;
+
+-- Находит или создаёт теги по списку имён одним вызовом и возвращает
+-- идентификатор для каждого переданного имени (пустые имена пропускаются).
+CREATE OR REPLACE FUNCTION ensure_tags(p_names text[]) RETURNS TABLE(tag_name text, tag_id uuid) AS $$
+BEGIN
+    INSERT INTO tags(name)
+    SELECT DISTINCT ON (lower(w.name)) w.name
+    FROM (SELECT trim(x) AS name FROM unnest(p_names) AS x) w
+    WHERE w.name <> ''
+    ORDER BY lower(w.name), w.name
+    ON CONFLICT (lower(name)) DO NOTHING;
+
+    -- отдельный запрос видит и теги, которые параллельная транзакция вставила
+    -- после начала INSERT (в READ COMMITTED у каждого запроса свой снимок)
+    RETURN QUERY
+    SELECT w.name, t.id
+    FROM (SELECT DISTINCT trim(x) AS name FROM unnest(p_names) AS x) w
+    JOIN tags t ON lower(t.name) = lower(w.name);
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION ensure_tag(p_name text) RETURNS uuid AS $$
+    SELECT tag_id FROM ensure_tags(ARRAY[p_name]);
+$$ LANGUAGE sql;
+
+-- Заметка с карточкой и готовыми идентификаторами тегов (models кэширует их).
+CREATE OR REPLACE FUNCTION add_note_with_card_tag_ids(
+    p_user_id uuid,
+    p_deck_id uuid,
+    p_front text,
+    p_back text,
+    p_tag_ids uuid[]
+) RETURNS uuid AS $$
+DECLARE
+    v_note_id uuid;
+    v_card_id uuid;
+BEGIN
+    INSERT INTO notes(user_id, deck_id, front, back)
+    VALUES (p_user_id, p_deck_id, p_front, p_back)
+    RETURNING id INTO v_note_id;
+
+    INSERT INTO cards(user_id, deck_id, note_id)
+    VALUES (p_user_id, p_deck_id, v_note_id)
+    RETURNING id INTO v_card_id;
+
+    INSERT INTO card_state(card_id, user_id, deck_id)
+    VALUES (v_card_id, p_user_id, p_deck_id);
+
+    INSERT INTO note_tags(note_id, tag_id)
+    SELECT DISTINCT v_note_id, t.id
+    FROM unnest(p_tag_ids) AS t(id)
+    ON CONFLICT DO NOTHING;
+
+    RETURN v_card_id;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION add_note_with_card(
+    p_user_id uuid,
+    p_deck_id uuid,
+    p_front text,
+    p_back text,
+    p_tags text[]
+) RETURNS uuid AS $$
+    SELECT add_note_with_card_tag_ids(
+        p_user_id, p_deck_id, p_front, p_back,
+        ARRAY(SELECT tag_id FROM ensure_tags(p_tags))
+    );
+$$ LANGUAGE sql;
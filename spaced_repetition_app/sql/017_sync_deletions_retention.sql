@@ -0,0 +1,34 @@
+-- Срок хранения записей sync_deletions. Записи старше срока удаляет
+-- sync_deletions_prune(); наибольший удалённый change_xid запоминается в
+-- sync_retention. Копия, которая синхронизировалась до этой границы, могла
+-- пропустить удаления и перед выгрузкой очищается (iter_sync_changes).
+CREATE TABLE IF NOT EXISTS sync_retention (
+    id boolean PRIMARY KEY DEFAULT true CHECK (id),
+    pruned_xid xid8 NOT NULL DEFAULT '0'
+);
+
+INSERT INTO sync_retention (id) VALUES (true) ON CONFLICT DO NOTHING;
+
+-- записи добавляются по времени: BRIN по deleted_at почти ничего не весит
+CREATE INDEX IF NOT EXISTS idx_sync_deletions_deleted_at_brin ON sync_deletions USING brin (deleted_at);
+
+CREATE OR REPLACE FUNCTION sync_deletions_prune(keep interval DEFAULT interval '30 days') RETURNS bigint AS $$
+DECLARE
+    last_xid xid8;
+    removed bigint;
+BEGIN
+    WITH gone AS (
+        DELETE FROM sync_deletions
+        WHERE deleted_at < now() - keep
+        RETURNING change_xid
+    )
+    SELECT (SELECT change_xid FROM gone ORDER BY change_xid DESC LIMIT 1), count(*)
+    INTO last_xid, removed
+    FROM gone;
+
+    IF last_xid IS NOT NULL THEN
+        UPDATE sync_retention SET pruned_xid = last_xid WHERE pruned_xid < last_xid;
+    END IF;
+    RETURN removed;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,61 @@
+"""Замеры времени запуска приложения: импорт, первая отрисовка, первый запрос."""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from typing import Dict
+
+# импортируется первым в app.py: время отсчитывается от начала импорта
+_ORIGIN = time.perf_counter()
+
+STARTUP_REPORT = os.getenv("STARTUP_REPORT", "0") != "0"
+
+LABELS = {
+    "imports": "импорт модулей",
+    "window": "окно входа создано",
+    "first_paint": "первая отрисовка",
+    "pool_ready": "соединение с БД",
+    "migrations": "миграции проверены",
+    "first_query": "первый запрос (пользователи)",
+}
+
+startup_log = logging.getLogger("spaced_repetition.startup")
+
+_marks: Dict[str, float] = {}
+_lock = threading.Lock()
+_finished = False
+
+
+def mark(name: str) -> None:
+    """Запоминает время этапа в мс от начала запуска; повторные отметки не учитываются."""
+    elapsed = (time.perf_counter() - _ORIGIN) * 1000
+    with _lock:
+        _marks.setdefault(name, elapsed)
+
+
+def report() -> Dict[str, float]:
+    """Этапы запуска в порядке наступления, мс от начала импорта app."""
+    with _lock:
+        return dict(sorted(_marks.items(), key=lambda item: item[1]))
+
+
+def format_report() -> str:
+    return ", ".join(f"{LABELS.get(name, name)} {elapsed:.0f} мс" for name, elapsed in report().items())
+
+
+def finish() -> None:
+    """Выводит отчёт в stderr, если задан STARTUP_REPORT=1; только при первом вызове."""
+    global _finished
+    with _lock:
+        if _finished:
+            return
+        _finished = True
+    if not STARTUP_REPORT:
+        return
+    if not startup_log.handlers:
+        startup_log.addHandler(logging.StreamHandler())
+        startup_log.setLevel(logging.INFO)
+        startup_log.propagate = False
+    startup_log.info("запуск: %s", format_report())
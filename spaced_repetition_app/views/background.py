@@ -0,0 +1,213 @@
+"""Фоновое выполнение запросов к БД для окон Tk с доставкой результата в поток Tk."""
+from __future__ import annotations
+
+import os
+import queue
+import threading
+import tkinter as tk
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Optional, Set, Tuple
+
+UI_WORKERS = int(os.getenv("UI_WORKERS", "4"))
+POLL_INTERVAL_MS = 30
+
+_runner: "BackgroundRunner | None" = None
+_runner_lock = threading.Lock()
+
+
+class LoadingIndicator:
+    """Показывает «Загрузка...» и курсор ожидания, пока у окна есть незавершённые задачи."""
+
+    def __init__(self, widget: tk.Misc, var: tk.StringVar | None = None, text: str = "Загрузка..."):
+        self.widget = widget
+        self.var = var
+        self.text = text
+        self._count = 0
+
+    @property
+    def active(self) -> bool:
+        return self._count > 0
+
+    def start(self) -> None:
+        self._count += 1
+        if self._count == 1:
+            self._show(True)
+
+    def stop(self) -> None:
+        self._count = max(self._count - 1, 0)
+        if self._count == 0:
+            self._show(False)
+
+    def _show(self, busy: bool) -> None:
+        try:
+            if self.var is not None:
+                self.var.set(self.text if busy else "")
+            self.widget.configure(cursor="watch" if busy else "")
+        except tk.TclError:
+            # окно уже закрыто
+            pass
+
+
+class Task:
+    """Задача в фоне; результат окну не доставляется, если задача отменена."""
+
+    def __init__(self, owner: tk.Misc, key: Optional[Hashable], indicator: Optional[LoadingIndicator]):
+        self.owner = owner
+        self.key = key
+        self.indicator = indicator
+        self.future: Optional["Future[Any]"] = None
+        self._cancelled = False
+        self._finished = False
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    def cancel(self) -> None:
+        """Отменяет задачу: не начатая не выполнится, начатая завершится без колбэков."""
+        if self._cancelled or self._finished:
+            return
+        self._cancelled = True
+        if self.future is not None:
+            self.future.cancel()
+        self._finish()
+
+    def _finish(self) -> None:
+        if self._finished:
+            return
+        self._finished = True
+        if self.indicator is not None:
+            self.indicator.stop()
+
+
+class BackgroundRunner:
+    """Общий пул потоков для обращений окон к БД.
+
+    submit() вызывается из потока Tk и сразу возвращает Task. Функция
+    выполняется в пуле, а on_done / on_error вызываются в потоке Tk: готовые
+    результаты забирает опрос через after() главного окна. Новая задача с тем
+    же владельцем и ключом отменяет предыдущую (например, повторное нажатие
+    «Обновить» или смена фильтра), поэтому окно получает только последний
+    результат. Колбэки закрытых окон не вызываются.
+
+    Отменяются только задачи с ключом (чтение). Задачи без ключа (изменения
+    данных) выполняются всегда, в том числе после закрытия окна и при выходе.
+    """
+
+    def __init__(self, max_workers: int = UI_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ui-db")
+        self._results: "queue.Queue[Tuple[Task, Callable[[], None]]]" = queue.Queue()
+        self._by_key: Dict[Tuple[str, Hashable], Task] = {}
+        self._pending: Set[Task] = set()
+        self._root: Optional[tk.Misc] = None
+        self._poll_id: Optional[str] = None
+
+    def submit(
+        self,
+        owner: tk.Misc,
+        fn: Callable[..., Any],
+        *args: Any,
+        on_done: Optional[Callable[[Any], None]] = None,
+        on_error: Optional[Callable[[Exception], None]] = None,
+        key: Optional[Hashable] = None,
+        indicator: Optional[LoadingIndicator] = None,
+        **kwargs: Any,
+    ) -> Task:
+        task = Task(owner, key, indicator)
+        if key is not None:
+            previous = self._by_key.get((str(owner), key))
+            if previous is not None:
+                previous.cancel()
+                self._forget(previous)
+            self._by_key[(str(owner), key)] = task
+        self._pending.add(task)
+        if indicator is not None:
+            indicator.start()
+
+        def run() -> None:
+            if task.cancelled:
+                return
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as exc:
+                if on_error is not None:
+                    self._results.put((task, lambda: on_error(exc)))
+                else:
+                    self._results.put((task, lambda: None))
+                return
+            self._results.put((task, (lambda: on_done(result)) if on_done is not None else (lambda: None)))
+
+        task.future = self._executor.submit(run)
+        self._ensure_polling(owner)
+        return task
+
+    def cancel_owner(self, owner: tk.Misc) -> None:
+        """Отменяет задачи чтения окна (вызывается при его закрытии)."""
+        for task in [task for task in self._pending if task.owner is owner and task.key is not None]:
+            task.cancel()
+            self._forget(task)
+
+    def shutdown(self) -> None:
+        """Отменяет чтение и дожидается уже поставленных изменений."""
+        for task in list(self._pending):
+            if task.key is not None:
+                task.cancel()
+        self._pending.clear()
+        self._by_key.clear()
+        self._executor.shutdown(wait=True)
+
+    def _ensure_polling(self, owner: tk.Misc) -> None:
+        if self._poll_id is not None:
+            return
+        self._root = owner.nametowidget(".")
+        self._poll_id = self._root.after(POLL_INTERVAL_MS, self._poll)
+
+    def _poll(self) -> None:
+        self._poll_id = None
+        while True:
+            try:
+                task, callback = self._results.get_nowait()
+            except queue.Empty:
+                break
+            self._forget(task)
+            if task.cancelled:
+                continue
+            task._finish()
+            if not _exists(task.owner):
+                continue
+            callback()
+        # колбэк мог поставить новую задачу и уже запустить опрос
+        if self._pending and self._poll_id is None and self._root is not None:
+            try:
+                self._poll_id = self._root.after(POLL_INTERVAL_MS, self._poll)
+            except tk.TclError:
+                self._poll_id = None
+
+    def _forget(self, task: Task) -> None:
+        self._pending.discard(task)
+        if task.key is not None and self._by_key.get((str(task.owner), task.key)) is task:
+            del self._by_key[(str(task.owner), task.key)]
+
+
+def _exists(widget: tk.Misc) -> bool:
+    try:
+        return bool(widget.winfo_exists())
+    except tk.TclError:
+        return False
+
+
+def get_runner() -> BackgroundRunner:
+    """Возвращает общий пул процесса, создавая его при первом обращении."""
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = BackgroundRunner()
+        return _runner
+
+
+def shutdown_runner() -> None:
+    global _runner
+    with _runner_lock:
+        if _runner is not None:
+            _runner.shutdown()
+            _runner = None
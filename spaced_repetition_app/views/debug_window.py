@@ -0,0 +1,157 @@
+"""Окно отладки: время запросов слоя данных, пул, кэш и подготовленные запросы."""
+from __future__ import annotations
+
+import tkinter as tk
+from tkinter import filedialog, messagebox, ttk
+from pathlib import Path
+from typing import Any, Dict
+
+import instrumentation
+import models
+import prepared
+import startup
+from db import pool_stats
+
+REFRESH_MS = 2000
+
+
+def runtime_stats() -> Dict[str, Any]:
+    """Показатели пула, кэша и подготовленных запросов для выгрузки вместе со сводкой."""
+    return {
+        "pool": pool_stats(),
+        "cache": models.cache_stats(),
+        "prepared": prepared.registry.stats(),
+        "startup_ms": startup.report(),
+    }
+
+
+class DebugWindow(tk.Toplevel):
+    def __init__(self, parent: "MainWindow"):
+        super().__init__(parent)
+        self.parent_view = parent
+        self.title("Отладка: запросы к БД")
+        self.geometry("900x480")
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.configure(bg="#eef1f7")
+
+        container = ttk.Frame(self, style="App.TFrame", padding=20)
+        container.pack(fill="both", expand=True)
+
+        ttk.Label(container, text="Запросы к БД", style="Title.TLabel").pack(anchor="w", pady=(0, 4))
+        ttk.Label(
+            container,
+            text=f"Медленные запросы (от {instrumentation.SLOW_QUERY_MS:.0f} мс): {instrumentation.SLOW_QUERY_LOG}",
+            style="Subtitle.TLabel",
+        ).pack(anchor="w", pady=(0, 12))
+
+        tree_frame = ttk.Frame(container, style="Card.TFrame", padding=10)
+        tree_frame.pack(fill="both", expand=True)
+
+        columns = {
+            "calls": ("Вызовы", 60),
+            "errors": ("Ошибки", 60),
+            "avg": ("Сред., мс", 75),
+            "p95": ("p95, мс", 70),
+            "max": ("Макс., мс", 75),
+            "acquire": ("Пул, мс", 70),
+            "execute": ("Запрос, мс", 80),
+            "fetch": ("Чтение, мс", 80),
+            "rows": ("Строк", 70),
+        }
+        self.tree = ttk.Treeview(
+            tree_frame, columns=("name", *columns), show="headings", style="Dashboard.Treeview"
+        )
+        self.tree.heading("name", text="Функция")
+        self.tree.column("name", width=220)
+        for key, (title, width) in columns.items():
+            self.tree.heading(key, text=title)
+            self.tree.column(key, width=width, anchor="e")
+        self.tree.pack(fill="both", expand=True, side=tk.LEFT)
+
+        scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill="y")
+
+        self.summary_var = tk.StringVar()
+        ttk.Label(container, textvariable=self.summary_var, style="Subtitle.TLabel", wraplength=840).pack(
+            anchor="w", pady=(10, 0)
+        )
+
+        button_frame = ttk.Frame(container, style="Toolbar.TFrame")
+        button_frame.pack(fill="x", pady=(12, 0))
+
+        ttk.Button(button_frame, text="Обновить", command=self.refresh, style="Secondary.TButton").pack(
+            side=tk.LEFT, padx=5
+        )
+        ttk.Button(button_frame, text="Сбросить", command=self.reset, style="Secondary.TButton").pack(
+            side=tk.LEFT, padx=5
+        )
+        ttk.Button(button_frame, text="Сохранить в файл", command=self.save, style="Accent.TButton").pack(
+            side=tk.RIGHT, padx=5
+        )
+
+        self._after_id: str | None = None
+        self.refresh()
+
+    def refresh(self) -> None:
+        if self._after_id is not None:
+            self.after_cancel(self._after_id)
+        data = instrumentation.snapshot()
+        rows = sorted(
+            data.items(), key=lambda item: item[1]["total"]["avg_ms"] * item[1]["calls"], reverse=True
+        )
+        self.tree.delete(*self.tree.get_children())
+        for name, stats in rows:
+            total = stats["total"]
+            self.tree.insert(
+                "",
+                tk.END,
+                values=(
+                    name.removeprefix("models."),
+                    stats["calls"],
+                    stats["errors"],
+                    f"{total['avg_ms']:.1f}",
+                    f"{total['p95_ms']:.1f}",
+                    f"{total['max_ms']:.1f}",
+                    f"{stats['acquire']['avg_ms']:.1f}",
+                    f"{stats['execute']['avg_ms']:.1f}",
+                    f"{stats['fetch']['avg_ms']:.1f}",
+                    stats["rows"],
+                ),
+            )
+
+        runtime = runtime_stats()
+        pool, cache, statements = runtime["pool"], runtime["cache"], runtime["prepared"]
+        self.summary_var.set(
+            f"Пул: занято {pool.get('in_use', 0)} из {pool.get('size', 0)}, "
+            f"ожиданий {pool.get('waits', 0)}, среднее ожидание {pool.get('wait_time_avg', 0.0) * 1000:.1f} мс.  "
+            f"Кэш: {cache['size']} записей, попаданий {cache['hit_rate']:.0%}.  "
+            f"Подготовленные запросы: {statements['prepares']} PREPARE, {statements['executes']} EXECUTE.\n"
+            f"Запуск: {startup.format_report()}."
+        )
+        self._after_id = self.after(REFRESH_MS, self.refresh)
+
+    def reset(self) -> None:
+        instrumentation.reset()
+        self.refresh()
+
+    def save(self) -> None:
+        path = filedialog.asksaveasfilename(
+            parent=self,
+            title="Сохранить статистику",
+            defaultextension=".json",
+            initialfile=instrumentation.STATS_DUMP_PATH.name,
+            initialdir=str(instrumentation.STATS_DUMP_PATH.parent),
+            filetypes=[("JSON", "*.json")],
+        )
+        if not path:
+            return
+        try:
+            instrumentation.dump_stats(Path(path), extra=runtime_stats())
+        except OSError as exc:
+            messagebox.showerror("Ошибка", f"Не удалось сохранить статистику: {exc}", parent=self)
+
+    def on_close(self) -> None:
+        if self._after_id is not None:
+            self.after_cancel(self._after_id)
+        self.destroy()
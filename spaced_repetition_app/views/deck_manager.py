@@ -3,9 +3,10 @@ from __future__ import annotations
 
 import tkinter as tk
 from tkinter import messagebox, simpledialog, ttk
-from typing import Dict
+from typing import Any, Callable, Dict, List
 
 import models
+from views.background import LoadingIndicator, get_runner
 
 
 class DeckManagerWindow(tk.Toplevel):
@@ -18,6 +19,8 @@ class DeckManagerWindow(tk.Toplevel):
         self.resizable(False, False)
         self.protocol("WM_DELETE_WINDOW", self.on_close)
         self.configure(bg="#eef1f7")
+        self.loading_var = tk.StringVar(value="")
+        self.loading = LoadingIndicator(self, self.loading_var)
 
         container = ttk.Frame(self, style="App.TFrame", padding=20)
         container.pack(fill="both", expand=True)
@@ -49,6 +52,7 @@ class DeckManagerWindow(tk.Toplevel):
         ttk.Button(button_frame, text="Удалить", command=self.delete_deck, style="Secondary.TButton").pack(
             side=tk.LEFT, padx=5
         )
+        ttk.Label(button_frame, textvariable=self.loading_var, style="Subtitle.TLabel").pack(side=tk.RIGHT)
 
         # контекстное меню
         self._context_menu = tk.Menu(self, tearoff=0)
@@ -66,11 +70,17 @@ class DeckManagerWindow(tk.Toplevel):
         self.refresh_decks()
 
     def refresh_decks(self) -> None:
-        try:
-            decks = models.list_decks(self.user["id"])
-        except Exception as exc:
-            messagebox.showerror("Ошибка", f"Не удалось загрузить колоды: {exc}")
-            return
+        get_runner().submit(
+            self,
+            models.list_decks,
+            self.user["id"],
+            on_done=self._show_decks,
+            on_error=lambda exc: messagebox.showerror("Ошибка", f"Не удалось загрузить колоды: {exc}", parent=self),
+            key="decks",
+            indicator=self.loading,
+        )
+
+    def _show_decks(self, decks: List[Dict[str, Any]]) -> None:
         self.tree.delete(*self.tree.get_children())
         for deck in decks:
             self.tree.insert("", tk.END, iid=deck["id"], values=(deck["name"], deck["total_cards"]))
@@ -80,13 +90,7 @@ class DeckManagerWindow(tk.Toplevel):
         if not name:
             return
         description = simpledialog.askstring("Описание", "Описание колоды (опционально):", parent=self)
-        try:
-            models.create_deck(self.user["id"], name, description)
-        except Exception as exc:
-            messagebox.showerror("Ошибка", f"Не удалось создать колоду: {exc}")
-            return
-        self.refresh_decks()
-        self.parent_view.refresh_from_child()
+        self._write(models.create_deck, self.user["id"], name, description, error_text="Не удалось создать колоду")
 
     def edit_deck(self) -> None:
         selection = self.tree.selection()
@@ -99,13 +103,7 @@ class DeckManagerWindow(tk.Toplevel):
         if not new_name:
             return
         description = simpledialog.askstring("Описание", "Описание (опционально):", parent=self)
-        try:
-            models.update_deck(deck_id, self.user["id"], new_name, description)
-        except Exception as exc:
-            messagebox.showerror("Ошибка", f"Не удалось обновить колоду: {exc}")
-            return
-        self.refresh_decks()
-        self.parent_view.refresh_from_child()
+        self._write(models.update_deck, deck_id, self.user["id"], new_name, description, error_text="Не удалось обновить колоду")
 
     def delete_deck(self) -> None:
         selection = self.tree.selection()
@@ -117,15 +115,28 @@ class DeckManagerWindow(tk.Toplevel):
             "Удаление", "Удалить выбранную колоду и связанные карточки?",
         ):
             return
-        try:
-            models.delete_deck(deck_id, self.user["id"])
-        except Exception as exc:
-            messagebox.showerror("Ошибка", f"Не удалось удалить колоду: {exc}")
-            return
-        self.refresh_decks()
-        self.parent_view.refresh_from_child()
+        self._write(models.delete_deck, deck_id, self.user["id"], error_text="Не удалось удалить колоду")
+
+    def _write(self, action: Callable[..., Any], *args: Any, error_text: str) -> None:
+        """Выполняет изменение в фоне и после него обновляет списки колод."""
+
+        def on_done(_result: Any) -> None:
+            if self.winfo_exists():
+                self.refresh_decks()
+            self.parent_view.refresh_from_child()
+
+        # владелец — главное окно: изменение доводится до конца и после закрытия менеджера
+        get_runner().submit(
+            self.parent_view,
+            action,
+            *args,
+            on_done=on_done,
+            on_error=lambda exc: messagebox.showerror("Ошибка", f"{error_text}: {exc}"),
+            indicator=self.loading,
+        )
 
     def on_close(self) -> None:
+        get_runner().cancel_owner(self)
         self.destroy()
         self.parent_view._deck_manager = None
 
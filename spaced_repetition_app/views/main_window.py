@@ -4,14 +4,19 @@ from __future__ import annotations
 import tkinter as tk
 from datetime import datetime
 from tkinter import messagebox, ttk
-from typing import Dict, List, Optional
+from typing import TYPE_CHECKING, Dict, List, Optional
 
 import models
+from offline_store import get_store
+from views.background import LoadingIndicator, get_runner
+from views.debug_window import DebugWindow
 from views.deck_manager import DeckManagerWindow
 from views.note_editor import NoteEditorWindow
-from views.progress_view import ProgressWindow
 from views.review_session import ReviewSessionWindow
 
+if TYPE_CHECKING:
+    from views.progress_view import ProgressWindow
+
 
 class MainWindow(ttk.Frame):
     """Основное окно с навигацией и показом метрик."""
@@ -32,13 +37,17 @@ class MainWindow(ttk.Frame):
             "success_30": tk.StringVar(value="0%"),
             "time": tk.StringVar(value=""),
         }
+        self.loading_var = tk.StringVar(value="")
 
         self._deck_manager: Optional[DeckManagerWindow] = None
         self._note_editor: Optional[NoteEditorWindow] = None
         self._progress_window: Optional[ProgressWindow] = None
         self._review_window: Optional[ReviewSessionWindow] = None
+        self._debug_window: Optional[DebugWindow] = None
 
         self._build_ui()
+        self.loading = LoadingIndicator(self, self.loading_var)
+        self.winfo_toplevel().bind("<Control-D>", lambda _e: self.open_debug_window())
         self.refresh_data()
         self._tick_clock()
 
@@ -137,22 +146,44 @@ class MainWindow(ttk.Frame):
 
         status_bar = ttk.Frame(self, style="StatusBar.TFrame", padding=8)
         status_bar.pack(fill="x", side=tk.BOTTOM)
+        ttk.Label(status_bar, textvariable=self.loading_var, style="Status.TLabel").pack(side=tk.LEFT)
         ttk.Label(status_bar, textvariable=self.stats_vars["time"], style="Status.TLabel").pack(
             side=tk.RIGHT
         )
 
     def refresh_data(self) -> None:
-        self._load_decks()
-        self._load_stats()
+        runner = get_runner()
+        runner.submit(
+            self,
+            models.list_decks,
+            self.user["id"],
+            on_done=self._show_decks,
+            on_error=self._on_decks_error,
+            key="decks",
+            indicator=self.loading,
+        )
+        runner.submit(
+            self,
+            models.get_summary_counts,
+            self.user["id"],
+            on_done=self._show_stats,
+            on_error=self._on_stats_error,
+            key="stats",
+            indicator=self.loading,
+        )
 
-    def _load_decks(self) -> None:
-        try:
-            self.decks = models.list_decks(self.user["id"])
-        except Exception as exc:
-            messagebox.showerror("Ошибка", f"Не удалось загрузить колоды: {exc}")
-            self.decks = []
+    def _on_decks_error(self, exc: Exception) -> None:
+        store = get_store()
+        if store is not None and store.ready:
+            # сервер недоступен: показываем локальную копию
+            self._show_decks(store.list_decks())
             return
+        messagebox.showerror("Ошибка", f"Не удалось загрузить колоды: {exc}")
+        self._show_decks([])
 
+    def _show_decks(self, decks: List[Dict[str, str]]) -> None:
+        self.decks = decks
+        previous = self.selected_deck_id
         self.deck_tree.delete(*self.deck_tree.get_children())
         for idx, deck in enumerate(self.decks):
             self.deck_tree.insert(
@@ -163,18 +194,23 @@ class MainWindow(ttk.Frame):
                 tags=(("evenrow") if idx % 2 == 0 else ("oddrow")),
             )
         if self.decks:
-            first_id = self.decks[0]["id"]
-            self.deck_tree.selection_set(first_id)
-            self.selected_deck_id = first_id
+            # выбор пользователя сохраняется между обновлениями
+            deck_ids = {deck["id"] for deck in self.decks}
+            selected = previous if previous in deck_ids else self.decks[0]["id"]
+            self.deck_tree.selection_set(selected)
+            self.selected_deck_id = selected
         else:
             self.selected_deck_id = None
 
-    def _load_stats(self) -> None:
-        try:
-            stats = models.get_summary_counts(self.user["id"])
-        except Exception as exc:
-            messagebox.showerror("Ошибка", f"Не удалось загрузить статистику: {exc}")
-            stats = {"reviewed_today": 0, "due_now": 0, "learned": 0, "success_7": 0, "success_30": 0}
+    def _on_stats_error(self, exc: Exception) -> None:
+        store = get_store()
+        if store is not None and store.ready:
+            self._show_stats(store.summary_counts())
+            return
+        messagebox.showerror("Ошибка", f"Не удалось загрузить статистику: {exc}")
+        self._show_stats({"reviewed_today": 0, "due_now": 0, "learned": 0, "success_7": 0, "success_30": 0})
+
+    def _show_stats(self, stats: Dict[str, float]) -> None:
         self.stats_vars["reviewed_today"].set(str(stats.get("reviewed_today", 0)))
         self.stats_vars["due_now"].set(str(stats.get("due_now", 0)))
         self.stats_vars["learned"].set(str(stats.get("learned", 0)))
@@ -198,6 +234,9 @@ class MainWindow(ttk.Frame):
 
     def open_note_editor(self) -> None:
         if not self.decks:
+            if self.loading.active:
+                messagebox.showinfo("Загрузка", "Список колод ещё загружается")
+                return
             messagebox.showinfo("Нет колод", "Создайте колоду, прежде чем добавлять карточки")
             return
         if self._note_editor and self._note_editor.winfo_exists():
@@ -215,8 +254,21 @@ class MainWindow(ttk.Frame):
         if self._progress_window and self._progress_window.winfo_exists():
             self._progress_window.focus()
             return
+        # matplotlib загружается только при первом открытии графиков
+        self.loading.start()
+        self.update_idletasks()
+        try:
+            from views.progress_view import ProgressWindow
+        finally:
+            self.loading.stop()
         self._progress_window = ProgressWindow(self, self.user)
 
+    def open_debug_window(self) -> None:
+        if self._debug_window and self._debug_window.winfo_exists():
+            self._debug_window.focus()
+            return
+        self._debug_window = DebugWindow(self)
+
     def refresh_from_child(self) -> None:
         """Обновляет данные после изменений из дочерних окон."""
         self.refresh_data()
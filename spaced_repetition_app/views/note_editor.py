@@ -3,9 +3,17 @@ from __future__ import annotations
 
 import tkinter as tk
 from tkinter import messagebox, ttk
-from typing import Any, Callable, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import psycopg2
 
 import models
+from db import PoolTimeoutError
+from offline_store import get_store
+from views.background import LoadingIndicator, get_runner
+from views.virtual_tree import VirtualTreeview
+
+PAGE_SIZE = 100
 
 
 class NoteEditorWindow(tk.Toplevel):
@@ -21,7 +29,8 @@ class NoteEditorWindow(tk.Toplevel):
         self.user = user
         self.decks = decks
         self.deck_map = {deck["name"]: deck["id"] for deck in decks}
-        self.notes: List[Dict[str, Any]] = []
+        self._filters: Dict[str, Any] = {}
+        self._cursor: Optional[Tuple[Any, ...]] = None
 
         self.title("Карточки")
         self.geometry("800x500")
@@ -43,6 +52,9 @@ class NoteEditorWindow(tk.Toplevel):
 
         self._build_filters()
         self._build_table()
+        self.loading_var = tk.StringVar(value="")
+        self.loading = LoadingIndicator(self, self.loading_var)
+        ttk.Label(self.container, textvariable=self.loading_var, style="Subtitle.TLabel").pack(anchor="w", pady=(6, 0))
 
         # контекстное меню и бинды
         self._context_menu = tk.Menu(self, tearoff=0)
@@ -50,8 +62,8 @@ class NoteEditorWindow(tk.Toplevel):
         self._context_menu.add_command(label="Редактировать", command=self.edit_note)
         self._context_menu.add_command(label="Удалить", command=self.delete_note)
 
-        self.tree.bind("<Double-1>", self._on_tree_double_click)
-        self.tree.bind("<Button-3>", self._on_tree_right_click)
+        self.table.tree.bind("<Double-1>", self._on_tree_double_click)
+        self.table.tree.bind("<Button-3>", self._on_tree_right_click)
         self.bind("<Control-n>", lambda _e: self.add_note())
         self.bind("<F2>", lambda _e: self.edit_note())
         self.bind("<Delete>", lambda _e: self.delete_note())
@@ -94,28 +106,27 @@ class NoteEditorWindow(tk.Toplevel):
         tree_frame = ttk.Frame(self.container, style="Card.TFrame", padding=10)
         tree_frame.pack(fill="both", expand=True)
 
-        self.tree = ttk.Treeview(
+        self.table = VirtualTreeview(
             tree_frame,
-            columns=("front", "back", "deck", "tags", "updated"),
-            show="headings",
-            style="Dashboard.Treeview",
+            columns=[
+                ("front", "Front", 200),
+                ("back", "Back", 200),
+                ("deck", "Колода", 120),
+                ("tags", "Теги", 120),
+                ("updated", "Обновлено", None),
+            ],
+            row_id=lambda note: str(note["id"]),
+            row_values=lambda note: (
+                note["front"],
+                note["back"],
+                note.get("deck_name", ""),
+                ", ".join(note.get("tags", [])),
+                note["updated_at"],
+            ),
+            on_need_more=self._load_more,
+            style="Card.TFrame",
         )
-        self.tree.heading("front", text="Front")
-        self.tree.heading("back", text="Back")
-        self.tree.heading("deck", text="Колода")
-        self.tree.heading("tags", text="Теги")
-        self.tree.heading("updated", text="Обновлено")
-        self.tree.column("front", width=200)
-        self.tree.column("back", width=200)
-        self.tree.column("deck", width=120)
-        self.tree.column("tags", width=120)
-        self.tree.pack(fill="both", expand=True, side=tk.LEFT)
-
-        scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=self.tree.yview)
-        self.tree.configure(yscrollcommand=scrollbar.set)
-        scrollbar.pack(side=tk.RIGHT, fill="y")
-
-    
+        self.table.pack(fill="both", expand=True)
 
     def _current_deck_id(self) -> Optional[str]:
         name = self.deck_var.get()
@@ -125,20 +136,34 @@ class NoteEditorWindow(tk.Toplevel):
         deck_id = self._current_deck_id()
         tags = [tag.strip() for tag in self.tags_var.get().split(",") if tag.strip()]
         search = self.search_var.get().strip() or None
-        try:
-            self.notes = models.list_notes(self.user["id"], deck_id=deck_id, tags=tags or None, search=search)
-        except Exception as exc:
-            messagebox.showerror("Ошибка", f"Не удалось загрузить карточки: {exc}")
-            return
-        self.tree.delete(*self.tree.get_children())
-        for note in self.notes:
-            tags_str = ", ".join(note.get("tags", []))
-            self.tree.insert(
-                "",
-                tk.END,
-                iid=note["id"],
-                values=(note["front"], note["back"], note.get("deck_name", ""), tags_str, note["updated_at"]),
-            )
+        self._filters = {"deck_id": deck_id, "tags": tags or None, "search": search}
+        self._cursor = None
+        self.table.reset()
+        self.table.loading = True
+        self._load_more()
+
+    def _load_more(self) -> None:
+        # новая выборка (смена фильтра) отменяет ещё не пришедшую страницу старой
+        get_runner().submit(
+            self,
+            models.list_notes_page,
+            self.user["id"],
+            after=self._cursor,
+            limit=PAGE_SIZE,
+            **self._filters,
+            on_done=self._on_page_loaded,
+            on_error=self._on_page_error,
+            key="notes",
+            indicator=self.loading,
+        )
+
+    def _on_page_loaded(self, page: Tuple[List[Dict[str, Any]], Optional[Tuple[Any, ...]]]) -> None:
+        notes, self._cursor = page
+        self.table.append_rows(notes, has_more=self._cursor is not None)
+
+    def _on_page_error(self, exc: Exception) -> None:
+        self.table.loading = False
+        messagebox.showerror("Ошибка", f"Не удалось загрузить карточки: {exc}", parent=self)
 
     def add_note(self) -> None:
         NoteForm(self, self.user, self.decks, on_saved=self._on_note_saved)
@@ -148,13 +173,20 @@ class NoteEditorWindow(tk.Toplevel):
         if not note_id:
             messagebox.showinfo("Редактирование", "Выберите карточку для редактирования")
             return
-        try:
-            note = models.get_note_details(note_id, self.user["id"])
-        except Exception as exc:
-            messagebox.showerror("Ошибка", f"Не удалось загрузить карточку: {exc}")
-            return
+        get_runner().submit(
+            self,
+            models.get_note_details,
+            note_id,
+            self.user["id"],
+            on_done=self._open_note_form,
+            on_error=lambda exc: messagebox.showerror("Ошибка", f"Не удалось загрузить карточку: {exc}", parent=self),
+            key="details",
+            indicator=self.loading,
+        )
+
+    def _open_note_form(self, note: Optional[Dict[str, Any]]) -> None:
         if not note:
-            messagebox.showerror("Ошибка", "Карточка не найдена")
+            messagebox.showerror("Ошибка", "Карточка не найдена", parent=self)
             return
         NoteForm(self, self.user, self.decks, note=note, on_saved=self._on_note_saved)
 
@@ -165,39 +197,40 @@ class NoteEditorWindow(tk.Toplevel):
             return
         if not messagebox.askyesno("Удаление", "Удалить выбранную карточку?"):
             return
-        try:
-            models.delete_note(note_id, self.user["id"])
-        except Exception as exc:
-            messagebox.showerror("Ошибка", f"Не удалось удалить карточку: {exc}")
-            return
-        self.refresh_notes()
-        self.parent_view.refresh_from_child()
+        get_runner().submit(
+            self.parent_view,
+            models.delete_note,
+            note_id,
+            self.user["id"],
+            on_done=lambda _result: self._on_note_saved(),
+            on_error=lambda exc: messagebox.showerror("Ошибка", f"Не удалось удалить карточку: {exc}"),
+            indicator=self.loading,
+        )
 
     def _selected_note_id(self) -> Optional[str]:
-        selection = self.tree.selection()
-        if selection:
-            return selection[0]
-        return None
+        return self.table.selected_id()
 
     def _on_note_saved(self) -> None:
-        self.refresh_notes()
+        if self.winfo_exists():
+            self.refresh_notes()
         self.parent_view.refresh_from_child()
 
     def on_close(self) -> None:
+        get_runner().cancel_owner(self)
         self.destroy()
         self.parent_view._note_editor = None
 
     def _on_tree_double_click(self, event: tk.Event) -> None:
-        item = self.tree.identify_row(event.y)
+        item = self.table.identify_row(event.y)
         if not item:
             return
-        self.tree.selection_set(item)
+        self.table.select(item)
         self.edit_note()
 
     def _on_tree_right_click(self, event: tk.Event) -> None:
-        item = self.tree.identify_row(event.y)
+        item = self.table.identify_row(event.y)
         if item:
-            self.tree.selection_set(item)
+            self.table.select(item)
         try:
             self._context_menu.tk_popup(event.x_root, event.y_root)
         finally:
@@ -286,9 +319,8 @@ class NoteForm(tk.Toplevel):
 
         button_frame = ttk.Frame(frame, style="Toolbar.TFrame")
         button_frame.grid(row=4, column=1, sticky="e", padx=5, pady=15)
-        ttk.Button(button_frame, text="Сохранить", command=self.save, style="Accent.TButton").pack(
-            side=tk.LEFT, padx=5
-        )
+        self.save_button = ttk.Button(button_frame, text="Сохранить", command=self.save, style="Accent.TButton")
+        self.save_button.pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="Отмена", command=self.cancel, style="Secondary.TButton").pack(
             side=tk.LEFT, padx=5
         )
@@ -307,21 +339,38 @@ class NoteForm(tk.Toplevel):
             messagebox.showerror("Ошибка", "Заполните поля front и back")
             return
         tags = [t.strip() for t in self.tags_var.get().split(",") if t.strip()]
-        try:
-            if self.note:
-                models.update_note(
-                    self.note["id"],
-                    self.user["id"],
-                    deck_id,
-                    front,
-                    back,
-                    tags,
-                )
-            else:
-                models.create_note(self.user["id"], deck_id, front, back, tags)
-        except Exception as exc:
-            messagebox.showerror("Ошибка", f"Не удалось сохранить карточку: {exc}")
+        if self.note:
+            action, args = models.update_note, (self.note["id"], self.user["id"], deck_id, front, back, tags)
+        else:
+            action, args = models.create_note, (self.user["id"], deck_id, front, back, tags)
+        self.save_button.state(["disabled"])
+        get_runner().submit(
+            self,
+            action,
+            *args,
+            on_done=lambda _result: self._on_saved(),
+            on_error=lambda exc: self._on_save_error(exc, front, back),
+            key="save",
+            indicator=LoadingIndicator(self),
+        )
+
+    def _on_save_error(self, exc: Exception, front: str, back: str) -> None:
+        store = get_store()
+        offline = isinstance(exc, (psycopg2.OperationalError, PoolTimeoutError))
+        if not (offline and self.note and store is not None and store.ready):
+            self.save_button.state(["!disabled"])
+            messagebox.showerror("Ошибка", f"Не удалось сохранить карточку: {exc}", parent=self)
             return
+        store.update_note(str(self.note["id"]), front, back)
+        messagebox.showinfo(
+            "Автономный режим",
+            "Нет связи с сервером: текст карточки сохранён локально и будет отправлен "
+            "при синхронизации. Колода и теги не изменены.",
+            parent=self,
+        )
+        self._on_saved()
+
+    def _on_saved(self) -> None:
         if self.on_saved:
             self.on_saved()
         self.destroy()
@@ -2,13 +2,17 @@
 from __future__ import annotations
 
 import tkinter as tk
-from tkinter import ttk
-from typing import Dict
+from tkinter import messagebox, ttk
+from typing import Any, Dict, List, Tuple
 
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from matplotlib.figure import Figure
 
+import forecast
 import models
+from views.background import LoadingIndicator, get_runner
+
+FORECAST_DAYS = 30
 
 
 class ProgressWindow(tk.Toplevel):
@@ -17,7 +21,7 @@ class ProgressWindow(tk.Toplevel):
         self.parent_view = parent
         self.user = user
         self.title("Прогресс")
-        self.geometry("720x600")
+        self.geometry("720x800")
         self.protocol("WM_DELETE_WINDOW", self.on_close)
         self.configure(bg="#eef1f7")
 
@@ -26,10 +30,15 @@ class ProgressWindow(tk.Toplevel):
 
         ttk.Label(container, text="Графики прогресса", style="Title.TLabel").pack(anchor="w", pady=(0, 10))
 
-        self.figure = Figure(figsize=(7, 6), dpi=100)
+        self.new_cards_var = tk.IntVar(value=0)
+        self.loading_var = tk.StringVar(value="")
+        self.loading = LoadingIndicator(self, self.loading_var)
+
+        self.figure = Figure(figsize=(7, 8), dpi=100)
         self.figure.patch.set_facecolor("#eef1f7")
-        self.ax_daily = self.figure.add_subplot(211)
-        self.ax_decks = self.figure.add_subplot(212)
+        self.ax_daily = self.figure.add_subplot(311)
+        self.ax_decks = self.figure.add_subplot(312)
+        self.ax_forecast = self.figure.add_subplot(313)
 
         self.canvas = FigureCanvasTkAgg(self.figure, master=container)
         self.canvas_widget = self.canvas.get_tk_widget()
@@ -37,22 +46,57 @@ class ProgressWindow(tk.Toplevel):
 
         control_frame = ttk.Frame(container, style="Toolbar.TFrame")
         control_frame.pack(fill="x", pady=(10, 0))
+        ttk.Label(control_frame, text="Добавить новых карточек в прогноз:", style="Subtitle.TLabel").pack(
+            side=tk.LEFT
+        )
+        ttk.Spinbox(
+            control_frame,
+            from_=0,
+            to=100000,
+            increment=100,
+            width=8,
+            textvariable=self.new_cards_var,
+        ).pack(side=tk.LEFT, padx=6)
         ttk.Button(control_frame, text="Обновить", command=self.refresh_charts, style="Secondary.TButton").pack(
             side=tk.RIGHT
         )
+        ttk.Label(control_frame, textvariable=self.loading_var, style="Subtitle.TLabel").pack(side=tk.RIGHT, padx=10)
 
         self.refresh_charts()
 
     def refresh_charts(self) -> None:
-        daily_stats = models.get_daily_stats(self.user["id"], days=30)
-        deck_stats = models.get_deck_progress(self.user["id"])
+        try:
+            new_cards = max(int(self.new_cards_var.get()), 0)
+        except (tk.TclError, ValueError):
+            new_cards = 0
+        get_runner().submit(
+            self,
+            self._load_data,
+            self.user["id"],
+            new_cards,
+            on_done=self._draw,
+            on_error=lambda exc: messagebox.showerror("Ошибка", f"Не удалось загрузить прогресс: {exc}", parent=self),
+            key="charts",
+            indicator=self.loading,
+        )
+
+    @staticmethod
+    def _load_data(user_id: str, new_cards: int) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], Any]:
+        """Запросы и прогноз выполняются в фоне, рисование остаётся в потоке Tk."""
+        daily_stats = models.get_daily_stats(user_id, days=30)
+        deck_stats = models.get_deck_progress(user_id)
+        workload = forecast.forecast_reviews(user_id, days=FORECAST_DAYS, new_cards=new_cards, seed=0)
+        return daily_stats, deck_stats, workload
+
+    def _draw(self, data: Tuple[List[Dict[str, Any]], List[Dict[str, Any]], Any]) -> None:
+        daily_stats, deck_stats, workload = data
 
         self.ax_daily.clear()
         self.ax_decks.clear()
+        self.ax_forecast.clear()
 
-        self.ax_daily.set_facecolor("#f7f9fc")
-        self.ax_decks.set_facecolor("#f7f9fc")
-        for ax in (self.ax_daily, self.ax_decks):
+        for ax in (self.ax_daily, self.ax_decks, self.ax_forecast):
+            ax.set_facecolor("#f7f9fc")
             ax.spines["top"].set_visible(False)
             ax.spines["right"].set_visible(False)
 
@@ -112,9 +156,25 @@ class ProgressWindow(tk.Toplevel):
             self.ax_decks.text(0.5, 0.5, "Нет данных по колодам", ha="center", va="center")
             self.ax_decks.set_axis_off()
 
+        if workload.reviews.any():
+            days = [day.strftime("%d.%m") for day in workload.days]
+            new = workload.new_cards.tolist()
+            repeated = (workload.reviews - workload.new_cards).tolist()
+            self.ax_forecast.bar(days, repeated, color="#76b7b2", label="Повторения")
+            self.ax_forecast.bar(days, new, bottom=repeated, color="#f28e2b", label="Новые")
+            self.ax_forecast.set_ylabel("Ревью")
+            self.ax_forecast.tick_params(axis="x", rotation=45)
+            self.ax_forecast.grid(axis="y", linestyle="--", alpha=0.3)
+            self.ax_forecast.legend(frameon=False, loc="upper right")
+            self.ax_forecast.set_title(f"Прогноз нагрузки на {FORECAST_DAYS} дней")
+        else:
+            self.ax_forecast.text(0.5, 0.5, "Нет карточек для прогноза", ha="center", va="center")
+            self.ax_forecast.set_axis_off()
+
         self.figure.tight_layout()
         self.canvas.draw()
 
     def on_close(self) -> None:
+        get_runner().cancel_owner(self)
         self.destroy()
         self.parent_view._progress_window = None
@@ -3,9 +3,13 @@ from __future__ import annotations
 
 import tkinter as tk
 from tkinter import messagebox, ttk
-from typing import Dict, List, Optional
+from typing import Dict, Optional
 
-import models
+from offline_store import get_store
+from review_journal import get_journal
+from review_queue import ReviewQueue
+
+POLL_INTERVAL_MS = 50
 
 
 class ReviewSessionWindow(tk.Toplevel):
@@ -14,7 +18,14 @@ class ReviewSessionWindow(tk.Toplevel):
         self.parent_view = parent
         self.user = user
         self.deck_id = deck_id
-        self.queue: List[Dict[str, str]] = []
+        store = get_store()
+        self.queue = ReviewQueue(
+            user["id"],
+            deck_id=deck_id,
+            journal=get_journal(),
+            # до первой полной загрузки копии сессия работает с сервером
+            store=store if store is not None and store.ready else None,
+        )
         self.current_card: Optional[Dict[str, str]] = None
         self.answer_visible = False
 
@@ -26,8 +37,9 @@ class ReviewSessionWindow(tk.Toplevel):
         self.status_var = tk.StringVar(value="")
 
         self._build_ui()
-        self._load_queue()
-        self._next_card()
+        self.front_label.config(text="Загрузка карточек...")
+        self.queue.start()
+        self._poll_id = self.after(POLL_INTERVAL_MS, self._poll_queue)
 
     def _build_ui(self) -> None:
         container = ttk.Frame(self, style="App.TFrame", padding=20)
@@ -85,25 +97,34 @@ class ReviewSessionWindow(tk.Toplevel):
                 return deck["name"]
         return ""
 
-    def _load_queue(self) -> None:
-        try:
-            self.queue = models.get_due_queue(self.user["id"], deck_id=self.deck_id)
-        except Exception as exc:
-            messagebox.showerror("Ошибка", f"Не удалось загрузить очередь: {exc}")
-            self.queue = []
-        self.status_var.set(f"В очереди: {len(self.queue)}")
+    def _poll_queue(self) -> None:
+        for kind, payload in self.queue.poll():
+            if kind in ("fetch_error", "write_error"):
+                messagebox.showerror("Ошибка", payload)
+        if self.current_card is None:
+            self._next_card()
+        else:
+            self._update_status()
+        self._poll_id = self.after(POLL_INTERVAL_MS, self._poll_queue)
+
+    def _update_status(self) -> None:
+        remaining = len(self.queue.ready) + (1 if self.current_card else 0)
+        suffix = "+" if not self.queue.exhausted else ""
+        self.status_var.set(f"Осталось: {remaining}{suffix}")
 
     def _next_card(self) -> None:
-        if not self.queue:
-            self.current_card = None
-            self.front_label.config(text="Нет карточек к повторению")
+        self.current_card = self.queue.pop()
+        if not self.current_card:
+            self.front_label.config(
+                text="Загрузка карточек..." if self.queue.loading else "Нет карточек к повторению"
+            )
             self.back_label.config(text="")
+            self._update_status()
             return
-        self.current_card = self.queue.pop(0)
         self.answer_visible = False
         self.front_label.config(text=self.current_card.get("front", ""))
         self.back_label.config(text="")
-        self.status_var.set(f"Осталось: {len(self.queue) + 1}")
+        self._update_status()
 
     def show_answer(self) -> None:
         if not self.current_card:
@@ -117,19 +138,13 @@ class ReviewSessionWindow(tk.Toplevel):
         if not self.answer_visible:
             messagebox.showinfo("Ответ", "Сначала покажите ответ")
             return
-        try:
-            models.record_review(self.user["id"], self.current_card["card_id"], quality)
-        except Exception as exc:
-            messagebox.showerror("Ошибка", f"Не удалось записать результат: {exc}")
-            return
-        self.parent_view.refresh_from_child()
-        self._load_queue()
+        self.queue.record_review(str(self.current_card["card_id"]), quality)
         self._next_card()
 
     def skip_card(self) -> None:
         if not self.current_card:
             return
-        self.queue.append(self.current_card)
+        self.queue.push_back(self.current_card)
         self._next_card()
 
     def suspend_card(self) -> None:
@@ -137,15 +152,26 @@ class ReviewSessionWindow(tk.Toplevel):
             return
         if not messagebox.askyesno("Пауза", "Приостановить показ этой карточки?"):
             return
-        try:
-            models.suspend_card(self.user["id"], self.current_card["card_id"], True)
-        except Exception as exc:
-            messagebox.showerror("Ошибка", f"Не удалось обновить карточку: {exc}")
-            return
-        self.parent_view.refresh_from_child()
-        self._load_queue()
+        self.queue.suspend(str(self.current_card["card_id"]))
         self._next_card()
 
     def on_close(self) -> None:
+        self.after_cancel(self._poll_id)
+        self.queue.close()
         self.destroy()
         self.parent_view._review_window = None
+        self._refresh_parent_when_idle(self.parent_view, self.queue)
+
+    @staticmethod
+    def _refresh_parent_when_idle(parent: "MainWindow", review_queue: ReviewQueue) -> None:
+        """Обновляет главное окно, когда фоновый поток запишет все ответы."""
+        if review_queue.is_alive():
+            parent.after(
+                POLL_INTERVAL_MS * 4,
+                lambda: ReviewSessionWindow._refresh_parent_when_idle(parent, review_queue),
+            )
+            return
+        for kind, payload in review_queue.poll():
+            if kind == "write_error":
+                messagebox.showerror("Ошибка", payload)
+        parent.refresh_from_child()
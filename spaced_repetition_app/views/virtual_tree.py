@@ -0,0 +1,180 @@
+"""Таблица с отрисовкой только видимых строк и подгрузкой страниц."""
+from __future__ import annotations
+
+import tkinter as tk
+from tkinter import ttk
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+
+class VirtualTreeview(ttk.Frame):
+    """Treeview, в котором существуют только элементы видимого окна строк.
+
+    Данные хранятся в списке rows, а в самом Treeview создаётся не больше
+    строк, чем помещается по высоте. Когда пользователь прокручивает таблицу
+    близко к концу загруженных данных, вызывается on_need_more; владелец
+    загружает следующую страницу и передаёт её в append_rows().
+    """
+
+    def __init__(
+        self,
+        master: tk.Misc,
+        columns: Sequence[Tuple[str, str, Optional[int]]],
+        row_id: Callable[[Dict[str, Any]], str],
+        row_values: Callable[[Dict[str, Any]], Tuple[Any, ...]],
+        on_need_more: Callable[[], None],
+        tree_style: str = "Dashboard.Treeview",
+        **kwargs: Any,
+    ):
+        super().__init__(master, **kwargs)
+        self.row_id = row_id
+        self.row_values = row_values
+        self.on_need_more = on_need_more
+
+        self.rows: List[Dict[str, Any]] = []
+        self.has_more = False
+        self.loading = False
+        self.offset = 0
+        self.visible = 10
+        self._selected: Optional[str] = None
+        self._index: Dict[str, int] = {}
+
+        self.tree = ttk.Treeview(
+            self,
+            columns=[name for name, _title, _width in columns],
+            show="headings",
+            style=tree_style,
+            height=self.visible,
+        )
+        for name, title, width in columns:
+            self.tree.heading(name, text=title)
+            if width:
+                self.tree.column(name, width=width)
+        self.tree.pack(fill="both", expand=True, side=tk.LEFT)
+        self.tree.tag_configure("evenrow", background="#ffffff")
+        self.tree.tag_configure("oddrow", background="#f7f9fc")
+
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self._on_scrollbar)
+        self.scrollbar.pack(side=tk.RIGHT, fill="y")
+
+        rowheight = ttk.Style(self).lookup(tree_style, "rowheight")
+        self._rowheight = int(rowheight) if rowheight else 20
+
+        self.tree.bind("<Configure>", self._on_configure)
+        self.tree.bind("<<TreeviewSelect>>", self._on_select)
+        self.tree.bind("<MouseWheel>", self._on_mousewheel)
+        self.tree.bind("<Button-4>", lambda _e: self.scroll(-3))
+        self.tree.bind("<Button-5>", lambda _e: self.scroll(3))
+        self.tree.bind("<Down>", lambda _e: self._move_selection(1))
+        self.tree.bind("<Up>", lambda _e: self._move_selection(-1))
+        self.tree.bind("<Next>", lambda _e: self.scroll(self.visible))
+        self.tree.bind("<Prior>", lambda _e: self.scroll(-self.visible))
+
+    def reset(self) -> None:
+        """Очищает данные перед загрузкой первой страницы."""
+        self.rows = []
+        self._index = {}
+        self.has_more = False
+        self.offset = 0
+        self._selected = None
+        self._render()
+
+    def append_rows(self, rows: List[Dict[str, Any]], has_more: bool) -> None:
+        for row in rows:
+            self._index[self.row_id(row)] = len(self.rows)
+            self.rows.append(row)
+        self.has_more = has_more
+        self.loading = False
+        self._render()
+
+    def selected_id(self) -> Optional[str]:
+        return self._selected
+
+    def select(self, item_id: str) -> None:
+        self._selected = item_id
+        if self.tree.exists(item_id):
+            self.tree.selection_set(item_id)
+
+    def identify_row(self, y: int) -> str:
+        return self.tree.identify_row(y)
+
+    def scroll(self, delta: int) -> str:
+        self._set_offset(self.offset + delta)
+        return "break"
+
+    def _set_offset(self, offset: int) -> None:
+        max_offset = max(len(self.rows) - self.visible, 0)
+        offset = min(max(offset, 0), max_offset)
+        if offset != self.offset:
+            self.offset = offset
+            self._render()
+        self._maybe_need_more()
+
+    def _render(self) -> None:
+        self.tree.delete(*self.tree.get_children())
+        window = self.rows[self.offset : self.offset + self.visible]
+        for idx, row in enumerate(window, start=self.offset):
+            self.tree.insert(
+                "",
+                tk.END,
+                iid=self.row_id(row),
+                values=self.row_values(row),
+                tags=("evenrow" if idx % 2 == 0 else "oddrow",),
+            )
+        if self._selected and self.tree.exists(self._selected):
+            self.tree.selection_set(self._selected)
+        self._update_scrollbar()
+        self._maybe_need_more()
+
+    def _update_scrollbar(self) -> None:
+        # пока есть незагруженные страницы, показываем запас в одну высоту окна
+        total = len(self.rows) + (self.visible if self.has_more else 0)
+        if total <= 0:
+            self.scrollbar.set(0.0, 1.0)
+            return
+        first = self.offset / total
+        last = min((self.offset + self.visible) / total, 1.0)
+        self.scrollbar.set(first, last)
+
+    def _maybe_need_more(self) -> None:
+        if self.has_more and not self.loading and self.offset + 2 * self.visible >= len(self.rows):
+            self.loading = True
+            self.on_need_more()
+
+    def _on_scrollbar(self, action: str, value: str, unit: str | None = None) -> None:
+        if action == "moveto":
+            total = len(self.rows) + (self.visible if self.has_more else 0)
+            self._set_offset(int(float(value) * total))
+        elif action == "scroll":
+            step = self.visible if unit == "pages" else 1
+            self._set_offset(self.offset + int(value) * step)
+
+    def _on_mousewheel(self, event: tk.Event) -> str:
+        return self.scroll(-3 if event.delta > 0 else 3)
+
+    def _on_configure(self, event: tk.Event) -> None:
+        # одна строка уходит под заголовки колонок
+        visible = max(event.height // self._rowheight - 1, 1)
+        if visible != self.visible:
+            self.visible = visible
+            self._set_offset(self.offset)
+            self._render()
+
+    def _on_select(self, _event: tk.Event) -> None:
+        selection = self.tree.selection()
+        if selection:
+            self._selected = selection[0]
+
+    def _move_selection(self, step: int) -> str:
+        if not self.rows:
+            return "break"
+        current = self._index.get(self._selected) if self._selected else None
+        index = current + step if current is not None else self.offset
+        index = min(max(index, 0), len(self.rows) - 1)
+        if index < self.offset:
+            self._set_offset(index)
+        elif index >= self.offset + self.visible:
+            self._set_offset(index - self.visible + 1)
+        item_id = self.row_id(self.rows[index])
+        self.select(item_id)
+        self.tree.focus(item_id)
+        return "break"